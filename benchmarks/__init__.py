@@ -0,0 +1 @@
+"""Benchmark harness for bot commands (see benchmarks/run.py)"""
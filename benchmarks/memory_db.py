@@ -0,0 +1,852 @@
+"""In-memory stand-in for the parts of Motor the bot uses
+
+Supports the query operators, update operators, pipeline updates and
+aggregation stages used under utils/, and counts every operation as one
+server round trip (plus one per extra cursor batch) so benchmarks can
+report Mongo traffic without a server.
+"""
+import copy
+import math
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+DEFAULT_BATCH_SIZE = 101
+
+
+class RoundTripCounter:
+    """Counts server round trips by operation name
+
+    Thread-safe, since pymongo command listeners fire on Motor's worker
+    threads when benchmarking against a real server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, operation, n=1):
+        with self._lock:
+            self.counts[operation] = self.counts.get(operation, 0) + n
+
+    @property
+    def total(self):
+        with self._lock:
+            return sum(self.counts.values())
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+# -- Document paths ---------------------------------------------------------
+
+def _resolve(doc, path):
+    """Get every value a dotted path reaches, descending into arrays"""
+    values = [doc]
+    for part in path.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    found.append(value[int(part)])
+                else:
+                    found.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        values = found
+
+    # A query on an array field matches the array itself or any element
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def _set_path(doc, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _get_path(doc, path, default=None):
+    for part in path.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return default
+        doc = doc[part]
+    return doc
+
+
+def _unset_path(doc, path):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+# -- Queries ----------------------------------------------------------------
+
+def _compare(a, b, op):
+    try:
+        return op(a, b)
+    except TypeError:
+        return False
+
+
+_COMPARISONS = {
+    '$lt': lambda a, b: a < b,
+    '$lte': lambda a, b: a <= b,
+    '$gt': lambda a, b: a > b,
+    '$gte': lambda a, b: a >= b,
+}
+
+
+def _is_operator_dict(value):
+    return isinstance(value, dict) and value and all(key.startswith('$') for key in value)
+
+
+def _match_operators(values, conditions):
+    for op, arg in conditions.items():
+        if op == '$eq':
+            ok = any(value == arg for value in values)
+        elif op == '$ne':
+            ok = not any(value == arg for value in values)
+        elif op == '$in':
+            ok = any(value in arg for value in values) or (not values and None in arg)
+        elif op == '$nin':
+            ok = not any(value in arg for value in values)
+        elif op in _COMPARISONS:
+            ok = any(not isinstance(value, list) and _compare(value, arg, _COMPARISONS[op]) for value in values)
+        elif op == '$exists':
+            ok = bool(values) == bool(arg)
+        elif op == '$elemMatch':
+            ok = any(isinstance(value, list) and any(
+                _match(item, arg) if isinstance(item, dict) and not _is_operator_dict(arg)
+                else _match_operators([item], arg)
+                for item in value
+            ) for value in values)
+        else:
+            raise NotImplementedError(f"Query operator {op} is not supported")
+
+        if not ok:
+            return False
+    return True
+
+
+def _match(doc, query):
+    """Check if a document matches a query"""
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(_match(doc, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(_match(doc, sub) for sub in condition):
+                return False
+        elif _is_operator_dict(condition):
+            if not _match_operators(_resolve(doc, key), condition):
+                return False
+        else:
+            values = _resolve(doc, key)
+            if not any(value == condition for value in values) and not (condition is None and not values):
+                return False
+    return True
+
+
+# -- Sorting and projection -------------------------------------------------
+
+def _sort_key(value):
+    # Missing values sort first, like the server
+    return (value is not None, value)
+
+
+def _normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+
+def _sort_docs(docs, spec):
+    docs = list(docs)
+    for field, direction in reversed(spec):
+        docs.sort(key=lambda doc: _sort_key(_get_path(doc, field)), reverse=direction < 0)
+    return docs
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+
+    included = [field for field, flag in projection.items() if flag and field != '_id']
+    if included:
+        result = {}
+        if projection.get('_id', 1):
+            result['_id'] = doc.get('_id')
+        for field in included:
+            value = _get_path(doc, field, _MISSING)
+            if value is not _MISSING:
+                _set_path(result, field, copy.deepcopy(value))
+        return result
+
+    result = copy.deepcopy(doc)
+    for field, flag in projection.items():
+        if not flag:
+            _unset_path(result, field)
+    return result
+
+
+_MISSING = object()
+
+
+# -- Aggregation expressions ------------------------------------------------
+
+def _field_values(value, parts):
+    """Resolve an expression field path, mapping over arrays like the server"""
+    for i, part in enumerate(parts):
+        if isinstance(value, list):
+            return [item for item in (_field_values(element, parts[i:]) for element in value)
+                    if item is not _MISSING]
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _evaluate(expr, doc, variables=None):
+    variables = variables or {}
+
+    if isinstance(expr, str) and expr.startswith('$$'):
+        name, _, rest = expr[2:].partition('.')
+        value = variables.get(name, doc if name == 'ROOT' else None)
+        if rest:
+            value = _field_values(value, rest.split('.'))
+        return None if value is _MISSING else value
+
+    if isinstance(expr, str) and expr.startswith('$'):
+        value = _field_values(doc, expr[1:].split('.'))
+        return None if value is _MISSING else value
+
+    if isinstance(expr, list):
+        return [_evaluate(item, doc, variables) for item in expr]
+
+    if isinstance(expr, dict):
+        if len(expr) == 1:
+            op, arg = next(iter(expr.items()))
+            if op.startswith('$'):
+                return _evaluate_operator(op, arg, doc, variables)
+        return {key: _evaluate(value, doc, variables) for key, value in expr.items()}
+
+    return expr
+
+
+def _evaluate_operator(op, arg, doc, variables):
+    if op == '$literal':
+        return arg
+
+    def args():
+        return [_evaluate(item, doc, variables) for item in (arg if isinstance(arg, list) else [arg])]
+
+    if op == '$add':
+        return sum(args())
+    if op == '$subtract':
+        a, b = args()
+        return a - b
+    if op == '$multiply':
+        return math.prod(args())
+    if op == '$divide':
+        a, b = args()
+        return a / b
+    if op in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte'):
+        a, b = args()
+        if op == '$eq':
+            return a == b
+        if op == '$ne':
+            return a != b
+        return _compare(a, b, _COMPARISONS[op])
+    if op == '$in':
+        a, b = args()
+        return a in (b or [])
+    if op == '$and':
+        return all(args())
+    if op == '$or':
+        return any(args())
+    if op == '$not':
+        return not args()[0]
+    if op == '$ifNull':
+        values = args()
+        return next((value for value in values[:-1] if value is not None), values[-1])
+    if op == '$cond':
+        if isinstance(arg, dict):
+            condition, then, otherwise = arg['if'], arg['then'], arg['else']
+        else:
+            condition, then, otherwise = arg
+        branch = then if _evaluate(condition, doc, variables) else otherwise
+        return _evaluate(branch, doc, variables)
+    if op == '$map':
+        items = _evaluate(arg['input'], doc, variables) or []
+        name = arg.get('as', 'this')
+        return [_evaluate(arg['in'], doc, dict(variables, **{name: item})) for item in items]
+    if op == '$filter':
+        items = _evaluate(arg['input'], doc, variables) or []
+        name = arg.get('as', 'this')
+        return [item for item in items if _evaluate(arg['cond'], doc, dict(variables, **{name: item}))]
+    if op == '$mergeObjects':
+        merged = {}
+        for value in args():
+            merged.update(value or {})
+        return merged
+    if op == '$concatArrays':
+        return [item for value in args() for item in (value or [])]
+    if op == '$size':
+        return len(args()[0] or [])
+    if op == '$sum':
+        values = args()
+        if len(values) == 1 and isinstance(values[0], list):
+            values = values[0]
+        return sum(value for value in values if isinstance(value, (int, float)))
+
+    raise NotImplementedError(f"Expression operator {op} is not supported")
+
+
+# -- Updates ----------------------------------------------------------------
+
+def _apply_update(doc, update, inserting=False):
+    """Apply an update document or pipeline to doc in place"""
+    if isinstance(update, list):
+        for stage in update:
+            for op, fields in stage.items():
+                if op in ('$set', '$addFields'):
+                    values = {field: _evaluate(expr, doc) for field, expr in fields.items()}
+                    for field, value in values.items():
+                        _set_path(doc, field, value)
+                elif op == '$unset':
+                    for field in ([fields] if isinstance(fields, str) else fields):
+                        _unset_path(doc, field)
+                else:
+                    raise NotImplementedError(f"Pipeline update stage {op} is not supported")
+        return
+
+    for op, fields in update.items():
+        if op == '$setOnInsert' and not inserting:
+            continue
+
+        for field, value in fields.items():
+            if op in ('$set', '$setOnInsert'):
+                _set_path(doc, field, copy.deepcopy(value))
+            elif op == '$unset':
+                _unset_path(doc, field)
+            elif op == '$inc':
+                _set_path(doc, field, _get_path(doc, field, 0) + value)
+            elif op == '$push':
+                array = _get_path(doc, field)
+                if array is None:
+                    array = []
+                    _set_path(doc, field, array)
+                items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                array.extend(copy.deepcopy(items))
+            elif op == '$pull':
+                array = _get_path(doc, field) or []
+                _set_path(doc, field, [
+                    item for item in array
+                    if not (_match(item, value) if isinstance(value, dict) and isinstance(item, dict)
+                            else item == value)
+                ])
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported")
+
+
+def _replace(doc, replacement):
+    doc_id = doc['_id']
+    doc.clear()
+    doc.update(copy.deepcopy(replacement), _id=doc_id)
+
+
+def _upsert_seed(query):
+    """Get the equality fields of a query, used as the base of an upserted document"""
+    doc = {}
+    for key, value in query.items():
+        if not key.startswith('$') and not _is_operator_dict(value):
+            _set_path(doc, key, copy.deepcopy(value))
+    return doc
+
+
+# -- Cursors ----------------------------------------------------------------
+
+class MemoryCursor:
+    """Lazy cursor supporting sort/skip/limit/batch_size, async iteration and to_list"""
+
+    def __init__(self, produce, counter, operation):
+        self._produce = produce
+        self._counter = counter
+        self._operation = operation
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._batch_size = DEFAULT_BATCH_SIZE
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        self._batch_size = n or DEFAULT_BATCH_SIZE
+        return self
+
+    def _execute(self):
+        if self._results is None:
+            docs = self._produce(self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = docs
+            batches = max(1, math.ceil(len(docs) / self._batch_size))
+            self._counter.add(self._operation)
+            if batches > 1:
+                self._counter.add('getMore', batches - 1)
+        return self._results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._execute():
+            yield doc
+
+    async def to_list(self, length=None):
+        docs = self._execute()
+        return list(docs if length is None else docs[:length])
+
+
+# -- Collections, databases and clients -------------------------------------
+
+class MemoryCollection:
+    """A collection kept as a dict of documents
+
+    The leading field of every index created with create_indexes gets a
+    hash index, so equality queries on it don't scan the whole collection.
+    Unique indexes are enforced on insert.
+    """
+
+    def __init__(self, name, counter):
+        self.name = name
+        self._counter = counter
+        self._docs = {}
+        self._indexes = {'_id_': {'key': [('_id', 1)], 'v': 2}}
+        self._buckets = {}
+        self._unique = {}
+        self._order = {}
+        self._next_order = 0
+
+    # Index maintenance
+
+    def _bucket_values(self, doc, field):
+        value = doc.get(field, _MISSING)
+        if value is _MISSING:
+            return []
+        values = value if isinstance(value, list) else [value]
+        return [value for value in values if not isinstance(value, (dict, list))]
+
+    def _index_doc(self, doc):
+        for field, bucket in self._buckets.items():
+            for value in self._bucket_values(doc, field):
+                bucket.setdefault(value, {})[id(doc)] = doc
+        for fields, keys in self._unique.items():
+            keys.add(self._unique_key(doc, fields))
+
+    def _unindex_doc(self, doc):
+        for field, bucket in self._buckets.items():
+            for value in self._bucket_values(doc, field):
+                bucket.get(value, {}).pop(id(doc), None)
+        for fields, keys in self._unique.items():
+            keys.discard(self._unique_key(doc, fields))
+
+    @staticmethod
+    def _unique_key(doc, fields):
+        return tuple(repr(_get_path(doc, field)) for field in fields)
+
+    def _matching(self, query):
+        candidates = None
+        for field, bucket in self._buckets.items():
+            condition = (query or {}).get(field)
+            if condition is None or isinstance(condition, (dict, list)):
+                continue
+            docs = bucket.get(condition, {})
+            if candidates is None or len(docs) < len(candidates):
+                candidates = docs
+
+        docs = (candidates if candidates is not None else self._docs).values()
+        matched = [doc for doc in docs if _match(doc, query)]
+        if candidates is not None:
+            # Buckets fill in insertion order per value; keep natural order
+            matched.sort(key=lambda doc: self._order[id(doc)])
+        return matched
+
+    def _insert(self, doc):
+        doc.setdefault('_id', ObjectId())
+        for fields, keys in self._unique.items():
+            if self._unique_key(doc, fields) in keys:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}")
+
+        self._docs[id(doc)] = doc
+        self._order[id(doc)] = self._next_order
+        self._next_order += 1
+        self._index_doc(doc)
+        return doc['_id']
+
+    def _remove(self, doc):
+        self._unindex_doc(doc)
+        del self._docs[id(doc)]
+        del self._order[id(doc)]
+
+    def _modify(self, doc, change):
+        self._unindex_doc(doc)
+        change(doc)
+        self._index_doc(doc)
+
+    # Reads
+
+    def find(self, filter=None, projection=None, session=None, **kwargs):
+        def produce(sort):
+            docs = self._matching(filter)
+            if sort:
+                docs = _sort_docs(docs, sort)
+            return [_project(doc, projection) for doc in docs]
+
+        cursor = MemoryCursor(produce, self._counter, 'find')
+        if kwargs.get('sort'):
+            cursor.sort(kwargs['sort'])
+        return cursor
+
+    async def find_one(self, filter=None, projection=None, sort=None, session=None, **kwargs):
+        self._counter.add('find')
+        docs = self._matching(filter)
+        if sort:
+            docs = _sort_docs(docs, _normalize_sort(sort))
+        return _project(docs[0], projection) if docs else None
+
+    async def count_documents(self, filter, session=None, **kwargs):
+        self._counter.add('count')
+        return len(self._matching(filter))
+
+    async def distinct(self, key, filter=None, session=None, **kwargs):
+        self._counter.add('distinct')
+        values = []
+        for doc in self._matching(filter):
+            for value in _resolve(doc, key):
+                if not isinstance(value, list) and value not in values:
+                    values.append(value)
+        return values
+
+    def aggregate(self, pipeline, session=None, **kwargs):
+        def produce(sort):
+            docs = self._matching(pipeline[0]['$match']) if pipeline and '$match' in pipeline[0] \
+                else list(self._docs.values())
+            docs = [copy.deepcopy(doc) for doc in docs]
+            for stage in pipeline:
+                docs = _run_stage(docs, stage)
+            return docs
+
+        return MemoryCursor(produce, self._counter, 'aggregate')
+
+    # Writes
+
+    async def insert_one(self, document, session=None, **kwargs):
+        self._counter.add('insert')
+        doc = copy.deepcopy(document)
+        inserted_id = self._insert(doc)
+        document.setdefault('_id', inserted_id)
+        return SimpleNamespace(acknowledged=True, inserted_id=inserted_id)
+
+    async def insert_many(self, documents, ordered=True, session=None, **kwargs):
+        self._counter.add('insert')
+        ids = []
+        for document in documents:
+            doc = copy.deepcopy(document)
+            ids.append(self._insert(doc))
+            document.setdefault('_id', doc['_id'])
+        return SimpleNamespace(acknowledged=True, inserted_ids=ids)
+
+    def _update(self, filter, update, upsert, many=False, replace=False):
+        matched = self._matching(filter)
+        if not many:
+            matched = matched[:1]
+
+        for doc in matched:
+            if replace:
+                self._modify(doc, lambda d: _replace(d, update))
+            else:
+                self._modify(doc, lambda d: _apply_update(d, update))
+
+        upserted_id = None
+        if not matched and upsert:
+            doc = _upsert_seed(filter)
+            if replace:
+                doc.update(copy.deepcopy(update))
+            else:
+                _apply_update(doc, update, inserting=True)
+            upserted_id = self._insert(doc)
+
+        return SimpleNamespace(
+            acknowledged=True,
+            matched_count=len(matched),
+            modified_count=len(matched),
+            upserted_id=upserted_id
+        )
+
+    async def update_one(self, filter, update, upsert=False, session=None, **kwargs):
+        self._counter.add('update')
+        return self._update(filter, update, upsert)
+
+    async def update_many(self, filter, update, upsert=False, session=None, **kwargs):
+        self._counter.add('update')
+        return self._update(filter, update, upsert, many=True)
+
+    async def replace_one(self, filter, replacement, upsert=False, session=None, **kwargs):
+        self._counter.add('update')
+        return self._update(filter, replacement, upsert, replace=True)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                                  return_document=False, session=None, **kwargs):
+        self._counter.add('findAndModify')
+        docs = self._matching(filter)
+        if sort:
+            docs = _sort_docs(docs, _normalize_sort(sort))
+
+        if docs:
+            doc = docs[0]
+            before = copy.deepcopy(doc)
+            self._modify(doc, lambda d: _apply_update(d, update))
+            return _project(doc if return_document else before, projection)
+
+        if upsert:
+            doc = _upsert_seed(filter)
+            _apply_update(doc, update, inserting=True)
+            self._insert(doc)
+            return _project(doc, projection) if return_document else None
+
+        return None
+
+    async def delete_one(self, filter, session=None, **kwargs):
+        self._counter.add('delete')
+        docs = self._matching(filter)[:1]
+        for doc in docs:
+            self._remove(doc)
+        return SimpleNamespace(acknowledged=True, deleted_count=len(docs))
+
+    async def delete_many(self, filter, session=None, **kwargs):
+        self._counter.add('delete')
+        docs = self._matching(filter)
+        for doc in docs:
+            self._remove(doc)
+        return SimpleNamespace(acknowledged=True, deleted_count=len(docs))
+
+    async def bulk_write(self, requests, ordered=True, session=None, **kwargs):
+        self._counter.add('bulkWrite')
+        for request in requests:
+            kind = type(request).__name__
+            if kind == 'InsertOne':
+                self._insert(copy.deepcopy(request._doc))
+            elif kind in ('UpdateOne', 'UpdateMany'):
+                self._update(request._filter, request._doc, request._upsert, many=kind == 'UpdateMany')
+            elif kind == 'ReplaceOne':
+                self._update(request._filter, request._doc, request._upsert, replace=True)
+            elif kind in ('DeleteOne', 'DeleteMany'):
+                matched = self._matching(request._filter)
+                for doc in matched if kind == 'DeleteMany' else matched[:1]:
+                    self._remove(doc)
+            else:
+                raise NotImplementedError(f"Bulk operation {kind} is not supported")
+        return SimpleNamespace(acknowledged=True)
+
+    # Indexes
+
+    async def create_indexes(self, indexes, session=None, **kwargs):
+        self._counter.add('createIndexes')
+        names = []
+        for index in indexes:
+            spec = dict(index.document)
+            name = spec.pop('name')
+            keys = list(spec.pop('key').items())
+            self._indexes[name] = dict(spec, key=keys, v=2)
+
+            fields = tuple(field for field, _ in keys)
+            if '.' not in fields[0] and fields[0] not in self._buckets:
+                self._buckets[fields[0]] = {}
+            if spec.get('unique') and fields not in self._unique:
+                self._unique[fields] = set()
+
+            # Rebuild so existing documents are in the new structures
+            for doc in self._docs.values():
+                self._unindex_doc(doc)
+                self._index_doc(doc)
+            names.append(name)
+        return names
+
+    async def index_information(self, session=None, **kwargs):
+        self._counter.add('listIndexes')
+        return copy.deepcopy(self._indexes)
+
+
+def _run_stage(docs, stage):
+    (op, arg), = stage.items()
+
+    if op == '$match':
+        return [doc for doc in docs if _match(doc, arg)]
+    if op == '$sort':
+        return _sort_docs(docs, _normalize_sort(arg))
+    if op == '$limit':
+        return docs[:arg]
+    if op == '$skip':
+        return docs[arg:]
+    if op == '$count':
+        return [{arg: len(docs)}] if docs else []
+    if op in ('$project', '$addFields', '$set'):
+        results = []
+        for doc in docs:
+            if op == '$project' and all(value in (0, False) for value in arg.values()):
+                results.append(_project(doc, arg))
+                continue
+            result = {} if op == '$project' else doc
+            if op == '$project' and arg.get('_id', 1):
+                result['_id'] = doc.get('_id')
+            for field, expr in arg.items():
+                if field == '_id' and expr in (0, 1, True, False):
+                    continue
+                value = _get_path(doc, field) if expr in (1, True) else _evaluate(expr, doc)
+                _set_path(result, field, value)
+            results.append(result)
+        return results
+    if op == '$unwind':
+        path = (arg['path'] if isinstance(arg, dict) else arg)[1:]
+        return [dict(copy.deepcopy(doc), **{path: item}) for doc in docs for item in (_get_path(doc, path) or [])]
+    if op == '$group':
+        return _group(docs, arg)
+
+    raise NotImplementedError(f"Aggregation stage {op} is not supported")
+
+
+def _group(docs, spec):
+    groups = {}
+    order = []
+
+    for doc in docs:
+        group_id = _evaluate(spec['_id'], doc)
+        key = repr(group_id)
+        if key not in groups:
+            groups[key] = {'_id': group_id, '_state': {}}
+            order.append(key)
+        state = groups[key]['_state']
+
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (op, expr), = accumulator.items()
+            value = _evaluate(expr, doc)
+
+            if op == '$sum':
+                state[field] = state.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+            elif op == '$push':
+                state.setdefault(field, []).append(value)
+            elif op == '$addToSet':
+                values = state.setdefault(field, [])
+                if value not in values:
+                    values.append(value)
+            elif op == '$first':
+                state.setdefault(field, value)
+            elif op == '$last':
+                state[field] = value
+            elif op in ('$max', '$min'):
+                current = state.get(field)
+                if current is None or (value is not None and (value > current if op == '$max' else value < current)):
+                    state[field] = value
+            elif op == '$avg':
+                total, count = state.get(field, (0, 0))
+                state[field] = (total + value, count + 1)
+            else:
+                raise NotImplementedError(f"Group accumulator {op} is not supported")
+
+    results = []
+    for key in order:
+        group = groups[key]
+        result = {'_id': group['_id']}
+        for field, value in group['_state'].items():
+            if '$avg' in spec[field]:
+                total, count = value
+                value = total / count if count else None
+            result[field] = value
+        results.append(result)
+    return results
+
+
+class MemorySession:
+    """Session whose transactions just run the callback (no rollback)"""
+
+    def __init__(self, counter):
+        self._counter = counter
+
+    async def with_transaction(self, callback, **kwargs):
+        result = await callback(self)
+        self._counter.add('commitTransaction')
+        return result
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def end_session(self):
+        pass
+
+
+class MemoryClient:
+    def __init__(self, counter):
+        self._counter = counter
+
+    async def start_session(self, **kwargs):
+        return MemorySession(self._counter)
+
+
+class MemoryDatabase:
+    """Attribute-style collection access, like a Motor database"""
+
+    def __init__(self, name='groupfolio_benchmark'):
+        self.name = name
+        self.round_trips = RoundTripCounter()
+        self.client = MemoryClient(self.round_trips)
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name, self.round_trips)
+        return self._collections[name]
+
+    async def list_collection_names(self, **kwargs):
+        return list(self._collections)
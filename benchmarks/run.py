@@ -0,0 +1,455 @@
+"""End-to-end command benchmarks
+
+Seeds a database with guilds, paper trading accounts, transactions and
+watchlists, then drives cog command handlers directly through stub
+contexts against the fake market data provider. For every scenario it
+reports latency percentiles, upstream provider calls, Mongo round trips and
+peak Python memory, and can write the results as JSON and compare them with
+a previous run.
+
+Usage (from the repository root):
+    python -m benchmarks.run
+    python -m benchmarks.run --guilds 500 --accounts 10000 --watchlist-size 25
+    python -m benchmarks.run --scenarios watchlist,leaderboard --output after.json --compare before.json
+    python -m benchmarks.run --mongodb-uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import config
+from benchmarks.memory_db import MemoryDatabase, RoundTripCounter
+from benchmarks.stubs import StubBot, StubContext, StubGuild, StubMember
+from utils import loop_diagnostics
+
+SCENARIOS = [
+    'watchlist', 'stock', 'portfolio', 'balance', 'leaderboard',
+    'transactions', 'stats', 'stats_heavy', 'buy'
+]
+
+CHART_PERIODS = ['1d', '1mo', '1y']
+LEADERBOARD_CATEGORIES = ['value', 'gainers', 'volume']
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark GroupFolio bot commands")
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--accounts', type=int, default=1000, help="paper trading accounts across all guilds")
+    parser.add_argument('--watchlist-size', type=int, default=25)
+    parser.add_argument('--symbols', type=int, default=300, help="size of the symbol universe")
+    parser.add_argument('--transactions', type=int, default=20, help="transactions per account")
+    parser.add_argument('--heavy-transactions', type=int, default=10000,
+                        help="transactions on the account used by stats_heavy")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05, help="fake provider seconds per call")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--mongodb-uri', help="benchmark against a real MongoDB instead of the in-memory stand-in")
+    parser.add_argument('--memory-iterations', type=int, default=20,
+                        help="invocations in the untimed pass that measures peak memory")
+    parser.add_argument('--no-trace-memory', action='store_true', help="skip the peak memory pass")
+    parser.add_argument('--loop-diagnostics', action='store_true',
+                        help="report event loop stalls per scenario, by call site")
+    parser.add_argument('--output', help="write results as JSON to this path")
+    parser.add_argument('--compare', help="JSON results of a previous run to compare against")
+    return parser.parse_args(argv)
+
+
+# -- Environment ------------------------------------------------------------
+
+class CommandCounter:
+    """pymongo CommandListener counting commands sent to a real server"""
+
+    def __init__(self, counter):
+        self.counter = counter
+
+    def started(self, event):
+        self.counter.add(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def connect_database(args):
+    """Get a database and its round trip counter"""
+    if not args.mongodb_uri:
+        db = MemoryDatabase()
+        return db, db.round_trips
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import monitoring
+
+    class Listener(CommandCounter, monitoring.CommandListener):
+        pass
+
+    counter = RoundTripCounter()
+    client = AsyncIOMotorClient(args.mongodb_uri, event_listeners=[Listener(counter)])
+    await client.drop_database('groupfolio_benchmark')
+
+    from utils import database
+    await database.detect_transaction_support(client)
+    return client['groupfolio_benchmark'], counter
+
+
+def configure(args):
+    """Point the bot at the fake provider and scratch directories"""
+    from utils import market_data
+    from utils.fake_market_data import FakeProvider
+
+    config.MARKET_DATA_PROVIDER = 'fake'
+    config.HISTORY_STORE_DIR = tempfile.mkdtemp(prefix='groupfolio-history-')
+    config.CHART_CACHE_DIR = ''
+
+    provider = FakeProvider(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    market_data.set_provider(provider)
+    return provider
+
+
+# -- Seed data --------------------------------------------------------------
+
+def _symbol_universe(count):
+    return [f"S{i:03d}" for i in range(count)]
+
+
+def build_seed(args, rng):
+    """Build guilds, members and the documents to insert"""
+    symbols = _symbol_universe(args.symbols)
+    now = datetime.utcnow()
+
+    guilds = []
+    watchlists = []
+    accounts = []
+    transactions = []
+
+    user_id = 10_000
+    for g in range(args.guilds):
+        guild_id = 1_000_000 + g
+        member_count = args.accounts // args.guilds + (1 if g < args.accounts % args.guilds else 0)
+        members = []
+
+        for _ in range(member_count):
+            user_id += 1
+            member = StubMember(user_id, f"trader{user_id}")
+            members.append(member)
+
+            held = rng.sample(symbols, rng.randint(1, 8))
+            positions = []
+            cash = 100000.0
+            for i in range(args.transactions):
+                symbol = held[i % len(held)]
+                quantity = rng.randint(1, 20)
+                price = round(rng.uniform(20, 500), 2)
+                timestamp = now - timedelta(minutes=rng.randint(1, 180 * 24 * 60))
+                transactions.append({
+                    "user_id": str(user_id), "guild_id": str(guild_id), "action": "BUY",
+                    "symbol": symbol, "quantity": quantity, "price": price,
+                    "total": price * quantity, "timestamp": timestamp
+                })
+                cash -= price * quantity
+                position = next((p for p in positions if p['symbol'] == symbol), None)
+                if position is None:
+                    positions.append({"symbol": symbol, "quantity": quantity, "avg_cost": price})
+                else:
+                    total_cost = position['quantity'] * position['avg_cost'] + quantity * price
+                    position['quantity'] += quantity
+                    position['avg_cost'] = total_cost / position['quantity']
+
+            accounts.append({
+                "user_id": str(user_id), "guild_id": str(guild_id), "cash": max(cash, 0.0),
+                "positions": positions, "created_at": now - timedelta(days=180),
+                "display_name": member.display_name
+            })
+
+        watchlists.append({
+            "guild_id": str(guild_id),
+            "stocks": [
+                {"symbol": symbol, "added_by_id": str(members[0].id) if members else "0",
+                 "added_by_name": members[0].name if members else "seed", "added_at": now}
+                for symbol in rng.sample(symbols, min(args.watchlist_size, len(symbols)))
+            ]
+        })
+        guilds.append(StubGuild(guild_id, f"Guild {g}", members))
+
+    # One account with a long trading history for stats_heavy
+    heavy = StubMember(1, "heavy_trader")
+    heavy_guild = guilds[0]
+    heavy_guild._members[heavy.id] = heavy
+    held = {}
+    for i in range(args.heavy_transactions):
+        symbol = rng.choice(symbols[:20])
+        quantity = rng.randint(1, 20)
+        action = "SELL" if held.get(symbol, 0) >= quantity and rng.random() < 0.45 else "BUY"
+        held[symbol] = held.get(symbol, 0) + (quantity if action == "BUY" else -quantity)
+        price = round(rng.uniform(20, 500), 2)
+        transactions.append({
+            "user_id": str(heavy.id), "guild_id": str(heavy_guild.id), "action": action,
+            "symbol": symbol, "quantity": quantity, "price": price, "total": price * quantity,
+            "timestamp": now - timedelta(minutes=args.heavy_transactions - i)
+        })
+    accounts.append({
+        "user_id": str(heavy.id), "guild_id": str(heavy_guild.id), "cash": 100000.0,
+        "positions": [{"symbol": s, "quantity": q, "avg_cost": 100.0} for s, q in held.items() if q > 0],
+        "created_at": now - timedelta(days=30), "display_name": heavy.display_name
+    })
+
+    return {
+        "symbols": symbols,
+        "guilds": guilds,
+        "heavy": (heavy_guild, heavy),
+        "collections": {
+            "watchlists": watchlists,
+            "paper_accounts": accounts,
+            "paper_transactions": transactions
+        }
+    }
+
+
+async def seed_database(db, seed):
+    from utils import indexes
+
+    await indexes.ensure_indexes(db)
+    for name, docs in seed["collections"].items():
+        for i in range(0, len(docs), 5000):
+            await db[name].insert_many(docs[i:i + 5000])
+
+
+# -- Scenarios --------------------------------------------------------------
+
+def build_scenarios(bot, seed):
+    from cogs.paper_trading import PaperTrading
+    from cogs.watchlist import Watchlist
+    from utils import analytics
+
+    trading = PaperTrading(bot)
+    watchlist = Watchlist(bot)
+    symbols = seed["symbols"]
+    heavy_guild, heavy = seed["heavy"]
+
+    def stats_cold(rng):
+        # Drop the cached history so every call replays the full trade log
+        analytics._history_cache.invalidate((str(heavy.id), str(heavy_guild.id)))
+        return trading.stats.callback(trading, StubContext(bot, heavy_guild, heavy))
+
+    def pick(rng):
+        guild = rng.choice(seed["guilds"])
+        member = rng.choice(list(guild._members.values()))
+        return StubContext(bot, guild, member)
+
+    return {
+        'watchlist': lambda rng: watchlist.view_watchlist.callback(watchlist, pick(rng)),
+        'stock': lambda rng: watchlist.stock_info.callback(
+            watchlist, pick(rng), rng.choice(symbols), rng.choice(CHART_PERIODS)),
+        'portfolio': lambda rng: trading.my_portfolio.callback(trading, pick(rng)),
+        'balance': lambda rng: trading.balance.callback(trading, pick(rng)),
+        'leaderboard': lambda rng: trading.leaderboard.callback(
+            trading, pick(rng), rng.choice(LEADERBOARD_CATEGORIES)),
+        'transactions': lambda rng: trading.transactions.callback(trading, pick(rng)),
+        'stats': lambda rng: trading.stats.callback(trading, pick(rng)),
+        'stats_heavy': stats_cold,
+        'buy': lambda rng: trading.buy.callback(trading, pick(rng), rng.choice(symbols), 1),
+    }
+
+
+async def _invoke_all(name, command, count, concurrency, rng):
+    """Invoke a command count times, at most concurrency at once
+
+    Returns the latency of each invocation in ms, the number that raised
+    and the elapsed wall time.
+    """
+    latencies = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def invoke():
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            try:
+                await command(rng)
+            except Exception as e:
+                errors += 1
+                print(f"  {name}: {type(e).__name__}: {e}", file=sys.stderr)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(invoke() for _ in range(count)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_scenario(name, command, args, provider, round_trips, rng):
+    """Run one scenario and return its measurements"""
+    await _invoke_all(name, command, args.warmup, args.concurrency, rng)
+
+    watchdog = loop_diagnostics.get_watchdog()
+    if watchdog is not None:
+        watchdog.reset()
+
+    provider.reset_call_counts()
+    round_trips.reset()
+    latencies, errors, elapsed = await _invoke_all(name, command, args.iterations, args.concurrency, rng)
+    upstream = provider.call_counts()
+    mongo_operations = round_trips.snapshot()
+    stall_sites = None
+    if watchdog is not None:
+        # Stalls are recorded once the loop runs again, so let the watchdog catch up
+        await asyncio.sleep(watchdog.beat_interval * 3)
+        stall_sites = watchdog.summary()
+
+    # tracemalloc slows allocation-heavy code several times over, so peak
+    # memory comes from a separate, shorter pass that isn't timed
+    peak_memory_mb = None
+    if not args.no_trace_memory:
+        tracemalloc.start()
+        await _invoke_all(name, command, args.memory_iterations, args.concurrency, rng)
+        peak_memory_mb = tracemalloc.get_traced_memory()[1] / 1_000_000
+        tracemalloc.stop()
+
+    samples = np.asarray(latencies)
+    return {
+        'iterations': args.iterations,
+        'concurrency': args.concurrency,
+        'errors': errors,
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'mean_ms': float(samples.mean()),
+        'max_ms': float(samples.max()),
+        'throughput_per_s': args.iterations / elapsed if elapsed else 0.0,
+        'upstream_calls': upstream,
+        'upstream_calls_total': sum(upstream.values()),
+        'mongo_round_trips': sum(mongo_operations.values()),
+        'mongo_operations': mongo_operations,
+        'peak_memory_mb': peak_memory_mb,
+        'loop_stalls': sum(site['count'] for site in stall_sites) if stall_sites is not None else None,
+        'loop_stall_sites': stall_sites
+    }
+
+
+# -- Reporting --------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Arguments that don't change what is measured
+_UNCOMPARED_ARGS = {'output', 'compare', 'scenarios'}
+
+
+def print_results(results, baseline=None):
+    if baseline:
+        differing = sorted(
+            key for key, value in results['meta']['args'].items()
+            if key not in _UNCOMPARED_ARGS and baseline['meta'].get('args', {}).get(key) != value
+        )
+        if differing:
+            print(f"Warning: baseline was run with different {', '.join(differing)}", file=sys.stderr)
+
+    header = f"{'scenario':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>9}{'upstream':>10}{'mongo':>8}{'peak MB':>9}"
+    print(header)
+    print('-' * len(header))
+
+    for name, r in results['scenarios'].items():
+        peak = f"{r['peak_memory_mb']:.1f}" if r['peak_memory_mb'] is not None else '-'
+        print(f"{name:<14}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+              f"{r['throughput_per_s']:>9.1f}{r['upstream_calls_total']:>10}{r['mongo_round_trips']:>8}{peak:>9}")
+
+        for site in (r.get('loop_stall_sites') or [])[:3]:
+            print(f"{'':<14}stalled {site['count']}x ({site['total'] * 1000:.0f} ms) at {site['site']}")
+
+        before = (baseline or {}).get('scenarios', {}).get(name)
+        if before:
+            deltas = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'upstream_calls_total', 'mongo_round_trips'):
+                if before[key]:
+                    deltas.append(f"{key} {(r[key] - before[key]) / before[key] * 100:+.0f}%")
+            print(f"{'':<14}vs {baseline['meta'].get('commit') or 'baseline'}: {', '.join(deltas)}")
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+
+    provider = configure(args)
+    db, round_trips = await connect_database(args)
+
+    from utils import chart_generator, database, stock_api
+    database.set_db(db)
+
+    print(f"Seeding {args.guilds} guilds, {args.accounts} accounts...", file=sys.stderr)
+    seed = build_seed(args, rng)
+    await seed_database(db, seed)
+
+    bot = StubBot()
+    bot.guilds = seed["guilds"]
+    scenarios = build_scenarios(bot, seed)
+
+    if args.loop_diagnostics:
+        loop_diagnostics.enable()
+
+    # Generate the synthetic price walks up front so it isn't timed
+    for symbol in seed["symbols"]:
+        provider._daily_frame(symbol)
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'database': 'mongodb' if args.mongodb_uri else 'memory',
+            'args': vars(args)
+        },
+        'scenarios': {}
+    }
+
+    try:
+        for name in args.scenarios.split(','):
+            name = name.strip()
+            if name not in scenarios:
+                print(f"Unknown scenario: {name}", file=sys.stderr)
+                continue
+
+            print(f"Running {name}...", file=sys.stderr)
+            results['scenarios'][name] = await run_scenario(
+                name, scenarios[name], args, provider, round_trips, rng
+            )
+    finally:
+        loop_diagnostics.disable()
+        stock_api.shutdown_executor()
+        chart_generator.shutdown_render_pool()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    return results
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
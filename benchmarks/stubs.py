@@ -0,0 +1,99 @@
+"""Minimal Discord stand-ins for driving cog commands without a gateway
+
+Only the attributes the cogs touch are implemented. Every message a
+command sends is recorded on the context so scenarios can check output.
+"""
+import asyncio
+import itertools
+
+_message_ids = itertools.count(1)
+
+
+class StubMember:
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+
+
+class StubMessage:
+    def __init__(self, channel, content=None, embed=None, file=None, view=None):
+        self.id = next(_message_ids)
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.file = file
+        self.view = view
+        self.deleted = False
+
+    async def edit(self, content=None, embed=None, view=None, attachments=None, **kwargs):
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embed = embed
+        self.view = view
+
+    async def delete(self, **kwargs):
+        self.deleted = True
+
+
+class StubChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.messages = []
+
+    async def send(self, content=None, embed=None, file=None, view=None, **kwargs):
+        message = StubMessage(self, content=content, embed=embed, file=file, view=view)
+        self.messages.append(message)
+        return message
+
+
+class StubGuild:
+    """A guild whose member cache holds a fixed set of members"""
+
+    def __init__(self, guild_id, name, members=()):
+        self.id = guild_id
+        self.name = name
+        self.icon = None
+        self._members = {member.id: member for member in members}
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    async def query_members(self, user_ids=None, limit=5, **kwargs):
+        return [self._members[user_id] for user_id in (user_ids or []) if user_id in self._members]
+
+
+class StubContext:
+    """The subset of commands.Context the cogs use"""
+
+    def __init__(self, bot, guild, author, channel=None):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.channel = channel or StubChannel(guild.id)
+        self.command = None
+
+    @property
+    def messages(self):
+        return self.channel.messages
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class StubBot:
+    """Enough of commands.Bot for cog constructors and user lookups"""
+
+    def __init__(self):
+        self.guilds = []
+        self.latency = 0.0
+        self.user = StubMember(0, 'GroupFolio')
+
+    def get_user(self, user_id):
+        return None
+
+    async def wait_for(self, event, check=None, timeout=None):
+        raise asyncio.TimeoutError()
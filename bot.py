@@ -5,6 +5,7 @@ import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 
 import config
+from utils import loop_diagnostics, metrics
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -23,13 +24,20 @@ async def init_database():
 
     if config.MONGODB_URI:
         try:
-            db_client = AsyncIOMotorClient(config.MONGODB_URI)
+            db_client = AsyncIOMotorClient(config.MONGODB_URI, event_listeners=[metrics.MongoCommandTimer()])
             db = db_client[config.DATABASE_NAME]
             await db_client.admin.command('ping')
 
             database.set_db(db)
 
             print('✓ Connected to MongoDB!')
+            if not await database.detect_transaction_support(db_client):
+                print('⚠ MongoDB is standalone - trades will be saved without transactions')
+
+            from utils import indexes, symbol_index
+            await indexes.ensure_indexes(db)
+            await symbol_index.seed_from_db()
+
             return True
         except Exception as e:
             print(f'✗ MongoDB connection failed: {e}')
@@ -61,6 +69,9 @@ async def on_ready():
     """Called when the bot successfully connects to Discord"""
     await init_database()
 
+    from utils.market_poller import poller
+    poller.start()
+
     print(f'\n{"="*50}')
     print(f'✓ {bot.user} has connected to Discord!')
     print(f'✓ Bot is in {len(bot.guilds)} server(s)')
@@ -68,9 +79,21 @@ async def on_ready():
     print(f'{"="*50}\n')
 
 
+@bot.before_invoke
+async def start_command_timer(ctx):
+    metrics.command_started(ctx)
+
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    metrics.command_finished(ctx)
+
+
 @bot.event
 async def on_command_error(ctx, error):
     """Global error handler"""
+    metrics.command_error(ctx, error)
+
     if isinstance(error, commands.CommandNotFound):
         await ctx.send(f"❌ Command not found. Use `{config.COMMAND_PREFIX}help` to see available commands.")
     elif isinstance(error, commands.MissingRequiredArgument):
@@ -90,7 +113,21 @@ async def main():
             print("Error: DISCORD_TOKEN not found in environment variables!")
             print("Please create a .env file with your bot token.")
             return
-        await bot.start(config.DISCORD_TOKEN)
+        metrics.lag_monitor.start()
+        await metrics.start_http_server()
+        if config.LOOP_DIAGNOSTICS:
+            loop_diagnostics.enable()
+        try:
+            await bot.start(config.DISCORD_TOKEN)
+        finally:
+            from utils import chart_generator, stock_api
+            from utils.market_poller import poller
+            poller.stop()
+            metrics.lag_monitor.stop()
+            await metrics.stop_http_server()
+            loop_diagnostics.disable()
+            stock_api.shutdown_executor()
+            chart_generator.shutdown_render_pool()
 
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@
 import discord
 from discord.ext import commands
 import config
+from utils.constants import Limits
 
 
 class Basic(commands.Cog):
@@ -35,6 +36,25 @@ class Basic(commands.Cog):
         db_status = "✓ Connected" if bot_module.db else "✗ Not connected"
         embed.add_field(name="Database", value=db_status, inline=True)
 
+        from utils import stock_api
+        cache_stats = stock_api.get_cache_stats()
+        embed.add_field(
+            name="Quote Cache",
+            value=f"{cache_stats['size']}/{cache_stats['max_size']} symbols • "
+                  f"{cache_stats['hit_ratio']:.0%} hit rate "
+                  f"({cache_stats['hits']} hits, {cache_stats['misses']} misses)",
+            inline=False
+        )
+
+        from utils import chart_generator
+        chart_stats = chart_generator.get_chart_cache_stats()
+        embed.add_field(
+            name="Chart Cache",
+            value=f"{chart_stats['size']} charts ({chart_stats['weight'] / 1_000_000:.1f} MB) • "
+                  f"{chart_stats['hit_ratio']:.0%} hit rate",
+            inline=False
+        )
+
         embed.add_field(
             name="Commands",
             value=f"`{config.COMMAND_PREFIX}help` - Show all commands\n"
@@ -47,6 +67,62 @@ class Basic(commands.Cog):
 
         await ctx.send(embed=embed)
 
+    @commands.command(name='metrics')
+    @commands.has_permissions(administrator=True)
+    async def metrics(self, ctx):
+        """Show where the bot spends its time (admins only)"""
+        from utils import metrics
+
+        def ms(seconds):
+            return f"{seconds * 1000:.0f}"
+
+        def timing_lines(rows, label):
+            return [
+                f"`{label(row['labels'])}` {row['count']}× • "
+                f"{ms(row['p50'])}/{ms(row['p95'])}/{ms(row['p99'])} ms"
+                for row in rows[:Limits.MAX_METRICS_ROWS]
+            ]
+
+        embed = discord.Embed(
+            title="📈 Bot Metrics",
+            description="Latency is p50/p95/p99, sorted by total time spent",
+            color=config.BOT_COLOR
+        )
+
+        command_rows = metrics.summarize('command_latency_seconds', ('command',))
+        errors = metrics.counter_totals('command_errors_total', ('command',))
+        lines = timing_lines(command_rows, lambda labels: f"{config.COMMAND_PREFIX}{labels['command']}")
+        for i, row in enumerate(command_rows[:len(lines)]):
+            error_count = errors.get((row['labels']['command'],))
+            if error_count:
+                lines[i] += f" • {error_count} errors"
+        embed.add_field(name="Commands", value="\n".join(lines) or "No commands yet", inline=False)
+
+        provider_rows = metrics.summarize('provider_call_seconds', ('method',))
+        lines = timing_lines(provider_rows, lambda labels: labels['method'])
+        embed.add_field(name="Market Data", value="\n".join(lines) or "No calls yet", inline=False)
+
+        mongo_rows = metrics.summarize('mongo_command_seconds', ('command', 'collection'))
+        lines = timing_lines(mongo_rows, lambda labels: f"{labels['command']} {labels['collection']}".strip())
+        embed.add_field(name="MongoDB", value="\n".join(lines) or "No commands yet", inline=False)
+
+        lines = [
+            f"`{name}` {stats['hit_ratio']:.0%} hit rate ({stats['hits']} hits, {stats['misses']} misses)"
+            for name, stats in metrics.cache_stats().items()
+        ]
+        embed.add_field(name="Caches", value="\n".join(lines) or "No caches", inline=False)
+
+        lag = metrics.summarize('event_loop_lag_seconds')
+        if lag:
+            lag = lag[0]
+            value = (f"{ms(lag['p50'])}/{ms(lag['p95'])}/{ms(lag['p99'])} ms • "
+                     f"max {ms(lag['max'])} ms • last {ms(metrics.lag_monitor.last_lag)} ms")
+        else:
+            value = "Not sampled yet"
+        embed.add_field(name="Event Loop Lag", value=value, inline=False)
+
+        await ctx.send(embed=embed)
+
 
 async def setup(bot):
     await bot.add_cog(Basic(bot))
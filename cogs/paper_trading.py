@@ -1,10 +1,95 @@
 """
 Paper trading commands cog - virtual stock trading
 """
+from datetime import timezone
+
 import discord
 from discord.ext import commands
 import config
-from utils import paper_trading, stock_api
+from utils.constants import Limits
+from utils import analytics, leaderboard, paper_trading, portfolio_snapshots, stock_api, symbol_index, user_names
+
+
+class TransactionHistoryView(discord.ui.View):
+    """Buttons for paging through transaction history, one page fetched per click"""
+
+    def __init__(self, author, guild_id, page_size, next_cursor):
+        super().__init__(timeout=300)  # 5 minute timeout
+        self.author = author
+        self.guild_id = guild_id
+        self.page_size = page_size
+        self.message = None
+        # cursors[i] is the cursor that fetches page i (None for the newest page)
+        self.cursors = [None]
+        self.page = 0
+        self.next_cursor = next_cursor
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.newer.disabled = self.page == 0
+        self.older.disabled = self.next_cursor is None
+
+    def build_embed(self, transactions):
+        """Build the embed for one page of transactions"""
+        embed = discord.Embed(
+            title=f"📜 {self.author.name}'s Transaction History",
+            description=f"Page {self.page + 1} • {len(transactions)} transactions",
+            color=config.BOT_COLOR
+        )
+
+        for txn in transactions:
+            action_emoji = "🟢" if txn['action'] == "BUY" else "🔴"
+            timestamp = txn['timestamp'].strftime("%m/%d %H:%M")
+
+            embed.add_field(
+                name=f"{action_emoji} {txn['action']} {txn['symbol']}",
+                value=f"{txn['quantity']} shares @ ${txn['price']:,.2f}\nTotal: ${txn['total']:,.2f}\n{timestamp}",
+                inline=True
+            )
+
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.author.id:
+            await interaction.response.send_message("❌ These buttons aren't for you!", ephemeral=True)
+            return False
+        return True
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        """Fetch and display a page"""
+        transactions, next_cursor = await paper_trading.get_transactions_page(
+            self.author.id,
+            self.guild_id,
+            page_size=self.page_size,
+            before=self.cursors[page]
+        )
+
+        if not transactions:
+            await interaction.response.send_message("❌ No more transactions", ephemeral=True)
+            return
+
+        self.page = page
+        self.next_cursor = next_cursor
+        if next_cursor is not None and len(self.cursors) == page + 1:
+            self.cursors.append(next_cursor)
+
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.build_embed(transactions), view=self)
+
+    @discord.ui.button(label='◀ Newer', style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label='Older ▶', style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
 
 
 class PaperTrading(commands.Cog):
@@ -26,43 +111,35 @@ class PaperTrading(commands.Cog):
             await ctx.send("❌ Database not connected!")
             return
 
+        snapshot = await portfolio_snapshots.get_portfolio_snapshot(account)
+
         embed = discord.Embed(
             title=f"💰 {ctx.author.name}'s Balance",
-            color=config.BOT_COLOR
+            color=config.BOT_COLOR,
+            timestamp=snapshot['timestamp'].replace(tzinfo=timezone.utc)
         )
 
         embed.add_field(
             name="Cash",
-            value=f"${account['cash']:,.2f}",
+            value=f"${snapshot['cash']:,.2f}",
             inline=True
         )
 
-        total_value = account['cash']
-        positions = account.get('positions', [])
-
-        if positions:
-            holdings_value = 0
-            for position in positions:
-                stock_info = await stock_api.get_stock_info(position['symbol'])
-                if stock_info:
-                    holdings_value += stock_info['price'] * position['quantity']
-
-            total_value += holdings_value
-
+        if snapshot['positions']:
             embed.add_field(
                 name="Holdings Value",
-                value=f"${holdings_value:,.2f}",
+                value=f"${snapshot['holdings_value']:,.2f}",
                 inline=True
             )
 
         embed.add_field(
             name="Total Portfolio Value",
-            value=f"${total_value:,.2f}",
+            value=f"${snapshot['total_value']:,.2f}",
             inline=True
         )
 
-        profit_loss = total_value - paper_trading.STARTING_BALANCE
-        profit_pct = (profit_loss / paper_trading.STARTING_BALANCE) * 100
+        profit_loss = snapshot['profit_loss']
+        profit_pct = snapshot['profit_pct']
 
         color_emoji = "🟢" if profit_loss >= 0 else "🔴"
         sign = "+" if profit_loss >= 0 else ""
@@ -90,8 +167,12 @@ class PaperTrading(commands.Cog):
 
         symbol = symbol.upper()
 
+        if symbol_index.is_known_invalid(symbol):
+            await ctx.send(f"❌ Invalid stock symbol: `{symbol}`")
+            return
+
         await ctx.send(f"⏳ Fetching current price for {symbol}...")
-        stock_info = await stock_api.get_stock_info(symbol)
+        stock_info = await stock_api.get_stock_price(symbol)
 
         if not stock_info:
             await ctx.send(f"❌ Invalid stock symbol: `{symbol}`")
@@ -138,8 +219,12 @@ class PaperTrading(commands.Cog):
 
         symbol = symbol.upper()
 
+        if symbol_index.is_known_invalid(symbol):
+            await ctx.send(f"❌ Invalid stock symbol: `{symbol}`")
+            return
+
         await ctx.send(f"⏳ Fetching current price for {symbol}...")
-        stock_info = await stock_api.get_stock_info(symbol)
+        stock_info = await stock_api.get_stock_price(symbol)
 
         if not stock_info:
             await ctx.send(f"❌ Invalid stock symbol: `{symbol}`")
@@ -194,47 +279,18 @@ class PaperTrading(commands.Cog):
             await ctx.send(embed=embed)
             return
 
-        loading_msg = await ctx.send(f"⏳ Fetching data for {len(positions)} positions...")
-
-        import asyncio
-        symbols = [p['symbol'] for p in positions]
-        tasks = [stock_api.get_stock_info(symbol) for symbol in symbols]
-        results = await asyncio.gather(*tasks)
-
-        total_value = account['cash']
-        total_cost_basis = 0
-        position_data = []
+        snapshot = await portfolio_snapshots.get_portfolio_snapshot(account)
+        position_data = [pos for pos in snapshot['positions'] if pos['price'] is not None]
 
-        for position, stock_info in zip(positions, results):
-            if stock_info:
-                current_value = stock_info['price'] * position['quantity']
-                cost_basis = position['avg_cost'] * position['quantity']
-                profit_loss = current_value - cost_basis
-                profit_pct = (profit_loss / cost_basis) * 100
-
-                total_value += current_value
-                total_cost_basis += cost_basis
-
-                position_data.append({
-                    'symbol': position['symbol'],
-                    'quantity': position['quantity'],
-                    'avg_cost': position['avg_cost'],
-                    'current_price': stock_info['price'],
-                    'value': current_value,
-                    'profit_loss': profit_loss,
-                    'profit_pct': profit_pct
-                })
-
-        await loading_msg.delete()
-
-        total_pl = total_value - paper_trading.STARTING_BALANCE
-        total_pl_pct = (total_pl / paper_trading.STARTING_BALANCE) * 100
+        total_value = snapshot['total_value']
+        total_pl = snapshot['profit_loss']
+        total_pl_pct = snapshot['profit_pct']
 
         embed = discord.Embed(
             title=f"📊 {target_user.name}'s Portfolio",
-            description=f"💰 **Cash:** ${account['cash']:,.2f}\n📈 **Holdings:** ${total_value - account['cash']:,.2f}\n💼 **Total Value:** ${total_value:,.2f}",
+            description=f"💰 **Cash:** ${snapshot['cash']:,.2f}\n📈 **Holdings:** ${snapshot['holdings_value']:,.2f}\n💼 **Total Value:** ${total_value:,.2f}",
             color=discord.Color.green() if total_pl >= 0 else discord.Color.red(),
-            timestamp=discord.utils.utcnow()
+            timestamp=snapshot['timestamp'].replace(tzinfo=timezone.utc)
         )
 
         for pos in position_data[:10]:
@@ -244,7 +300,7 @@ class PaperTrading(commands.Cog):
             embed.add_field(
                 name=f"{emoji} {pos['symbol']}",
                 value=f"**{pos['quantity']} shares** @ ${pos['avg_cost']:,.2f}\n"
-                      f"Current: ${pos['current_price']:,.2f}\n"
+                      f"Current: ${pos['price']:,.2f}\n"
                       f"P/L: {sign}${pos['profit_loss']:,.2f} ({sign}{pos['profit_pct']:.2f}%)",
                 inline=True
             )
@@ -252,9 +308,10 @@ class PaperTrading(commands.Cog):
         emoji = "🟢" if total_pl >= 0 else "🔴"
         sign = "+" if total_pl >= 0 else ""
 
-        embed.set_footer(
-            text=f"{emoji} Total P/L: {sign}${total_pl:,.2f} ({sign}{total_pl_pct:.2f}%)"
-        )
+        footer = f"{emoji} Total P/L: {sign}${total_pl:,.2f} ({sign}{total_pl_pct:.2f}%)"
+        if snapshot.get('partial'):
+            footer += " • Some positions valued at cost (no quote)"
+        embed.set_footer(text=footer)
 
         await ctx.send(embed=embed)
 
@@ -266,34 +323,65 @@ class PaperTrading(commands.Cog):
         Usage: !transactions
         Usage: !transactions 20
         """
-        if limit > 50:
-            limit = 50
+        limit = max(1, min(limit, Limits.MAX_TRANSACTIONS_PAGE_SIZE))
 
-        transactions = await paper_trading.get_user_transactions(
+        transactions, next_cursor = await paper_trading.get_transactions_page(
             ctx.author.id,
             ctx.guild.id,
-            limit
+            page_size=limit
         )
 
         if not transactions:
             await ctx.send(f"No transaction history yet!\n\nUse `!buy <SYMBOL> <QUANTITY>` to start trading.")
             return
 
+        view = TransactionHistoryView(ctx.author, ctx.guild.id, limit, next_cursor)
+        view.message = await ctx.send(embed=view.build_embed(transactions), view=view)
+
+    @commands.command(name='stats', aliases=['performance', 'pnl'])
+    async def stats(self, ctx, user: discord.Member = None):
+        """
+        View trading performance: realized/unrealized P/L, win rate and more
+
+        Usage: !stats
+        Usage: !stats @user
+        """
+        target_user = user or ctx.author
+        stats = await analytics.get_user_stats(target_user.id, ctx.guild.id)
+
+        if not stats['trade_count']:
+            await ctx.send("No transaction history yet!\n\nUse `!buy <SYMBOL> <QUANTITY>` to start trading.")
+            return
+
+        total_pl = stats['realized_pl'] + stats['unrealized_pl']
+
         embed = discord.Embed(
-            title=f"📜 {ctx.author.name}'s Transaction History",
-            description=f"Last {len(transactions)} transactions",
-            color=config.BOT_COLOR
+            title=f"📈 {target_user.name}'s Trading Stats",
+            color=discord.Color.green() if total_pl >= 0 else discord.Color.red()
         )
 
-        for txn in transactions:
-            action_emoji = "🟢" if txn['action'] == "BUY" else "🔴"
-            timestamp = txn['timestamp'].strftime("%m/%d %H:%M")
+        for name, value in (("Realized P/L", stats['realized_pl']),
+                            ("Unrealized P/L", stats['unrealized_pl']),
+                            ("Total P/L", total_pl)):
+            emoji = "🟢" if value >= 0 else "🔴"
+            sign = "+" if value >= 0 else ""
+            embed.add_field(name=name, value=f"{emoji} {sign}${value:,.2f}", inline=True)
 
-            embed.add_field(
-                name=f"{action_emoji} {txn['action']} {txn['symbol']}",
-                value=f"{txn['quantity']} shares @ ${txn['price']:,.2f}\nTotal: ${txn['total']:,.2f}\n{timestamp}",
-                inline=True
-            )
+        embed.add_field(name="Trades", value=f"{stats['trade_count']:,} ({stats['closed_count']:,} sells)", inline=True)
+        embed.add_field(name="Win Rate", value=f"{stats['win_rate']:.1f}%", inline=True)
+        embed.add_field(name="Avg Holding Period", value=f"{stats['avg_holding_days']:.1f} days", inline=True)
+        embed.add_field(name="Turnover", value=f"{stats['turnover']:.2f}x starting balance", inline=True)
+
+        by_symbol = stats['by_symbol']
+        if by_symbol:
+            lines = []
+            for entry in by_symbol[:8]:
+                sign = "+" if entry['total'] >= 0 else ""
+                lines.append(f"**{entry['symbol']}**: {sign}${entry['total']:,.2f}")
+
+            embed.add_field(name="P/L by Symbol", value="\n".join(lines), inline=False)
+
+        embed.set_footer(text="Realized P/L uses first-in, first-out lot matching")
 
         await ctx.send(embed=embed)
 
@@ -347,61 +435,21 @@ class PaperTrading(commands.Cog):
             await ctx.send(f"❌ Invalid category. Use: `value`, `gainers`, or `volume`")
             return
 
-        accounts = await paper_trading.get_all_accounts(ctx.guild.id)
+        board = await leaderboard.get_leaderboard(ctx.guild.id)
 
-        if not accounts:
+        if not len(board):
             await ctx.send("No traders yet! Use `!buy` to start trading and appear on the leaderboard.")
             return
 
-        loading_msg = await ctx.send(f"⏳ Calculating leaderboard for {len(accounts)} traders...")
-
-        import asyncio
-        user_data = []
-
-        for account in accounts:
-            total_value = account['cash']
-            positions = account.get('positions', [])
-
-            if positions:
-                symbols = [p['symbol'] for p in positions]
-                tasks = [stock_api.get_stock_info(symbol) for symbol in symbols]
-                results = await asyncio.gather(*tasks)
-
-                for position, stock_info in zip(positions, results):
-                    if stock_info:
-                        total_value += stock_info['price'] * position['quantity']
-
-            profit_loss = total_value - paper_trading.STARTING_BALANCE
-            profit_pct = (profit_loss / paper_trading.STARTING_BALANCE) * 100
-
-            if category == 'volume':
-                txn_count = await paper_trading.get_user_transaction_count(
-                    int(account['user_id']),
-                    ctx.guild.id
-                )
-            else:
-                txn_count = 0
-
-            user_data.append({
-                'user_id': account['user_id'],
-                'total_value': total_value,
-                'profit_loss': profit_loss,
-                'profit_pct': profit_pct,
-                'txn_count': txn_count
-            })
-
-        await loading_msg.delete()
+        user_data = board.top(category, 10)
 
         if category == 'value':
-            user_data.sort(key=lambda x: x['total_value'], reverse=True)
             title = "🏆 Leaderboard - Total Portfolio Value"
             description = "Top traders by total portfolio value"
         elif category == 'gainers':
-            user_data.sort(key=lambda x: x['profit_pct'], reverse=True)
             title = "📈 Leaderboard - Top Gainers"
             description = "Top traders by percentage gain"
         else:
-            user_data.sort(key=lambda x: x['txn_count'], reverse=True)
             title = "🔥 Leaderboard - Most Active"
             description = "Top traders by number of transactions"
 
@@ -414,12 +462,15 @@ class PaperTrading(commands.Cog):
 
         medals = ["🥇", "🥈", "🥉"]
 
-        for i, user in enumerate(user_data[:10], 1):
-            try:
-                discord_user = await self.bot.fetch_user(int(user['user_id']))
-                username = discord_user.name
-            except:
-                username = "Unknown User"
+        usernames = await user_names.resolve_display_names(
+            self.bot,
+            ctx.guild,
+            [user['user_id'] for user in user_data],
+            stored_names={user['user_id']: user['display_name'] for user in user_data}
+        )
+
+        for i, user in enumerate(user_data, 1):
+            username = usernames[user['user_id']]
 
             if i <= 3:
                 rank_display = medals[i - 1]
@@ -448,7 +499,7 @@ class PaperTrading(commands.Cog):
                 inline=True
             )
 
-        embed.set_footer(text=f"Total traders: {len(accounts)} • Use !leaderboard <category> to switch")
+        embed.set_footer(text=f"Total traders: {len(board)} • Prices updated {board.age:.0f}s ago • Use !leaderboard <category> to switch")
 
         await ctx.send(embed=embed)
 
@@ -4,7 +4,7 @@ Watchlist commands cog - manage group stock watchlists
 import discord
 from discord.ext import commands
 import config
-from utils import database, stock_api, chart_generator, earnings
+from utils import database, stock_api, chart_generator, earnings, symbol_index, symbol_metadata
 
 
 class ChartTimelineView(discord.ui.View):
@@ -19,9 +19,9 @@ class ChartTimelineView(discord.ui.View):
         """Update chart with new period"""
         await interaction.response.defer()
 
-        chart_file = await chart_generator.generate_stock_chart(self.symbol, period)
+        chart_png = await chart_generator.generate_stock_chart(self.symbol, period)
 
-        if not chart_file:
+        if not chart_png:
             await interaction.followup.send("❌ Failed to generate chart", ephemeral=True)
             return
 
@@ -62,6 +62,7 @@ class ChartTimelineView(discord.ui.View):
         self.current_period = period
         new_view = ChartTimelineView(self.symbol, period)
 
+        chart_file = chart_generator.make_chart_file(chart_png, self.symbol, period)
         await interaction.message.edit(embed=embed, attachments=[chart_file], view=new_view)
 
     @discord.ui.button(label='1D', style=discord.ButtonStyle.secondary)
@@ -100,9 +101,11 @@ class Watchlist(commands.Cog):
         """
         symbol = symbol.upper()
 
-        await ctx.send(f"⏳ Validating {symbol}...")
-
-        stock_info = await stock_api.get_stock_info(symbol)
+        if symbol_index.is_known_invalid(symbol):
+            stock_info = None
+        else:
+            await ctx.send(f"⏳ Validating {symbol}...")
+            stock_info = await stock_api.get_stock_price(symbol)
 
         if not stock_info:
             error_msg = f"❌ Invalid stock symbol: `{symbol}`\n\n"
@@ -190,17 +193,15 @@ class Watchlist(commands.Cog):
 
         loading_msg = await ctx.send(f"⏳ Fetching data for {len(stocks)} stocks...")
 
-        import asyncio
         symbols = [stock['symbol'] for stock in stocks[:25]]
-
-        tasks = [stock_api.get_stock_info(symbol) for symbol in symbols]
-        results = await asyncio.gather(*tasks)
+        quotes = await stock_api.get_stock_infos(symbols)
 
         total_gainers = 0
         total_losers = 0
         stock_data = []
 
-        for stock_info in results:
+        for symbol in symbols:
+            stock_info = quotes.get(symbol)
             if stock_info:
                 stock_data.append(stock_info)
                 if stock_info['change'] > 0:
@@ -282,13 +283,13 @@ class Watchlist(commands.Cog):
         stock_info_task = stock_api.get_stock_info(symbol)
         chart_task = chart_generator.generate_stock_chart(symbol, period)
 
-        stock_info, chart_file = await asyncio.gather(stock_info_task, chart_task)
+        stock_info, chart_png = await asyncio.gather(stock_info_task, chart_task)
 
         if not stock_info:
             await loading_msg.edit(content=f"❌ Could not find information for `{symbol}`")
             return
 
-        if not chart_file:
+        if not chart_png:
             await loading_msg.edit(content=f"❌ Failed to generate chart for `{symbol}`")
             return
 
@@ -324,6 +325,7 @@ class Watchlist(commands.Cog):
         embed.set_footer(text=f"Viewing: {chart_generator.get_period_display(period)} • Data from Yahoo Finance")
 
         view = ChartTimelineView(symbol, period)
+        chart_file = chart_generator.make_chart_file(chart_png, symbol, period)
 
         await ctx.send(embed=embed, file=chart_file, view=view)
 
@@ -344,9 +346,8 @@ class Watchlist(commands.Cog):
             await ctx.send(f"❌ No earnings data available for `{symbol}`")
             return
 
-        # Get stock info for company name
-        stock_info = await stock_api.get_stock_info(symbol)
-        company_name = stock_info['name'] if stock_info else symbol
+        names = await symbol_metadata.get_display_names([symbol])
+        company_name = names[symbol]
 
         # Create embed
         if earnings_data['is_upcoming']:
@@ -441,13 +442,12 @@ class Watchlist(commands.Cog):
             color=discord.Color.blue()
         )
 
+        names = await symbol_metadata.get_display_names([e['symbol'] for e in upcoming_earnings[:15]])
+
         # Add each earnings date
         for earning in upcoming_earnings[:15]:  # Limit to 15
             date_str = earnings.format_earnings_date(earning['date'])
-
-            # Get stock info for company name
-            stock_info = await stock_api.get_stock_info(earning['symbol'])
-            company_name = stock_info['name'] if stock_info else earning['symbol']
+            company_name = names[earning['symbol']]
 
             value = f"**{company_name}**\n{date_str}"
 
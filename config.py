@@ -15,4 +15,62 @@ SNAPTRADE_CONSUMER_SECRET = os.getenv('SNAPTRADE_CONSUMER_SECRET')
 
 ALPHA_VANTAGE_API_KEY = os.getenv('ALPHA_VANTAGE_API_KEY', 'demo')
 
+# Market data source: 'yfinance', or 'fake' for deterministic offline data
+# with simulated latency (seconds per call) and error rate (0-1)
+MARKET_DATA_PROVIDER = os.getenv('MARKET_DATA_PROVIDER', 'yfinance')
+FAKE_MARKET_DATA_LATENCY = float(os.getenv('FAKE_MARKET_DATA_LATENCY', '0.05'))
+FAKE_MARKET_DATA_ERROR_RATE = float(os.getenv('FAKE_MARKET_DATA_ERROR_RATE', '0'))
+FAKE_MARKET_DATA_SEED = int(os.getenv('FAKE_MARKET_DATA_SEED', '0'))
+
+# Max number of concurrent blocking market data requests
+STOCK_FETCH_WORKERS = int(os.getenv('STOCK_FETCH_WORKERS', '8'))
+
+# Max number of symbols per batched quote request
+QUOTE_BATCH_SIZE = int(os.getenv('QUOTE_BATCH_SIZE', '50'))
+
+# Chart rendering worker processes and max renders queued for them
+CHART_RENDER_WORKERS = int(os.getenv('CHART_RENDER_WORKERS', '2'))
+CHART_RENDER_QUEUE_SIZE = int(os.getenv('CHART_RENDER_QUEUE_SIZE', '8'))
+
+# Memory budget for rendered charts, and an optional directory to spill them to
+CHART_CACHE_MAX_BYTES = int(os.getenv('CHART_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CHART_CACHE_DIR = os.getenv('CHART_CACHE_DIR', '')
+
+# Background quote poller cadence (seconds) and upstream budget in batched
+# quote requests per second (each request covers up to QUOTE_BATCH_SIZE symbols)
+POLLER_INTERVAL_OPEN = int(os.getenv('POLLER_INTERVAL_OPEN', '45'))
+POLLER_INTERVAL_CLOSED = int(os.getenv('POLLER_INTERVAL_CLOSED', '1800'))
+POLLER_REQUESTS_PER_SECOND = float(os.getenv('POLLER_REQUESTS_PER_SECOND', '2'))
+EARNINGS_REFRESH_INTERVAL = int(os.getenv('EARNINGS_REFRESH_INTERVAL', '3600'))
+SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', '3600'))
+
+# Days of hourly portfolio history to keep
+PORTFOLIO_HISTORY_RETENTION_DAYS = int(os.getenv('PORTFOLIO_HISTORY_RETENTION_DAYS', '365'))
+
+# Max number of concurrent earnings calendar fetches
+EARNINGS_FETCH_CONCURRENCY = int(os.getenv('EARNINGS_FETCH_CONCURRENCY', '4'))
+
+# Directory for the local OHLCV price history store
+HISTORY_STORE_DIR = os.getenv('HISTORY_STORE_DIR', 'data/history')
+
+# Transactions older than this many days are rolled into monthly summaries,
+# with the raw rows archived to a compressed 'collection', a 'file' or 'none'
+COMPACTION_AGE_DAYS = int(os.getenv('COMPACTION_AGE_DAYS', '90'))
+COMPACTION_ARCHIVE = os.getenv('COMPACTION_ARCHIVE', 'collection')
+COMPACTION_ARCHIVE_DIR = os.getenv('COMPACTION_ARCHIVE_DIR', 'data/archive')
+COMPACTION_INTERVAL = int(os.getenv('COMPACTION_INTERVAL', '86400'))
+
+# Local Prometheus metrics endpoint (port 0 disables it) and how often
+# event loop lag is sampled (seconds)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+LOOP_LAG_SAMPLE_INTERVAL = float(os.getenv('LOOP_LAG_SAMPLE_INTERVAL', '0.5'))
+
+# Event loop stall diagnostics: asyncio debug mode plus a watchdog that logs
+# the stack of whatever blocks the loop longer than the threshold (seconds),
+# with a summary by call site every report interval (seconds)
+LOOP_DIAGNOSTICS = os.getenv('LOOP_DIAGNOSTICS', 'false').lower() in ('1', 'true', 'yes')
+LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', '0.1'))
+LOOP_DIAGNOSTICS_REPORT_INTERVAL = int(os.getenv('LOOP_DIAGNOSTICS_REPORT_INTERVAL', '300'))
+
 BOT_COLOR = 0x3498db
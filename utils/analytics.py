@@ -0,0 +1,261 @@
+"""Trading analytics for paper trading accounts
+
+A user's transactions are pulled as per-symbol columns by one aggregation,
+then matched FIFO with vectorized NumPy instead of replaying trades one by
+one. The price-independent part (realized P/L, open lots) is cached per user
+and dropped whenever the user trades; unrealized P/L is priced on each
+request from the quote cache.
+"""
+import numpy as np
+
+from utils import metrics, paper_trading, stock_api
+from utils.cache import TTLCache
+from utils.constants import CacheSettings
+from utils.database import get_db
+
+SECONDS_PER_DAY = 86400
+
+_history_cache = TTLCache(max_size=CacheSettings.ANALYTICS_CACHE_MAX_SIZE,
+                          default_ttl=CacheSettings.ANALYTICS_TTL)
+metrics.register_cache('analytics', _history_cache)
+
+
+def to_seconds(timestamps):
+    """Convert a sequence of naive UTC datetimes to float epoch seconds"""
+    return np.asarray(timestamps, dtype="datetime64[ms]").astype(np.int64) / 1000.0
+
+
+async def _load_columns(user_id, guild_id, since=None):
+    """Get a user's transactions as columns grouped by symbol, oldest first
+
+    Only transactions at or after since are included when it is given.
+    """
+    db = get_db()
+    if db is None:
+        return {}
+
+    match = {"user_id": str(user_id), "guild_id": str(guild_id)}
+    if since is not None:
+        match["timestamp"] = {"$gte": since}
+
+    cursor = db.paper_transactions.aggregate([
+        {"$match": match},
+        {"$sort": {"timestamp": 1, "_id": 1}},
+        {"$group": {
+            "_id": "$symbol",
+            "side": {"$push": {"$cond": [{"$eq": ["$action", "BUY"]}, 1, -1]}},
+            "quantity": {"$push": "$quantity"},
+            "price": {"$push": "$price"},
+            "timestamp": {"$push": "$timestamp"}
+        }}
+    ])
+
+    columns = {}
+    async for doc in cursor:
+        columns[doc["_id"]] = {
+            "side": np.asarray(doc["side"], dtype=np.int8),
+            "quantity": np.asarray(doc["quantity"], dtype=np.float64),
+            "price": np.asarray(doc["price"], dtype=np.float64),
+            "timestamp": to_seconds(doc["timestamp"])
+        }
+
+    return columns
+
+
+async def _load_compacted(user_id, guild_id):
+    """Get a user's compacted history: the carry document and monthly summaries"""
+    db = get_db()
+    if db is None:
+        return {}, []
+
+    user_filter = {"user_id": str(user_id), "guild_id": str(guild_id)}
+    carry = await db.paper_transaction_carry.find_one(user_filter) or {}
+    summaries = [summary async for summary in db.paper_transaction_summaries.find(user_filter)]
+
+    return carry, summaries
+
+
+def carry_lots(carry):
+    """Get the open lots carried past compaction as columns keyed by symbol"""
+    lots = {}
+    for lot in carry.get("lots", []):
+        symbol_lots = lots.setdefault(lot["symbol"], {"quantity": [], "price": [], "timestamp": []})
+        symbol_lots["quantity"].append(lot["quantity"])
+        symbol_lots["price"].append(lot["price"])
+        symbol_lots["timestamp"].append(lot["timestamp"])
+
+    return {
+        symbol: {
+            "side": np.ones(len(cols["quantity"]), dtype=np.int8),
+            "quantity": np.asarray(cols["quantity"], dtype=np.float64),
+            "price": np.asarray(cols["price"], dtype=np.float64),
+            "timestamp": to_seconds(cols["timestamp"])
+        }
+        for symbol, cols in lots.items()
+    }
+
+
+def join_columns(first, second):
+    """Concatenate two sets of transaction columns (either may be None)"""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return {field: np.concatenate((first[field], second[field])) for field in first}
+
+
+def match_fifo(side, quantity, price, timestamp):
+    """Match a symbol's sells against its buys first in, first out
+
+    Buys are laid end to end as a running share count, and each sell
+    consumes the next slice of that count. The cost (and share-weighted buy
+    time) of any slice is read off cumulative sums with searchsorted, so
+    every sell is matched at once.
+    """
+    buys = side > 0
+    sells = ~buys
+
+    buy_qty = quantity[buys]
+    buy_price = price[buys]
+    buy_ts = timestamp[buys]
+    sell_qty = quantity[sells]
+
+    bought = np.concatenate(([0.0], np.cumsum(buy_qty)))
+    cost = np.concatenate(([0.0], np.cumsum(buy_qty * buy_price)))
+    buy_time = np.concatenate(([0.0], np.cumsum(buy_qty * buy_ts)))
+    sold = np.concatenate(([0.0], np.cumsum(sell_qty)))
+
+    def through(cumulative, per_share, shares):
+        """Value of cumulative at a share count part way through a lot"""
+        if not len(buy_qty):
+            return np.zeros_like(shares)
+        shares = np.clip(shares, 0.0, bought[-1])
+        lot = np.clip(np.searchsorted(bought, shares, side='right') - 1, 0, len(buy_qty) - 1)
+        return cumulative[lot] + (shares - bought[lot]) * per_share[lot]
+
+    basis = through(cost, buy_price, sold[1:]) - through(cost, buy_price, sold[:-1])
+    weighted_time = through(buy_time, buy_ts, sold[1:]) - through(buy_time, buy_ts, sold[:-1])
+
+    # Whatever has not been sold yet, from the partially sold lot onwards
+    remaining = np.clip(bought[1:] - sold[-1], 0.0, buy_qty)
+    open_lots = remaining > 0
+
+    return {
+        "realized": sell_qty * price[sells] - basis,
+        "holding_seconds": sell_qty * timestamp[sells] - weighted_time,
+        "sell_qty": sell_qty,
+        "open_quantity": remaining[open_lots],
+        "open_price": buy_price[open_lots],
+        "open_timestamp": buy_ts[open_lots]
+    }
+
+
+async def _compute_history(user_id, guild_id):
+    """Compute the price-independent stats for a user
+
+    Monthly summaries cover compacted history, and the open lots carried
+    past compaction are matched ahead of the recent transactions.
+    """
+    carry, summaries = await _load_compacted(user_id, guild_id)
+    columns = await _load_columns(user_id, guild_id, since=carry.get("compacted_through"))
+    lots = carry_lots(carry)
+
+    symbols = {}
+    trade_count = 0
+    closed_count = 0
+    wins = 0
+    volume = 0.0
+    holding_seconds = 0.0
+    sold_quantity = 0.0
+
+    for summary in summaries:
+        trade_count += summary["count"]
+        closed_count += summary["closed_count"]
+        wins += summary["wins"]
+        volume += summary["buy_volume"] + summary["sell_volume"]
+        holding_seconds += summary["holding_seconds"]
+        sold_quantity += summary["sold_quantity"]
+
+        for entry in summary["symbols"]:
+            symbol = symbols.setdefault(entry["symbol"], {"realized": 0.0, "open_quantity": 0.0, "open_cost": 0.0})
+            symbol["realized"] += entry["realized"]
+
+    for symbol in columns.keys() | lots.keys():
+        recent = columns.get(symbol)
+        if recent is not None:
+            trade_count += len(recent["side"])
+            volume += float(np.sum(recent["quantity"] * recent["price"]))
+
+        cols = join_columns(lots.get(symbol), recent)
+        matched = match_fifo(cols["side"], cols["quantity"], cols["price"], cols["timestamp"])
+
+        data = symbols.setdefault(symbol, {"realized": 0.0, "open_quantity": 0.0, "open_cost": 0.0})
+        data["realized"] += float(matched["realized"].sum())
+        data["open_quantity"] = float(matched["open_quantity"].sum())
+        data["open_cost"] = float(np.sum(matched["open_quantity"] * matched["open_price"]))
+
+        closed_count += len(matched["realized"])
+        wins += int(np.count_nonzero(matched["realized"] > 0))
+        holding_seconds += float(matched["holding_seconds"].sum())
+        sold_quantity += float(matched["sell_qty"].sum())
+
+    return {
+        "symbols": symbols,
+        "trade_count": trade_count,
+        "closed_count": closed_count,
+        "wins": wins,
+        "realized_pl": sum(data["realized"] for data in symbols.values()),
+        "avg_holding_days": holding_seconds / sold_quantity / SECONDS_PER_DAY if sold_quantity else 0.0,
+        "volume": volume
+    }
+
+
+async def get_user_stats(user_id, guild_id):
+    """Get trading stats for a user
+
+    Returns a dict with realized_pl, unrealized_pl, trade_count,
+    closed_count, win_rate, avg_holding_days, turnover and a per-symbol
+    breakdown sorted by total P/L.
+    """
+    key = (str(user_id), str(guild_id))
+    history = await _history_cache.get_or_fetch(key, lambda: _compute_history(user_id, guild_id))
+
+    open_symbols = sorted(symbol for symbol, data in history["symbols"].items() if data["open_quantity"] > 0)
+    quotes = await stock_api.get_stock_infos(open_symbols) if open_symbols else {}
+
+    by_symbol = []
+    unrealized_pl = 0.0
+
+    for symbol, data in history["symbols"].items():
+        unrealized = 0.0
+        if data["open_quantity"] > 0 and quotes.get(symbol):
+            unrealized = data["open_quantity"] * quotes[symbol]["price"] - data["open_cost"]
+        unrealized_pl += unrealized
+
+        by_symbol.append({
+            "symbol": symbol,
+            "realized": data["realized"],
+            "unrealized": unrealized,
+            "total": data["realized"] + unrealized
+        })
+
+    by_symbol.sort(key=lambda s: s["total"], reverse=True)
+    closed_count = history["closed_count"]
+
+    return {
+        "realized_pl": history["realized_pl"],
+        "unrealized_pl": unrealized_pl,
+        "trade_count": history["trade_count"],
+        "closed_count": closed_count,
+        "win_rate": (history["wins"] / closed_count * 100) if closed_count else 0.0,
+        "avg_holding_days": history["avg_holding_days"],
+        "turnover": history["volume"] / paper_trading.STARTING_BALANCE,
+        "by_symbol": by_symbol
+    }
+
+
+def _on_trade(user_id, guild_id, action, account):
+    _history_cache.invalidate((user_id, guild_id))
+
+
+paper_trading.add_trade_listener(_on_trade)
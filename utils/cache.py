@@ -0,0 +1,199 @@
+"""In-process caching utilities"""
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU cache with per-entry expiry and single-flight fetch coalescing
+
+    Concurrent get_or_fetch calls for the same key share one in-flight
+    fetch, so a burst of requests produces exactly one upstream call.
+
+    If weigher is given, entries are also evicted once the summed weight of
+    all values exceeds max_weight (e.g. weigher=len with a byte budget).
+    """
+
+    def __init__(self, max_size, default_ttl, max_weight=None, weigher=None):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        """Get a fresh cached value, counting the hit or miss"""
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return entry[1]
+
+    def peek(self, key, default=None):
+        """Get a fresh cached value without touching the hit/miss counters"""
+        entry = self._lookup(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entries if full"""
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        weight = self.weigher(value) if self.weigher else 0
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value, weight)
+        self.weight += weight
+
+        while self._entries and (
+            len(self._entries) > self.max_size
+            or (self.max_weight is not None and self.weight > self.max_weight)
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def invalidate(self, key):
+        """Drop a cached value
+
+        A fetch already in flight for the key may have read the old data, so
+        it is detached: its waiters still get its result, but it isn't
+        cached and later calls start a fresh fetch.
+        """
+        self._remove(key)
+        self._inflight.pop(key, None)
+
+    def clear(self):
+        """Drop all cached values and detach in-flight fetches"""
+        self._entries.clear()
+        self._inflight.clear()
+        self.weight = 0
+
+    async def get_or_fetch(self, key, fetch, ttl=None):
+        """Get a cached value or fetch it, coalescing concurrent fetches
+
+        fetch is a coroutine function taking no arguments. None results are
+        returned to every waiter but not cached. ttl may be a number or a
+        callable taking the fetched value.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetched(key, t, ttl))
+        else:
+            self.coalesced += 1
+
+        # Shield the shared fetch so one caller being cancelled does not
+        # cancel it for every other waiter
+        return await asyncio.shield(task)
+
+    async def get_many_or_fetch(self, keys, fetch_many, ttl=None):
+        """Get cached values for several keys, fetching the misses in one call
+
+        fetch_many is a coroutine function taking the list of missing keys
+        and returning a dict of key -> value. Keys already being fetched by
+        another caller are awaited instead of fetched again. Returns a dict
+        of key -> value (None for keys that could not be fetched).
+        """
+        results = {}
+        waiting = {}
+        missing = []
+
+        for key in dict.fromkeys(keys):
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                results[key] = entry[1]
+                continue
+
+            self.misses += 1
+            task = self._inflight.get(key)
+            if task is not None:
+                self.coalesced += 1
+                waiting[key] = task
+            else:
+                missing.append(key)
+
+        if missing:
+            batch = asyncio.ensure_future(fetch_many(missing))
+
+            for key in missing:
+                task = asyncio.ensure_future(self._pick(batch, key))
+                self._inflight[key] = task
+                task.add_done_callback(lambda t, key=key: self._on_fetched(key, t, ttl))
+                waiting[key] = task
+
+        if waiting:
+            values = await asyncio.shield(asyncio.gather(*waiting.values()))
+            results.update(zip(waiting.keys(), values))
+
+        return results
+
+    @staticmethod
+    async def _pick(batch, key):
+        return (await batch).get(key)
+
+    def _on_fetched(self, key, task, ttl):
+        if self._inflight.get(key) is not task:
+            # Invalidated while in flight
+            return
+        del self._inflight[key]
+
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        value = task.result()
+        if value is not None:
+            self.set(key, value, ttl(value) if callable(ttl) else ttl)
+
+    def stats(self):
+        """Get hit/miss counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'weight': self.weight,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'hit_ratio': (self.hits / lookups) if lookups else 0.0
+        }
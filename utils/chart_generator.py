@@ -1,103 +1,171 @@
-"""Stock chart generation utilities"""
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import yfinance as yf
+"""Stock chart generation utilities
+
+Price history comes from the local history store and charts are rendered
+in a dedicated process pool, so neither blocks the event loop.
+"""
+import asyncio
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+
 import discord
+import numpy as np
 
+import config
+from utils import chart_renderer, history_store, metrics, stock_api, symbol_index, symbol_metadata
+from utils.cache import TTLCache
+from utils.constants import ChartSettings, Timeouts
 
-async def generate_stock_chart(symbol, period="1mo"):
-    """Generate a stock price chart with moving averages"""
+_render_pool = None
+_render_slots = None
+
+# Rendered PNGs keyed by (symbol, period), bounded by total bytes
+_chart_cache = TTLCache(
+    max_size=ChartSettings.CACHE_MAX_ENTRIES,
+    default_ttl=ChartSettings.CACHE_TTLS['1d'],
+    max_weight=config.CHART_CACHE_MAX_BYTES,
+    weigher=lambda chart: len(chart['png'])
+)
+metrics.register_cache('charts', _chart_cache)
+
+
+def get_render_pool():
+    """Get the process pool used for chart rendering"""
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=config.CHART_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _render_pool
+
+
+def _get_render_slots():
+    global _render_slots
+    if _render_slots is None:
+        _render_slots = asyncio.Semaphore(config.CHART_RENDER_QUEUE_SIZE)
+    return _render_slots
+
+
+def shutdown_render_pool():
+    """Shut down the chart rendering pool (called by bot.py on exit)"""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+def _disk_cache_path(symbol, period, version):
+    return os.path.join(config.CHART_CACHE_DIR, f'{symbol}_{period}_{version}.png')
+
+
+def _read_disk_cache(symbol, period, version):
+    """Blocking read of a previously rendered chart, if one was spilled to disk"""
     try:
-        ticker = yf.Ticker(symbol)
+        with open(_disk_cache_path(symbol, period, version), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
 
-        interval_map = {
-            '1d': '5m',
-            '1mo': '1d',
-            '3mo': '1d',
-            'ytd': '1d',
-            '1y': '1wk',
-            '5y': '1mo'
-        }
 
-        interval = interval_map.get(period, '1d')
-        hist = ticker.history(period=period, interval=interval)
+def _write_disk_cache(symbol, period, version, png):
+    """Blocking write of a rendered chart, replacing older versions"""
+    os.makedirs(config.CHART_CACHE_DIR, exist_ok=True)
+    path = _disk_cache_path(symbol, period, version)
 
-        if hist.empty:
-            return None
+    for old_path in glob.glob(_disk_cache_path(glob.escape(symbol), period, '*')):
+        if old_path != path:
+            os.remove(old_path)
 
-        info = ticker.info
-        stock_name = info.get('longName', info.get('shortName', symbol))
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(png)
+    os.replace(tmp_path, path)
 
-        plt.style.use('dark_background')
-        fig, ax = plt.subplots(figsize=(12, 6), facecolor='#2b2d31')
-        ax.set_facecolor('#1e1f22')
 
-        ax.plot(hist.index, hist['Close'], color='#5865f2', linewidth=2, label='Price')
+async def _render(symbol, period):
+    bars = await history_store.get_history(symbol, period)
+    if bars is None:
+        return None
+
+    dates = history_store.to_datetimes(bars['ts'])
+    closes = np.array(bars['close'])
 
-        if period in ['3mo', 'ytd', '1y', '5y']:
-            if len(hist) >= 20:
-                ma20 = hist['Close'].rolling(window=20).mean()
-                ax.plot(hist.index, ma20, color='#57f287', linewidth=1.5,
-                       linestyle='--', alpha=0.7, label='20 MA')
+    # The timestamp of the last bar identifies the data a chart was drawn from
+    version = int(bars['ts'][-1])
 
-            if len(hist) >= 50:
-                ma50 = hist['Close'].rolling(window=50).mean()
-                ax.plot(hist.index, ma50, color='#fee75c', linewidth=1.5,
-                       linestyle='--', alpha=0.7, label='50 MA')
+    # The symbol becomes part of the file name, so only spill real tickers
+    use_disk_cache = bool(config.CHART_CACHE_DIR) and symbol_index.is_well_formed(symbol)
 
-        ax.set_title(f'{symbol} - {stock_name}', fontsize=16, fontweight='bold',
-                    color='white', pad=20)
-        ax.set_xlabel('Date', fontsize=12, color='#b5bac1')
-        ax.set_ylabel('Price (USD)', fontsize=12, color='#b5bac1')
+    if use_disk_cache:
+        png = await stock_api.run_blocking(_read_disk_cache, symbol, period, version)
+        if png is not None:
+            return {'version': version, 'png': png}
 
-        if period == '1d':
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-        elif period in ['1mo', '3mo', 'ytd']:
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
-        else:
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %Y'))
+    # Unknown symbols wait for the metadata fetch (usually already in
+    # flight for the same !stock command)
+    stock_name = symbol_metadata.display_name(symbol, await symbol_metadata.get_metadata(symbol))
 
-        plt.setp(ax.xaxis.get_majorticklabels(), rotation=45, ha='right')
+    # Bound the number of queued renders so a burst of chart requests
+    # waits here instead of piling up work in the pool
+    async with _get_render_slots():
+        loop = asyncio.get_running_loop()
+        png = await loop.run_in_executor(
+            get_render_pool(),
+            chart_renderer.render_chart,
+            symbol, stock_name, period, dates, closes
+        )
 
-        ax.grid(True, alpha=0.2, linestyle='--', linewidth=0.5)
+    if use_disk_cache:
+        try:
+            await stock_api.run_blocking(_write_disk_cache, symbol, period, version, png)
+        except OSError as e:
+            print(f"Error writing chart cache for {symbol}: {e}")
 
-        if period in ['3mo', 'ytd', '1y', '5y']:
-            ax.legend(loc='upper left', framealpha=0.9, facecolor='#2b2d31',
-                     edgecolor='#5865f2')
+    return {'version': version, 'png': png}
 
-        first_price = hist['Close'].iloc[0]
-        last_price = hist['Close'].iloc[-1]
-        change = last_price - first_price
-        change_pct = (change / first_price) * 100
 
-        color = '#57f287' if change >= 0 else '#ed4245'
-        sign = '+' if change >= 0 else ''
-        perf_text = f'{sign}${change:.2f} ({sign}{change_pct:.2f}%)'
+def get_chart_cache_stats():
+    """Get rendered chart cache hit/miss counters"""
+    return _chart_cache.stats()
 
-        ax.text(0.02, 0.98, f'Performance: {perf_text}',
-               transform=ax.transAxes, fontsize=12, verticalalignment='top',
-               color=color, fontweight='bold',
-               bbox=dict(boxstyle='round', facecolor='#2b2d31', alpha=0.8,
-                        edgecolor=color, linewidth=2))
 
-        plt.tight_layout()
+async def generate_stock_chart(symbol, period="1mo"):
+    """Generate a stock price chart with moving averages as PNG bytes
 
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, facecolor='#2b2d31')
-        buf.seek(0)
-        plt.close(fig)
+    Rendered charts are cached per (symbol, period) for about one bar
+    interval, so repeat requests skip both the history fetch and the render.
+    """
+    symbol = symbol.upper()
+    ttl = ChartSettings.CACHE_TTLS.get(period, ChartSettings.CACHE_TTLS['1d'])
 
-        file = discord.File(buf, filename=f'{symbol}_{period}.png')
-        return file
+    try:
+        chart = await asyncio.wait_for(
+            _chart_cache.get_or_fetch(
+                (symbol, period),
+                lambda: _render(symbol, period),
+                ttl=ttl
+            ),
+            timeout=Timeouts.CHART_GENERATION_TIMEOUT
+        )
+        return chart['png'] if chart else None
+
+    except asyncio.TimeoutError:
+        print(f"Timed out generating chart for {symbol}")
+        return None
 
     except Exception as e:
         print(f"Error generating chart for {symbol}: {e}")
         return None
 
 
+def make_chart_file(png, symbol, period):
+    """Wrap rendered chart bytes in a Discord attachment"""
+    return discord.File(BytesIO(png), filename=f'{symbol}_{period}.png')
+
+
 def get_period_display(period):
     """Get human-readable period name"""
     period_names = {
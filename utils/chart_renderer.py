@@ -0,0 +1,93 @@
+"""Stock chart rendering (runs inside the chart worker processes)
+
+Only uses matplotlib's object-oriented Figure API, so no pyplot global
+state is shared between renders.
+"""
+from io import BytesIO
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.dates as mdates
+import matplotlib.style
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from utils.constants import ChartSettings
+
+LONG_PERIODS = ['3mo', 'ytd', '1y', '5y']
+
+
+def moving_average(values, window):
+    """Get the trailing moving average, NaN until the window is full"""
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        result[window - 1:] = np.convolve(values, np.ones(window) / window, mode='valid')
+    return result
+
+
+def render_chart(symbol, stock_name, period, dates, closes):
+    """Render a price chart with moving averages and return PNG bytes"""
+    closes = np.asarray(closes, dtype=np.float64)
+
+    with matplotlib.style.context('dark_background'):
+        fig = Figure(figsize=(ChartSettings.CHART_WIDTH, ChartSettings.CHART_HEIGHT),
+                     facecolor='#2b2d31')
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_facecolor('#1e1f22')
+
+        ax.plot(dates, closes, color='#5865f2', linewidth=2, label='Price')
+
+        if period in LONG_PERIODS:
+            if len(closes) >= ChartSettings.MA_SHORT:
+                ax.plot(dates, moving_average(closes, ChartSettings.MA_SHORT), color='#57f287',
+                        linewidth=1.5, linestyle='--', alpha=0.7, label=f'{ChartSettings.MA_SHORT} MA')
+
+            if len(closes) >= ChartSettings.MA_LONG:
+                ax.plot(dates, moving_average(closes, ChartSettings.MA_LONG), color='#fee75c',
+                        linewidth=1.5, linestyle='--', alpha=0.7, label=f'{ChartSettings.MA_LONG} MA')
+
+        ax.set_title(f'{symbol} - {stock_name}', fontsize=16, fontweight='bold',
+                     color='white', pad=20)
+        ax.set_xlabel('Date', fontsize=12, color='#b5bac1')
+        ax.set_ylabel('Price (USD)', fontsize=12, color='#b5bac1')
+
+        if period == '1d':
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+        elif period in ['1mo', '3mo', 'ytd']:
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
+        else:
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %Y'))
+
+        for label in ax.xaxis.get_majorticklabels():
+            label.set_rotation(45)
+            label.set_horizontalalignment('right')
+
+        ax.grid(True, alpha=0.2, linestyle='--', linewidth=0.5)
+
+        if period in LONG_PERIODS:
+            ax.legend(loc='upper left', framealpha=0.9, facecolor='#2b2d31',
+                      edgecolor='#5865f2')
+
+        first_price = closes[0]
+        last_price = closes[-1]
+        change = last_price - first_price
+        change_pct = (change / first_price) * 100
+
+        color = '#57f287' if change >= 0 else '#ed4245'
+        sign = '+' if change >= 0 else ''
+        perf_text = f'{sign}${change:.2f} ({sign}{change_pct:.2f}%)'
+
+        ax.text(0.02, 0.98, f'Performance: {perf_text}',
+                transform=ax.transAxes, fontsize=12, verticalalignment='top',
+                color=color, fontweight='bold',
+                bbox=dict(boxstyle='round', facecolor='#2b2d31', alpha=0.8,
+                          edgecolor=color, linewidth=2))
+
+        fig.tight_layout()
+
+        buf = BytesIO()
+        fig.savefig(buf, format='png', dpi=ChartSettings.CHART_DPI, facecolor='#2b2d31')
+
+    return buf.getvalue()
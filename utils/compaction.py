@@ -0,0 +1,242 @@
+"""Transaction history compaction
+
+Transactions older than config.COMPACTION_AGE_DAYS are rolled up, a whole
+month at a time, into per-user monthly summaries in
+paper_transaction_summaries. Shares still held from those months are kept
+as open lots in paper_transaction_carry, so FIFO matching of later sells
+still works. The raw rows are then moved to a compressed archive (or
+dropped), which keeps paper_transactions small enough that history, counts
+and analytics only ever scan recent data.
+"""
+import asyncio
+import os
+import shutil
+import zlib
+from datetime import datetime, timedelta
+
+import bson
+import numpy as np
+from bson.binary import Binary
+from pymongo import ReplaceOne
+
+import config
+from utils import analytics, paper_trading
+from utils.database import get_db
+
+ARCHIVE_COLLECTION = 'collection'
+ARCHIVE_FILE = 'file'
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def month_start(timestamp):
+    """Get the first instant of a timestamp's month"""
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+def compaction_cutoff(now=None):
+    """Get the cutoff before which transactions are compacted
+
+    Always a month boundary, so a month is only ever compacted whole.
+    """
+    now = now or datetime.utcnow()
+    return month_start(now - timedelta(days=config.COMPACTION_AGE_DAYS))
+
+
+def _month_key(timestamp):
+    return timestamp.strftime("%Y-%m")
+
+
+def _archive_path(user_id, guild_id, month):
+    return os.path.join(config.COMPACTION_ARCHIVE_DIR, str(guild_id), str(user_id), f"{month}.bson.z")
+
+
+def _compress_rows(rows):
+    return zlib.compress(bson.encode({"rows": rows}), 6)
+
+
+def decompress_rows(data):
+    """Get the transactions back out of an archived blob"""
+    return bson.decode(zlib.decompress(data))["rows"]
+
+
+def _write_archive_files(user_id, guild_id, blobs):
+    for month, data in blobs.items():
+        path = _archive_path(user_id, guild_id, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def _summarize(rows, carry):
+    """Summarize a user's transactions by month
+
+    Returns (summaries, lots): summary fields keyed by month, and the open
+    lots left after matching every sell in rows against carry and rows.
+    """
+    summaries = {}
+    by_symbol = {}
+
+    for row in rows:
+        month = _month_key(row["timestamp"])
+        summary = summaries.setdefault(month, {
+            "count": 0, "buy_count": 0, "sell_count": 0,
+            "buy_volume": 0.0, "sell_volume": 0.0,
+            "realized_pl": 0.0, "closed_count": 0, "wins": 0,
+            "holding_seconds": 0.0, "sold_quantity": 0.0, "symbols": {}
+        })
+        summary["count"] += 1
+        if row["action"] == "BUY":
+            summary["buy_count"] += 1
+            summary["buy_volume"] += row["total"]
+        else:
+            summary["sell_count"] += 1
+            summary["sell_volume"] += row["total"]
+
+        by_symbol.setdefault(row["symbol"], []).append(row)
+
+    lots = []
+    carried = analytics.carry_lots(carry)
+
+    for symbol in by_symbol.keys() | carried.keys():
+        symbol_rows = by_symbol.get(symbol, [])
+        recent = None
+        if symbol_rows:
+            recent = {
+                "side": np.asarray([1 if r["action"] == "BUY" else -1 for r in symbol_rows], dtype=np.int8),
+                "quantity": np.asarray([r["quantity"] for r in symbol_rows], dtype=np.float64),
+                "price": np.asarray([r["price"] for r in symbol_rows], dtype=np.float64),
+                "timestamp": analytics.to_seconds([r["timestamp"] for r in symbol_rows])
+            }
+
+        cols = analytics.join_columns(carried.get(symbol), recent)
+        matched = analytics.match_fifo(cols["side"], cols["quantity"], cols["price"], cols["timestamp"])
+
+        sells = [r for r in symbol_rows if r["action"] != "BUY"]
+        for row, realized, holding, quantity in zip(sells, matched["realized"], matched["holding_seconds"],
+                                                   matched["sell_qty"]):
+            summary = summaries[_month_key(row["timestamp"])]
+            summary["realized_pl"] += float(realized)
+            summary["closed_count"] += 1
+            summary["wins"] += int(realized > 0)
+            summary["holding_seconds"] += float(holding)
+            summary["sold_quantity"] += float(quantity)
+            summary["symbols"][symbol] = summary["symbols"].get(symbol, 0.0) + float(realized)
+
+        for quantity, price, timestamp in zip(matched["open_quantity"], matched["open_price"],
+                                              matched["open_timestamp"]):
+            lots.append({
+                "symbol": symbol,
+                "quantity": float(quantity),
+                "price": float(price),
+                "timestamp": EPOCH + timedelta(seconds=float(timestamp))
+            })
+
+    for summary in summaries.values():
+        summary["symbols"] = [{"symbol": symbol, "realized": realized}
+                              for symbol, realized in summary["symbols"].items()]
+
+    return summaries, lots
+
+
+async def compact_user(user_id, guild_id, cutoff):
+    """Compact one user's transactions older than cutoff
+
+    Returns the number of transactions compacted. Summaries and archives
+    are rewritten whole for each month, and the carry document (with the
+    new compacted_through) is written before any rows are deleted, so a run
+    interrupted at any point can simply be repeated.
+    """
+    db = get_db()
+    if db is None:
+        return 0
+
+    user_filter = {"user_id": str(user_id), "guild_id": str(guild_id)}
+    carry = await db.paper_transaction_carry.find_one(user_filter) or {}
+    compacted_through = carry.get("compacted_through")
+
+    if compacted_through is not None and compacted_through >= cutoff:
+        # Already compacted, only a previous run's leftover rows remain
+        await db.paper_transactions.delete_many(dict(user_filter, timestamp={"$lt": compacted_through}))
+        return 0
+
+    query = dict(user_filter, timestamp={"$lt": cutoff})
+    if compacted_through is not None:
+        query["timestamp"]["$gte"] = compacted_through
+
+    rows = [row async for row in db.paper_transactions.find(query).sort([("timestamp", 1), ("_id", 1)])]
+    if not rows:
+        return 0
+
+    summaries, lots = _summarize(rows, carry)
+
+    await db.paper_transaction_summaries.bulk_write([
+        ReplaceOne(dict(user_filter, month=month), dict(user_filter, month=month, **summary), upsert=True)
+        for month, summary in summaries.items()
+    ], ordered=False)
+
+    if config.COMPACTION_ARCHIVE in (ARCHIVE_COLLECTION, ARCHIVE_FILE):
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(_month_key(row["timestamp"]), []).append(row)
+        blobs = {month: _compress_rows(month_rows) for month, month_rows in by_month.items()}
+
+        if config.COMPACTION_ARCHIVE == ARCHIVE_FILE:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, _write_archive_files, user_id, guild_id, blobs)
+        else:
+            await db.paper_transactions_archive.bulk_write([
+                ReplaceOne(dict(user_filter, month=month), dict(
+                    user_filter, month=month, count=len(by_month[month]), data=Binary(data)
+                ), upsert=True)
+                for month, data in blobs.items()
+            ], ordered=False)
+
+    await db.paper_transaction_carry.replace_one(
+        user_filter,
+        dict(user_filter, compacted_through=cutoff, lots=lots),
+        upsert=True
+    )
+
+    await db.paper_transactions.delete_many(dict(user_filter, timestamp={"$lt": cutoff}))
+
+    return len(rows)
+
+
+async def compact_transactions(now=None):
+    """Compact every user's transactions older than the compaction cutoff"""
+    db = get_db()
+    if db is None:
+        return 0
+
+    cutoff = compaction_cutoff(now)
+
+    cursor = db.paper_transactions.aggregate([
+        {"$match": {"timestamp": {"$lt": cutoff}}},
+        {"$group": {"_id": {"user_id": "$user_id", "guild_id": "$guild_id"}}}
+    ])
+    users = [doc["_id"] async for doc in cursor]
+
+    compacted = 0
+    for user in users:
+        try:
+            compacted += await compact_user(user["user_id"], user["guild_id"], cutoff)
+        except Exception as e:
+            print(f"Error compacting transactions for user {user['user_id']}: {e}")
+
+    if compacted:
+        print(f"Compacted {compacted} transactions for {len(users)} users")
+
+    return compacted
+
+
+def _on_trade(user_id, guild_id, action, account):
+    # Database tiers are cleared by reset_account; archive files live here
+    if action == "RESET" and config.COMPACTION_ARCHIVE == ARCHIVE_FILE:
+        path = os.path.dirname(_archive_path(user_id, guild_id, "_"))
+        asyncio.get_running_loop().run_in_executor(None, shutil.rmtree, path, True)
+
+
+paper_trading.add_trade_listener(_on_trade)
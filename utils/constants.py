@@ -8,8 +8,10 @@ class Limits:
     MAX_PORTFOLIO_POSITIONS_DISPLAY = 10
     MAX_TRANSACTIONS_DISPLAY = 50
     DEFAULT_TRANSACTIONS_DISPLAY = 10
+    MAX_TRANSACTIONS_PAGE_SIZE = 24  # Embeds hold at most 25 fields
     MAX_LEADERBOARD_DISPLAY = 10
     MAX_EARNINGS_DISPLAY = 15
+    MAX_METRICS_ROWS = 8
 
 
 class Timeouts:
@@ -25,6 +27,26 @@ class Timeouts:
     CHART_COOLDOWN = 5
 
 
+class CacheSettings:
+    """In-process cache sizes and lifetimes in seconds"""
+    QUOTE_CACHE_MAX_SIZE = 2000
+    QUOTE_TTL_MARKET_OPEN = 60
+    QUOTE_TTL_MIN_CLOSED = 300
+    EARNINGS_TTL = 7 * 86400
+    EARNINGS_TTL_NO_UPCOMING = 86400
+    METADATA_TTL = 30 * 86400
+    INVALID_SYMBOL_TTL = 6 * 3600
+    INVALID_SYMBOL_CACHE_MAX_SIZE = 10000
+    INVALID_SYMBOL_STRIKES = 3  # Empty answers in a row before a known-valid symbol is dropped
+    DEMOTED_SYMBOL_TTL = 300
+    SNAPSHOT_MAX_AGE = 300
+    USER_NAME_CACHE_MAX_SIZE = 10000
+    USER_NAME_TTL = 3600
+    ANALYTICS_CACHE_MAX_SIZE = 5000
+    ANALYTICS_TTL = 86400
+    LEADERBOARD_REBUILD_INTERVAL = 600
+
+
 class TradingDefaults:
     """Paper trading default values"""
     STARTING_BALANCE = 100_000.00
@@ -55,6 +77,19 @@ class ChartSettings:
         '5y': '1mo'
     }
 
+    # How long a rendered chart is reused, roughly one bar interval
+    CACHE_TTLS = {
+        '1d': 300,
+        '5d': 900,
+        '1mo': 1800,
+        '3mo': 3600,
+        '6mo': 3600,
+        'ytd': 3600,
+        '1y': 21600,
+        '5y': 86400
+    }
+    CACHE_MAX_ENTRIES = 500
+
     CHART_WIDTH = 12
     CHART_HEIGHT = 6
     CHART_DPI = 100
@@ -1,6 +1,7 @@
 """Database utility functions for MongoDB operations"""
 
 _db = None
+_supports_transactions = False
 
 
 def set_db(database):
@@ -14,6 +15,23 @@ def get_db():
     return _db
 
 
+async def detect_transaction_support(client):
+    """Check whether the deployment supports multi-document transactions
+
+    MongoDB only allows them on replica set members and mongos routers, not
+    on a standalone mongod.
+    """
+    global _supports_transactions
+    hello = await client.admin.command('hello')
+    _supports_transactions = bool(hello.get('setName')) or hello.get('msg') == 'isdbgrid'
+    return _supports_transactions
+
+
+def supports_transactions():
+    """Check whether the connected deployment supports transactions"""
+    return _supports_transactions
+
+
 async def get_watchlist(guild_id):
     """Get the watchlist for a specific guild"""
     db = get_db()
@@ -82,3 +100,15 @@ async def get_watchlist_stocks(guild_id):
         return []
 
     return watchlist.get("stocks", [])
+
+
+async def get_tracked_symbols():
+    """Get every symbol on any watchlist or held in any paper trading account"""
+    db = get_db()
+    if db is None:
+        return []
+
+    watched = await db.watchlists.distinct("stocks.symbol")
+    held = await db.paper_accounts.distinct("positions.symbol")
+
+    return sorted(set(watched) | set(held))
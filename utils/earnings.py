@@ -1,55 +1,173 @@
-"""Earnings calendar utilities"""
-import yfinance as yf
+"""Earnings calendar utilities
+
+Each symbol's earnings schedule is cached in the earnings_calendar
+collection (or in memory without a database). Earnings dates change at
+most a few times a quarter, so a schedule is only re-fetched when it is
+old or its next earnings date has passed.
+"""
+import asyncio
 from datetime import datetime, timedelta
 
+from pymongo import UpdateOne
 
-async def get_stock_earnings(symbol):
-    """Get earnings information for a stock"""
-    try:
-        ticker = yf.Ticker(symbol)
-        earnings_dates = ticker.earnings_dates
+import config
+from utils import market_data, stock_api
+from utils.constants import CacheSettings
+from utils.database import get_db
+
+_memory_cache = {}
+_fetch_slots = None
+
+
+def _get_fetch_slots():
+    global _fetch_slots
+    if _fetch_slots is None:
+        _fetch_slots = asyncio.Semaphore(config.EARNINGS_FETCH_CONCURRENCY)
+    return _fetch_slots
+
+
+def _next_date(schedule, now):
+    return next((e['date'] for e in schedule if e['date'] > now), None)
+
+
+def _is_fresh(doc, now):
+    """Check if a cached schedule can be served without re-fetching"""
+    if doc['next_date'] is not None and doc['next_date'] <= now:
+        return False
+
+    max_age = CacheSettings.EARNINGS_TTL if doc['next_date'] else CacheSettings.EARNINGS_TTL_NO_UPCOMING
+    return now - doc['fetched_at'] < timedelta(seconds=max_age)
 
-        if earnings_dates is None or earnings_dates.empty:
+
+async def _load_docs(symbols):
+    db = get_db()
+    if db is None:
+        return {symbol: _memory_cache[symbol] for symbol in symbols if symbol in _memory_cache}
+
+    cursor = db.earnings_calendar.find({"symbol": {"$in": symbols}}, {"_id": 0})
+    return {doc['symbol']: doc async for doc in cursor}
+
+
+async def _store_docs(docs):
+    db = get_db()
+    if db is None:
+        _memory_cache.update((doc['symbol'], doc) for doc in docs)
+        return
+
+    if docs:
+        await db.earnings_calendar.bulk_write([
+            UpdateOne({"symbol": doc['symbol']}, {"$set": doc}, upsert=True)
+            for doc in docs
+        ], ordered=False)
+
+
+async def _fetch_doc(symbol, now):
+    async with _get_fetch_slots():
+        try:
+            schedule = await stock_api.run_blocking(market_data.get_provider().get_earnings_dates, symbol)
+        except Exception as e:
+            print(f"Error fetching earnings for {symbol}: {e}")
             return None
 
-        import pytz
-        today = datetime.now(pytz.UTC)
-        future_earnings = earnings_dates[earnings_dates.index > today]
-
-        if future_earnings.empty:
-            latest_earnings = earnings_dates.iloc[0]
-            is_upcoming = False
-            earnings_date = latest_earnings.name
-        else:
-            latest_earnings = future_earnings.iloc[-1]
-            is_upcoming = True
-            earnings_date = latest_earnings.name
-
-        eps_estimate = latest_earnings.get('EPS Estimate', None)
-        eps_actual = latest_earnings.get('Reported EPS', None)
-
-        return {
-            'symbol': symbol.upper(),
-            'date': earnings_date,
-            'is_upcoming': is_upcoming,
-            'eps_estimate': eps_estimate,
-            'eps_actual': eps_actual
-        }
-
-    except Exception as e:
-        print(f"Error fetching earnings for {symbol}: {e}")
+    return {
+        'symbol': symbol,
+        'schedule': schedule,
+        'next_date': _next_date(schedule, now),
+        'fetched_at': now
+    }
+
+
+async def _refresh_docs(symbols, now):
+    """Fetch schedules concurrently (bounded) and store the successful ones"""
+    fetched = await asyncio.gather(*(_fetch_doc(symbol, now) for symbol in symbols))
+    docs = [doc for doc in fetched if doc is not None]
+    await _store_docs(docs)
+    return {doc['symbol']: doc for doc in docs}
+
+
+async def get_earnings_schedules(symbols):
+    """Get cached earnings schedules, re-fetching only the stale ones
+
+    Returns a dict of symbol -> list of {date, eps_estimate, eps_actual}
+    sorted oldest first. Dates are naive UTC datetimes.
+    """
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    now = datetime.utcnow()
+
+    docs = await _load_docs(symbols)
+    stale = [symbol for symbol in symbols if symbol not in docs or not _is_fresh(docs[symbol], now)]
+
+    if stale:
+        docs.update(await _refresh_docs(stale, now))
+
+    return {symbol: docs[symbol]['schedule'] for symbol in symbols if symbol in docs}
+
+
+async def refresh_due_earnings():
+    """Re-fetch only the cached schedules whose next date has passed or that have aged out
+
+    Returns the number of symbols refreshed.
+    """
+    db = get_db()
+    now = datetime.utcnow()
+
+    if db is None:
+        due = [symbol for symbol, doc in _memory_cache.items() if not _is_fresh(doc, now)]
+    else:
+        no_upcoming_cutoff = now - timedelta(seconds=CacheSettings.EARNINGS_TTL_NO_UPCOMING)
+        cutoff = now - timedelta(seconds=CacheSettings.EARNINGS_TTL)
+        cursor = db.earnings_calendar.find({
+            "$or": [
+                {"next_date": {"$lte": now}},
+                {"next_date": None, "fetched_at": {"$lt": no_upcoming_cutoff}},
+                {"fetched_at": {"$lt": cutoff}}
+            ]
+        }, {"symbol": 1})
+        due = [doc['symbol'] async for doc in cursor]
+
+    if due:
+        await _refresh_docs(due, now)
+
+    return len(due)
+
+
+def _summarize(symbol, schedule, now):
+    """Pick the next upcoming earnings, or the latest reported one"""
+    if not schedule:
         return None
 
+    upcoming = [e for e in schedule if e['date'] > now]
+    if upcoming:
+        earnings = upcoming[0]
+        is_upcoming = True
+    else:
+        earnings = schedule[-1]
+        is_upcoming = False
+
+    return {
+        'symbol': symbol,
+        'date': earnings['date'],
+        'is_upcoming': is_upcoming,
+        'eps_estimate': earnings['eps_estimate'],
+        'eps_actual': earnings['eps_actual']
+    }
+
+
+async def get_stock_earnings(symbol):
+    """Get earnings information for a stock"""
+    symbol = symbol.upper()
+    schedules = await get_earnings_schedules([symbol])
+    return _summarize(symbol, schedules.get(symbol), datetime.utcnow())
+
 
 async def get_watchlist_earnings(symbols):
     """Get earnings calendar for multiple stocks"""
-    import asyncio
-
-    tasks = [get_stock_earnings(symbol) for symbol in symbols]
-    results = await asyncio.gather(*tasks)
+    schedules = await get_earnings_schedules(symbols)
+    now = datetime.utcnow()
 
     upcoming_earnings = []
-    for earnings in results:
+    for symbol, schedule in schedules.items():
+        earnings = _summarize(symbol, schedule, now)
         if earnings and earnings['is_upcoming']:
             upcoming_earnings.append(earnings)
 
@@ -0,0 +1,234 @@
+"""Deterministic synthetic market data for offline load tests
+
+Every symbol gets a reproducible daily random walk derived from its name
+and the provider seed, so the same symbol always has the same price on the
+same day. Calls sleep for a configurable latency (they run on a worker
+thread, like real network calls) and can fail at a configurable rate.
+"""
+import random
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils import market_hours
+from utils.market_data import MarketDataProvider, raw_quote_from_frame
+
+# First day of the synthetic price walk
+ANCHOR_DATE = date(2015, 1, 1)
+
+# Regular session as (hour, minute) in exchange-local time
+SESSION_OPEN = (9, 30)
+SESSION_CLOSE = (16, 0)
+
+INTRADAY_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60}
+
+PERIOD_DAYS = {'1d': 1, '5d': 7, '1mo': 31, '3mo': 92, '6mo': 183, '1y': 366,
+               '2y': 731, '5y': 1827, '10y': 3653}
+
+RESAMPLE_RULES = {'1wk': 'W-MON', '1mo': 'MS'}
+
+
+class FakeMarketDataError(ConnectionError):
+    """Injected upstream failure"""
+
+
+class FakeProvider(MarketDataProvider):
+    """Synthetic market data with latency and error injection
+
+    Symbols in invalid_symbols (and anything that isn't a plausible ticker)
+    behave like unknown tickers: quotes and history come back empty.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, invalid_symbols=('INVALID',)):
+        super().__init__()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.invalid_symbols = {symbol.upper() for symbol in invalid_symbols}
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._walks = {}
+        self._sessions = None
+
+    def _symbol_seed(self, symbol, *extra):
+        key = '|'.join(str(part) for part in (self.seed, symbol) + extra)
+        return zlib.crc32(key.encode())
+
+    def _is_valid(self, symbol):
+        stripped = symbol.replace('.', '').replace('-', '')
+        return symbol not in self.invalid_symbols and stripped.isalnum() and len(stripped) <= 10
+
+    def _simulate_upstream(self):
+        """Sleep for the configured latency and maybe raise an injected error"""
+        with self._random_lock:
+            jitter = self._random.uniform(0.5, 1.5)
+            fail = self._random.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency * jitter)
+
+        if fail:
+            raise FakeMarketDataError("Injected market data error")
+
+    def _session_index(self, last_day):
+        """Get the trading days from ANCHOR_DATE through last_day, shared by all symbols"""
+        sessions = self._sessions
+        if sessions is None or sessions[0] != last_day:
+            days = pd.bdate_range(ANCHOR_DATE, last_day).tz_localize(market_hours.MARKET_TZ)
+            sessions = self._sessions = (last_day, days)
+        return sessions[1]
+
+    def _daily_frame(self, symbol):
+        """Get the symbol's daily walk from ANCHOR_DATE through the latest session"""
+        now = market_hours.now_in_market_tz()
+        # Today's bar only exists once the session has opened
+        last_day = now.date() if (now.hour, now.minute) >= SESSION_OPEN else now.date() - timedelta(days=1)
+
+        cached = self._walks.get(symbol)
+        if cached is not None and cached[0] == last_day:
+            return cached[1]
+
+        days = self._session_index(last_day)
+        rng = np.random.default_rng(self._symbol_seed(symbol))
+        start_price = 20 + rng.random() * 480
+        returns = rng.normal(0.0003, 0.018, len(days))
+        closes = start_price * np.exp(np.cumsum(returns))
+        opens = np.concatenate(([start_price], closes[:-1])) * np.exp(rng.normal(0, 0.004, len(days)))
+        spread = np.abs(rng.normal(0, 0.01, len(days)))
+
+        frame = pd.DataFrame({
+            'Open': opens,
+            'High': np.maximum(opens, closes) * (1 + spread),
+            'Low': np.minimum(opens, closes) * (1 - spread),
+            'Close': closes,
+            'Volume': rng.integers(100_000, 20_000_000, len(days)).astype(float)
+        }, index=days)
+
+        self._walks[symbol] = (last_day, frame)
+        return frame
+
+    def _intraday_frame(self, symbol, daily, minutes):
+        """Interpolate intraday bars between each day's open and close"""
+        now = market_hours.now_in_market_tz()
+        frames = []
+
+        for day, bar in daily.iterrows():
+            session_open = day.replace(hour=SESSION_OPEN[0], minute=SESSION_OPEN[1])
+            session_close = day.replace(hour=SESSION_CLOSE[0], minute=SESSION_CLOSE[1])
+            index = pd.date_range(session_open, session_close, freq=f'{minutes}min', inclusive='left')
+            index = index[index <= now]
+            if not len(index):
+                continue
+
+            rng = np.random.default_rng(self._symbol_seed(symbol, day.date(), minutes))
+            steps = len(index)
+            path = np.linspace(bar['Open'], bar['Close'], steps + 1)
+            path[1:-1] *= np.exp(rng.normal(0, 0.002, steps - 1))
+            closes = path[1:]
+            opens = path[:-1]
+            spread = np.abs(rng.normal(0, 0.001, steps))
+
+            frames.append(pd.DataFrame({
+                'Open': opens,
+                'High': np.maximum(opens, closes) * (1 + spread),
+                'Low': np.minimum(opens, closes) * (1 - spread),
+                'Close': closes,
+                'Volume': np.full(steps, bar['Volume'] / steps).round()
+            }, index=index))
+
+        if not frames:
+            return daily.iloc[0:0]
+        return pd.concat(frames)
+
+    def _get_quote(self, symbol):
+        self._simulate_upstream()
+        symbol = symbol.upper()
+        if not self._is_valid(symbol):
+            return None
+
+        quote = raw_quote_from_frame(self._daily_frame(symbol).iloc[-5:])
+        if quote is not None:
+            info = self._info(symbol)
+            quote.update(currency=info['currency'], long_name=info['longName'], short_name=info['shortName'])
+        return quote
+
+    def _get_quotes(self, symbols):
+        self._simulate_upstream()
+        return {
+            symbol: raw_quote_from_frame(self._daily_frame(symbol.upper()).iloc[-5:])
+            if self._is_valid(symbol.upper()) else None
+            for symbol in symbols
+        }
+
+    def _get_history(self, symbol, interval, period=None, start=None):
+        self._simulate_upstream()
+        symbol = symbol.upper()
+        if not self._is_valid(symbol):
+            return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+
+        daily = self._daily_frame(symbol)
+        now = market_hours.now_in_market_tz()
+
+        if start is not None:
+            since = pd.Timestamp(start).tz_localize(market_hours.MARKET_TZ)
+        elif period == 'ytd':
+            since = pd.Timestamp(datetime(now.year, 1, 1)).tz_localize(market_hours.MARKET_TZ)
+        elif period == 'max':
+            since = daily.index[0]
+        else:
+            since = pd.Timestamp(now.replace(hour=0, minute=0, second=0, microsecond=0)) \
+                - timedelta(days=PERIOD_DAYS.get(period, 31))
+        daily = daily[daily.index >= since.normalize()]
+
+        if interval in INTRADAY_MINUTES:
+            return self._intraday_frame(symbol, daily, INTRADAY_MINUTES[interval])
+
+        if interval in RESAMPLE_RULES:
+            return daily.resample(RESAMPLE_RULES[interval], label='left', closed='left').agg({
+                'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'
+            }).dropna()
+
+        return daily
+
+    def _get_earnings_dates(self, symbol):
+        self._simulate_upstream()
+        symbol = symbol.upper()
+        if not self._is_valid(symbol):
+            return []
+
+        rng = np.random.default_rng(self._symbol_seed(symbol, 'earnings'))
+        today = datetime.utcnow()
+        first = datetime(today.year - 1, 1, 1) + timedelta(days=int(rng.integers(20, 50)))
+
+        schedule = []
+        for quarter in range(12):
+            when = first + timedelta(days=91 * quarter, hours=20)
+            estimate = round(float(rng.normal(1.5, 0.8)), 2)
+            actual = round(estimate + float(rng.normal(0.05, 0.2)), 2) if when < today else None
+            schedule.append({'date': when, 'eps_estimate': estimate, 'eps_actual': actual})
+
+        return schedule
+
+    def _info(self, symbol):
+        rng = np.random.default_rng(self._symbol_seed(symbol, 'info'))
+        canadian = symbol.endswith('.TO')
+        return {
+            'longName': f"{symbol.split('.')[0].title()} Holdings Inc.",
+            'shortName': f"{symbol.split('.')[0].title()} Holdings",
+            'currency': 'CAD' if canadian else 'USD',
+            'exchange': 'TOR' if canadian else 'NMS',
+            'sharesOutstanding': int(rng.integers(50_000_000, 5_000_000_000))
+        }
+
+    def _get_info(self, symbol):
+        self._simulate_upstream()
+        symbol = symbol.upper()
+        if not self._is_valid(symbol):
+            return {}
+        return self._info(symbol)
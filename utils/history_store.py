@@ -0,0 +1,245 @@
+"""Local OHLCV price history store
+
+Bars are kept per (symbol, interval) as a structured NumPy array saved to
+.npy and memory-mapped on read. Timestamps are the exchange's wall-clock
+time as naive epoch seconds, so session dates and chart labels match what
+Yahoo shows. Only the bars since the last stored one are downloaded when
+the store is refreshed.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import config
+from utils import market_data, market_hours, stock_api, symbol_index
+
+BAR_DTYPE = np.dtype([
+    ('ts', 'i8'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'f8'),
+])
+
+# Bar interval used for each chart period
+PERIOD_INTERVALS = {
+    '1d': '5m',
+    '1mo': '1d',
+    '3mo': '1d',
+    'ytd': '1d',
+    '1y': '1wk',
+    '5y': '1mo'
+}
+
+# Calendar days covered by each period ('1d' and '5d' count sessions instead)
+PERIOD_DAYS = {
+    '1mo': 31,
+    '3mo': 92,
+    '6mo': 183,
+    '1y': 366,
+    '5y': 1827
+}
+
+# Sessions covered by intraday-style periods
+PERIOD_SESSIONS = {
+    '1d': 1,
+    '5d': 5
+}
+
+# Seconds before the stored tail is considered stale and refreshed
+INTERVAL_REFRESH = {
+    '5m': 300,
+    '1d': 900,
+    '1wk': 3600,
+    '1mo': 6 * 3600
+}
+
+# Days of bars kept per interval, matching the longest period that uses it
+INTERVAL_RETENTION_DAYS = {
+    '5m': 14,
+    '1d': 400,
+    '1wk': 400,
+    '1mo': 1900
+}
+
+EPOCH = datetime(1970, 1, 1)
+
+# (symbol, interval) -> [refresh lock, tasks using it], dropped when unused
+_locks = {}
+
+
+def get_interval(period):
+    """Get the bar interval used to chart a period"""
+    return PERIOD_INTERVALS.get(period, '1d')
+
+
+def _market_now():
+    """Get the exchange's current wall-clock time as a naive datetime"""
+    return market_hours.now_in_market_tz().replace(tzinfo=None)
+
+
+def _to_ts(dt):
+    return int((dt - EPOCH).total_seconds())
+
+
+def _from_ts(ts):
+    return EPOCH + timedelta(seconds=ts)
+
+
+def to_datetimes(ts):
+    """Convert stored timestamps to datetime64 values for plotting"""
+    return np.asarray(ts).astype('datetime64[s]')
+
+
+def _period_start(period, now):
+    """Get the earliest wall-clock time a period needs, or None for session periods"""
+    if period == 'ytd':
+        return datetime(now.year, 1, 1)
+    if period in PERIOD_DAYS:
+        return now - timedelta(days=PERIOD_DAYS[period])
+    return None
+
+
+def _paths(symbol, interval):
+    base = os.path.join(config.HISTORY_STORE_DIR, f'{symbol}_{interval}')
+    return f'{base}.npy', f'{base}.json'
+
+
+def _load(symbol, interval):
+    """Load stored bars (memory-mapped) and their metadata"""
+    data_path, meta_path = _paths(symbol, interval)
+    try:
+        bars = np.load(data_path, mmap_mode='r')
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None, None
+
+    return bars, meta
+
+
+def _save(symbol, interval, bars, meta):
+    """Atomically replace stored bars and metadata"""
+    os.makedirs(config.HISTORY_STORE_DIR, exist_ok=True)
+    data_path, meta_path = _paths(symbol, interval)
+
+    tmp_data_path = f'{data_path}.tmp.npy'
+    np.save(tmp_data_path, bars)
+    os.replace(tmp_data_path, data_path)
+
+    tmp_meta_path = f'{meta_path}.tmp'
+    with open(tmp_meta_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta_path, meta_path)
+
+
+def _frame_to_bars(hist):
+    """Convert a provider history frame to a structured bar array"""
+    bars = np.empty(len(hist), dtype=BAR_DTYPE)
+    if hist.empty:
+        return bars
+
+    bars['ts'] = hist.index.tz_localize(None).values.astype('datetime64[s]').astype('i8')
+    bars['open'] = hist['Open'].to_numpy(dtype='f8')
+    bars['high'] = hist['High'].to_numpy(dtype='f8')
+    bars['low'] = hist['Low'].to_numpy(dtype='f8')
+    bars['close'] = hist['Close'].to_numpy(dtype='f8')
+    bars['volume'] = hist['Volume'].to_numpy(dtype='f8')
+    return bars[~np.isnan(bars['close'])]
+
+
+def _refresh(symbol, period, interval):
+    """Blocking refresh of a symbol's stored bars so they cover period"""
+    bars, meta = _load(symbol, interval)
+    now = _market_now()
+    start = _period_start(period, now)
+    retention_start = now - timedelta(days=INTERVAL_RETENTION_DAYS[interval])
+
+    covered = (
+        bars is not None
+        and len(bars) > 0
+        and (start is None or meta['covered_from'] <= _to_ts(start))
+    )
+
+    if covered and time.time() - meta['fetched_at'] < INTERVAL_REFRESH[interval]:
+        return bars
+
+    provider = market_data.get_provider()
+
+    if covered:
+        # Re-download from the start of the last stored session: the last
+        # bar may have been partial when it was stored
+        last_session = _from_ts(int(bars['ts'][-1])).date()
+        new_bars = _frame_to_bars(provider.get_history(symbol, interval, start=last_session))
+        kept = bars[bars['ts'] < new_bars['ts'][0]] if len(new_bars) else bars
+        merged = np.concatenate([kept, new_bars])
+        covered_from = meta['covered_from']
+    else:
+        merged = _frame_to_bars(provider.get_history(symbol, interval, period=period))
+        if len(merged) == 0:
+            return None
+        covered_from = _to_ts(start) if start is not None else int(merged['ts'][0])
+
+    # Drop bars older than any period served from this interval needs
+    retention_ts = _to_ts(retention_start)
+    trimmed = merged[merged['ts'] >= retention_ts]
+    if len(trimmed) == 0:
+        trimmed = merged
+    elif len(trimmed) < len(merged):
+        covered_from = max(covered_from, retention_ts)
+
+    meta = {'covered_from': covered_from, 'fetched_at': time.time()}
+    _save(symbol, interval, trimmed, meta)
+
+    return trimmed
+
+
+def _slice_period(bars, period, now):
+    """Get the bars that fall within a period"""
+    if period in PERIOD_SESSIONS:
+        sessions = bars['ts'] // 86400
+        distinct = np.unique(sessions)
+        first_session = distinct[-PERIOD_SESSIONS[period]:][0]
+        return bars[sessions >= first_session]
+
+    start = _period_start(period, now)
+    if start is None:
+        return bars
+
+    return bars[bars['ts'] >= _to_ts(start)]
+
+
+async def get_history(symbol, period):
+    """Get OHLCV bars covering a chart period
+
+    Returns a structured array with ts, open, high, low, close and volume
+    fields, or None if no data is available or the symbol isn't a ticker.
+    """
+    symbol = symbol.upper()
+    if not symbol_index.is_well_formed(symbol):
+        # The symbol becomes a file name, so never let arbitrary input near the disk
+        return None
+
+    interval = get_interval(period)
+
+    key = (symbol, interval)
+    entry = _locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            bars = await stock_api.run_blocking(_refresh, symbol, period, interval)
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _locks[key]
+
+    if bars is None or len(bars) == 0:
+        return None
+
+    window = _slice_period(bars, period, _market_now())
+    return window if len(window) else None
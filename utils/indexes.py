@@ -0,0 +1,122 @@
+"""MongoDB index management"""
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+import config
+from utils.logger import logger
+
+# Indexes matching the bot's query patterns, keyed by collection
+INDEXES = {
+    'paper_accounts': [
+        IndexModel([('user_id', ASCENDING), ('guild_id', ASCENDING)],
+                   name='user_guild_unique', unique=True),
+        IndexModel([('guild_id', ASCENDING)], name='guild'),
+    ],
+    'paper_transactions': [
+        IndexModel([('user_id', ASCENDING), ('guild_id', ASCENDING),
+                    ('timestamp', DESCENDING), ('_id', DESCENDING)],
+                   name='user_guild_timestamp_id'),
+        IndexModel([('guild_id', ASCENDING), ('user_id', ASCENDING)],
+                   name='guild_user'),
+        IndexModel([('timestamp', ASCENDING)], name='timestamp'),
+    ],
+    'paper_transaction_summaries': [
+        IndexModel([('user_id', ASCENDING), ('guild_id', ASCENDING), ('month', ASCENDING)],
+                   name='user_guild_month_unique', unique=True),
+        IndexModel([('guild_id', ASCENDING), ('user_id', ASCENDING)],
+                   name='guild_user'),
+    ],
+    'paper_transaction_carry': [
+        IndexModel([('user_id', ASCENDING), ('guild_id', ASCENDING)],
+                   name='user_guild_unique', unique=True),
+    ],
+    'paper_transactions_archive': [
+        IndexModel([('user_id', ASCENDING), ('guild_id', ASCENDING), ('month', ASCENDING)],
+                   name='user_guild_month_unique', unique=True),
+    ],
+    'portfolio_latest': [
+        IndexModel([('user_id', ASCENDING), ('guild_id', ASCENDING)],
+                   name='user_guild_unique', unique=True),
+    ],
+    'portfolio_snapshots': [
+        IndexModel([('user_id', ASCENDING), ('guild_id', ASCENDING), ('timestamp', DESCENDING)],
+                   name='user_guild_timestamp'),
+        IndexModel([('timestamp', ASCENDING)], name='timestamp_ttl',
+                   expireAfterSeconds=config.PORTFOLIO_HISTORY_RETENTION_DAYS * 86400),
+    ],
+    'earnings_calendar': [
+        IndexModel([('symbol', ASCENDING)], name='symbol_unique', unique=True),
+        IndexModel([('next_date', ASCENDING)], name='next_date'),
+    ],
+    'symbol_metadata': [
+        IndexModel([('symbol', ASCENDING)], name='symbol_unique', unique=True),
+    ],
+    'watchlists': [
+        IndexModel([('guild_id', ASCENDING)], name='guild_unique', unique=True),
+        IndexModel([('guild_id', ASCENDING), ('stocks.symbol', ASCENDING)],
+                   name='guild_symbol'),
+    ],
+}
+
+# Options that change an index's behaviour and must match the spec
+_COMPARED_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def _normalize_keys(keys):
+    """Normalize index key directions (the server may report 1.0 for 1)"""
+    return [(field, int(direction) if isinstance(direction, float) else direction)
+            for field, direction in keys]
+
+
+def _describe_drift(spec, existing):
+    """Get a list of differences between an index spec and the live index"""
+    differences = []
+
+    spec_keys = _normalize_keys(spec['key'].items())
+    existing_keys = _normalize_keys(existing['key'])
+    if spec_keys != existing_keys:
+        differences.append(f"keys {existing_keys} != {spec_keys}")
+
+    for option in _COMPARED_OPTIONS:
+        if spec.get(option) != existing.get(option):
+            differences.append(f"{option} {existing.get(option)!r} != {spec.get(option)!r}")
+
+    return differences
+
+
+async def ensure_indexes(db, indexes=INDEXES):
+    """Create any missing indexes and log drift from the expected set
+
+    Safe to run on every startup: existing indexes that match are left
+    alone. Indexes that differ from the spec are logged but never dropped,
+    so a bad spec cannot take down a production index.
+    """
+    for collection_name, models in indexes.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+
+        missing = []
+        for model in models:
+            spec = model.document
+            name = spec['name']
+
+            if name not in existing:
+                missing.append(model)
+                continue
+
+            differences = _describe_drift(spec, existing[name])
+            if differences:
+                logger.warning(f"Index drift on {collection_name}.{name}: {'; '.join(differences)}")
+
+        expected_names = {model.document['name'] for model in models}
+        for name in existing:
+            if name != '_id_' and name not in expected_names:
+                logger.info(f"Unmanaged index on {collection_name}: {name}")
+
+        for model in missing:
+            name = model.document['name']
+            try:
+                await collection.create_indexes([model])
+                logger.info(f"Created index {collection_name}.{name}")
+            except OperationFailure as e:
+                logger.error(f"Failed to create index {collection_name}.{name}: {e}")
@@ -0,0 +1,295 @@
+"""Leaderboard computation for paper trading accounts
+
+Each guild's leaderboard is kept in memory as sorted rankings. Trades
+update their account's entry incrementally, the market data poller re-ranks
+every board in bulk, and !leaderboard reads the top k entries directly.
+
+Boards are rebuilt from the database every
+CacheSettings.LEADERBOARD_REBUILD_INTERVAL, which picks up accounts that
+were created without trading. A build that raced with trades in its guild
+is retried, so no trade is lost between the database read and the board
+going live.
+"""
+import asyncio
+import time
+from bisect import bisect_left, insort
+
+import numpy as np
+
+from utils import paper_trading, stock_api
+from utils.constants import CacheSettings, Timeouts
+from utils.database import get_db
+from utils.paper_trading import STARTING_BALANCE
+
+# Entry field each leaderboard category ranks by
+CATEGORY_KEYS = {
+    'value': 'total_value',
+    'gainers': 'profit_pct',
+    'volume': 'txn_count'
+}
+
+# Builds retried when trades land mid-build, before serving the last one
+_BUILD_ATTEMPTS = 3
+
+_boards = {}
+_builds = {}
+# Guilds that saw a trade while their board was being built
+_raced = set()
+
+
+def _value_accounts(accounts, prices):
+    """Value every account at once with NumPy
+
+    Returns an array of total values in the same order as accounts.
+    Positions whose symbol has no price are valued at cost.
+    """
+    symbol_index = {}
+    account_idx = []
+    symbol_idx = []
+    quantities = []
+    avg_costs = []
+
+    for i, account in enumerate(accounts):
+        for position in account.get('positions', []):
+            symbol = position['symbol']
+            if symbol not in symbol_index:
+                symbol_index[symbol] = len(symbol_index)
+            account_idx.append(i)
+            symbol_idx.append(symbol_index[symbol])
+            quantities.append(position['quantity'])
+            avg_costs.append(position['avg_cost'])
+
+    price_array = np.array([prices.get(symbol, np.nan) for symbol in symbol_index], dtype=np.float64)
+    cash = np.array([account['cash'] for account in accounts], dtype=np.float64)
+
+    if not account_idx:
+        return cash
+
+    position_prices = price_array[np.asarray(symbol_idx, dtype=np.intp)]
+    position_prices = np.where(np.isnan(position_prices), np.asarray(avg_costs, dtype=np.float64), position_prices)
+
+    holdings = np.bincount(
+        np.asarray(account_idx, dtype=np.intp),
+        weights=np.asarray(quantities, dtype=np.float64) * position_prices,
+        minlength=len(accounts)
+    )
+    return cash + holdings
+
+
+async def _fetch_prices(accounts):
+    """Price the union of symbols held across accounts with one batched lookup"""
+    symbols = sorted({p['symbol'] for account in accounts for p in account.get('positions', [])})
+    if not symbols:
+        return {}
+
+    quotes = await stock_api.get_stock_infos(symbols)
+    return {symbol: info['price'] for symbol, info in quotes.items() if info}
+
+
+class GuildLeaderboard:
+    """Sorted per-category rankings of a guild's accounts"""
+
+    def __init__(self, guild_id):
+        self.guild_id = str(guild_id)
+        self.entries = {}
+        self.prices = {}
+        self.priced_at = 0
+        self.built_at = 0
+        self._rankings = {category: [] for category in CATEGORY_KEYS}
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _rank_key(entry, field):
+        # Negated so the highest value sorts first; user_id breaks ties
+        return (-entry[field], entry['user_id'])
+
+    def _unrank(self, entry):
+        for category, field in CATEGORY_KEYS.items():
+            ranking = self._rankings[category]
+            key = self._rank_key(entry, field)
+            i = bisect_left(ranking, key)
+            if i < len(ranking) and ranking[i] == key:
+                del ranking[i]
+
+    def _rank(self, entry):
+        for category, field in CATEGORY_KEYS.items():
+            insort(self._rankings[category], self._rank_key(entry, field))
+
+    def _make_entry(self, account, total_value, txn_count):
+        profit_loss = total_value - STARTING_BALANCE
+        return {
+            'user_id': account['user_id'],
+            'display_name': account.get('display_name'),
+            'cash': account['cash'],
+            'positions': [(p['symbol'], p['quantity'], p['avg_cost']) for p in account.get('positions', [])],
+            'total_value': total_value,
+            'profit_loss': profit_loss,
+            'profit_pct': profit_loss / STARTING_BALANCE * 100,
+            'txn_count': txn_count
+        }
+
+    def load(self, accounts, prices, txn_counts):
+        """Replace every entry and rebuild the rankings"""
+        self.prices = dict(prices)
+        self.built_at = time.time()
+
+        total_values = _value_accounts(accounts, self.prices)
+        self.entries = {
+            account['user_id']: self._make_entry(account, float(total_values[i]),
+                                                 txn_counts.get(account['user_id'], 0))
+            for i, account in enumerate(accounts)
+        }
+        self._rebuild_rankings()
+        self._mark_priced(prices)
+
+    def _mark_priced(self, prices):
+        # Only a full set of prices resets the board's price age
+        if self.symbols() <= prices.keys():
+            self.priced_at = time.time()
+
+    def _rebuild_rankings(self):
+        for category, field in CATEGORY_KEYS.items():
+            self._rankings[category] = sorted(
+                self._rank_key(entry, field) for entry in self.entries.values()
+            )
+
+    def apply_account(self, account, txn_delta=0, prices=None):
+        """Update one account's entry after a trade"""
+        if prices:
+            self.prices.update(prices)
+
+        previous = self.entries.get(account['user_id'])
+        txn_count = (previous['txn_count'] if previous else 0) + txn_delta
+
+        total_value = float(_value_accounts([account], self.prices)[0])
+
+        if previous is not None:
+            self._unrank(previous)
+
+        entry = self._make_entry(account, total_value, txn_count)
+        self.entries[entry['user_id']] = entry
+        self._rank(entry)
+
+    def remove(self, user_id):
+        """Drop an account's entry"""
+        entry = self.entries.pop(str(user_id), None)
+        if entry is not None:
+            self._unrank(entry)
+
+    def rerank(self, prices):
+        """Re-value every entry with new prices and rebuild the rankings"""
+        self.prices.update(prices)
+        self._mark_priced(prices)
+
+        if not self.entries:
+            return
+
+        accounts = [
+            {'cash': entry['cash'],
+             'positions': [{'symbol': symbol, 'quantity': quantity, 'avg_cost': avg_cost}
+                           for symbol, quantity, avg_cost in entry['positions']]}
+            for entry in self.entries.values()
+        ]
+        total_values = _value_accounts(accounts, self.prices)
+
+        for entry, total_value in zip(self.entries.values(), total_values):
+            entry['total_value'] = float(total_value)
+            entry['profit_loss'] = entry['total_value'] - STARTING_BALANCE
+            entry['profit_pct'] = entry['profit_loss'] / STARTING_BALANCE * 100
+
+        self._rebuild_rankings()
+
+    def symbols(self):
+        """Get every symbol held on this board"""
+        return {position[0] for entry in self.entries.values() for position in entry['positions']}
+
+    def top(self, category, k):
+        """Get the top k entries for a category"""
+        return [self.entries[user_id] for _, user_id in self._rankings[category][:k]]
+
+    @property
+    def age(self):
+        """Seconds since the board's prices were last fully refreshed"""
+        return time.time() - self.priced_at
+
+    @property
+    def build_age(self):
+        """Seconds since the board was last rebuilt from the database"""
+        return time.time() - self.built_at
+
+
+async def _build(guild_id):
+    """Build a guild's board from the database and make it live"""
+    for attempt in range(_BUILD_ATTEMPTS):
+        _raced.discard(guild_id)
+
+        accounts = await paper_trading.get_all_accounts(guild_id)
+        txn_counts = await paper_trading.get_transaction_counts(guild_id)
+
+        board = GuildLeaderboard(guild_id)
+        board.load(accounts, await _fetch_prices(accounts), txn_counts)
+
+        if guild_id not in _raced:
+            break
+
+    if guild_id in _raced:
+        # Trades kept landing mid-build: serve this board, rebuild on the next read
+        _raced.discard(guild_id)
+        board.built_at = 0
+
+    _boards[guild_id] = board
+    return board
+
+
+async def get_leaderboard(guild_id):
+    """Get a guild's leaderboard, building or re-pricing it if needed
+
+    Boards are rebuilt from the database every
+    CacheSettings.LEADERBOARD_REBUILD_INTERVAL, with concurrent requests
+    sharing one build. Prices older than Timeouts.LEADERBOARD_COOLDOWN are
+    refreshed before the board is read.
+    """
+    guild_id = str(guild_id)
+    board = _boards.get(guild_id)
+
+    if get_db() is None:
+        return GuildLeaderboard(guild_id)
+
+    if board is None or board.build_age >= CacheSettings.LEADERBOARD_REBUILD_INTERVAL:
+        task = _builds.get(guild_id)
+        if task is None:
+            task = _builds[guild_id] = asyncio.create_task(_build(guild_id))
+            task.add_done_callback(lambda _: _builds.pop(guild_id, None))
+        board = await asyncio.shield(task)
+
+    elif board.age >= Timeouts.LEADERBOARD_COOLDOWN:
+        quotes = await stock_api.get_stock_infos(sorted(board.symbols()))
+        board.rerank({symbol: info['price'] for symbol, info in quotes.items() if info})
+
+    return board
+
+
+def rerank_all():
+    """Re-rank every loaded board from the quote cache (no network calls)"""
+    for board in _boards.values():
+        board.rerank(stock_api.get_cached_prices(board.symbols()))
+
+
+def _on_trade(user_id, guild_id, action, account):
+    if guild_id in _builds:
+        _raced.add(guild_id)
+
+    board = _boards.get(guild_id)
+    if board is None:
+        return
+
+    if action == "RESET":
+        board.remove(user_id)
+    else:
+        board.apply_account(account, txn_delta=1,
+                            prices=stock_api.get_cached_prices(p['symbol'] for p in account.get('positions', [])))
+
+
+paper_trading.add_trade_listener(_on_trade)
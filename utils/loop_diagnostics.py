@@ -0,0 +1,280 @@
+"""Event loop stall diagnostics
+
+When config.LOOP_DIAGNOSTICS is on, enable() turns on asyncio debug mode
+(which warns about callbacks slower than slow_callback_duration) and starts
+a watchdog thread. The loop bumps a heartbeat every few milliseconds; when
+the heartbeat stops for longer than the threshold, the watchdog grabs the
+loop thread's stack with sys._current_frames(), so the report shows the
+exact line that is blocking (e.g. a synchronous yfinance or matplotlib call
+inside a coroutine) rather than just the task that was running.
+
+Stalls are aggregated by call site: the first stall at a new site is logged
+immediately with its stack, and a summary of all sites is logged
+periodically through utils.logger.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+import config
+from utils.logger import logger
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Frames from these files are never blamed for a stall
+_IGNORED_FILES = {os.path.abspath(__file__)}
+
+
+def _relative(filename):
+    filename = os.path.abspath(filename)
+    if filename.startswith(_PROJECT_ROOT + os.sep):
+        return os.path.relpath(filename, _PROJECT_ROOT)
+    return filename
+
+
+def _is_project_file(filename):
+    filename = os.path.abspath(filename)
+    return (
+        filename.startswith(_PROJECT_ROOT + os.sep)
+        and filename not in _IGNORED_FILES
+        and f'{os.sep}site-packages{os.sep}' not in filename
+    )
+
+
+def call_site(frame):
+    """Describe where the loop thread is blocked, given its current frame
+
+    Returns (site, blocking): the coroutine that is blocking the loop
+    (preferring our own code) and the innermost frame, where the time is
+    actually spent, each as 'path:line in function'.
+    """
+    def describe(f):
+        return f"{_relative(f.f_code.co_filename)}:{f.f_lineno} in {f.f_code.co_name}"
+
+    frames = []
+    while frame is not None:
+        if os.path.abspath(frame.f_code.co_filename) not in _IGNORED_FILES:
+            frames.append(frame)
+        frame = frame.f_back
+    if not frames:
+        return 'unknown', 'unknown'
+
+    # frames runs innermost first
+    coroutines = [f for f in frames if f.f_code.co_flags & inspect.CO_COROUTINE]
+    ours = [f for f in frames if _is_project_file(f.f_code.co_filename)]
+    culprit = next(
+        (f for f in coroutines if _is_project_file(f.f_code.co_filename)),
+        coroutines[0] if coroutines else (ours[0] if ours else frames[0])
+    )
+    return describe(culprit), describe(frames[0])
+
+
+class StallWatchdog:
+    """Watches the event loop from a separate thread and samples its stack on stalls"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.beat_interval = threshold / 4
+        self._loop = None
+        self._loop_thread_id = None
+        self._beat_handle = None
+        self._last_beat = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._open_stall = None
+        self.sites = {}
+        self.stall_count = 0
+        self.stall_seconds = 0.0
+
+    def start(self, loop):
+        """Start watching loop (call from the loop's thread)"""
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._beat()
+
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._beat_handle is not None:
+            self._beat_handle.cancel()
+            self._beat_handle = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        self._beat_handle = self._loop.call_later(self.beat_interval, self._beat)
+
+    def _watch(self):
+        while not self._stop.wait(self.beat_interval):
+            last_beat = self._last_beat
+            behind = time.monotonic() - last_beat - self.beat_interval
+
+            if self._open_stall is not None and self._open_stall[0] != last_beat:
+                # The loop is running again: the stall lasted until the beat
+                # after the one it interrupted
+                started, site, blocking, stack = self._open_stall
+                self._open_stall = None
+                self._record(site, blocking, stack, last_beat - started - self.beat_interval)
+
+            if self._open_stall is None and behind > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                stack = traceback.extract_stack(frame)
+                site, blocking = call_site(frame)
+                self._open_stall = (last_beat, site, blocking, stack)
+
+    def _record(self, site, blocking, stack, duration):
+        with self._lock:
+            self.stall_count += 1
+            self.stall_seconds += duration
+
+            entry = self.sites.get(site)
+            first = entry is None
+            if first:
+                entry = self.sites[site] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0, 'blocking': set(), 'reported_count': 0
+                }
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+            entry['blocking'].add(blocking)
+
+        if first:
+            logger.warning(
+                f"Event loop blocked for {duration:.3f}s at {site} (in {blocking})\n"
+                + ''.join(traceback.format_list(stack))
+            )
+
+    def summary(self):
+        """Get the stalls per call site, worst total first"""
+        with self._lock:
+            rows = [
+                {'site': site, 'count': entry['count'], 'total': entry['total'], 'max': entry['max'],
+                 'blocking': sorted(entry['blocking'])}
+                for site, entry in self.sites.items()
+            ]
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+    def take_unreported(self):
+        """Get the call sites that stalled since the last call, and mark them reported"""
+        with self._lock:
+            changed = {site for site, entry in self.sites.items() if entry['count'] != entry['reported_count']}
+            for site in changed:
+                self.sites[site]['reported_count'] = self.sites[site]['count']
+        return [row for row in self.summary() if row['site'] in changed]
+
+    def reset(self):
+        with self._lock:
+            self.sites.clear()
+            self.stall_count = 0
+            self.stall_seconds = 0.0
+
+
+_watchdog = None
+_report_task = None
+_asyncio_logger_state = None
+
+
+def _forward_asyncio_warnings():
+    """Send asyncio's debug-mode warnings (slow callbacks, never-awaited
+    coroutines) through the bot's log handlers"""
+    global _asyncio_logger_state
+    asyncio_logger = logging.getLogger('asyncio')
+    _asyncio_logger_state = (asyncio_logger.propagate, list(asyncio_logger.handlers))
+
+    asyncio_logger.propagate = False
+    for handler in logger.handlers:
+        asyncio_logger.addHandler(handler)
+
+
+def _restore_asyncio_logger():
+    global _asyncio_logger_state
+    if _asyncio_logger_state is None:
+        return
+
+    asyncio_logger = logging.getLogger('asyncio')
+    asyncio_logger.propagate, asyncio_logger.handlers = _asyncio_logger_state
+    _asyncio_logger_state = None
+
+
+async def _report_periodically(interval):
+    while True:
+        await asyncio.sleep(interval)
+        log_report(_watchdog.take_unreported())
+
+
+def log_report(rows=None):
+    """Log stalls aggregated by call site (all of them by default)"""
+    if _watchdog is None:
+        return
+
+    rows = _watchdog.summary() if rows is None else rows
+    if not rows:
+        return
+
+    lines = [
+        f"  {row['site']}: {row['count']} stalls, {row['total']:.2f}s total, max {row['max']:.3f}s"
+        f" (in {', '.join(row['blocking'][:3])})"
+        for row in rows
+    ]
+    logger.warning("Event loop stalls by call site:\n" + "\n".join(lines))
+
+
+def enable(threshold=None, report_interval=None):
+    """Start stall diagnostics on the running loop (no-op if already on)"""
+    global _watchdog, _report_task
+    if _watchdog is not None:
+        return
+
+    threshold = threshold or config.LOOP_STALL_THRESHOLD
+    report_interval = report_interval or config.LOOP_DIAGNOSTICS_REPORT_INTERVAL
+
+    loop = asyncio.get_running_loop()
+    loop.set_debug(True)
+    loop.slow_callback_duration = threshold
+    _forward_asyncio_warnings()
+
+    _watchdog = StallWatchdog(threshold)
+    _watchdog.start(loop)
+    _report_task = asyncio.create_task(_report_periodically(report_interval))
+
+    logger.info(f"Loop diagnostics enabled (stall threshold {threshold * 1000:.0f}ms)")
+
+
+def disable():
+    """Stop stall diagnostics and log the final report"""
+    global _watchdog, _report_task
+    if _watchdog is None:
+        return
+
+    if _report_task is not None:
+        _report_task.cancel()
+        _report_task = None
+
+    _watchdog.stop()
+    log_report()
+    _watchdog = None
+
+    _restore_asyncio_logger()
+    try:
+        asyncio.get_running_loop().set_debug(False)
+    except RuntimeError:
+        pass
+
+
+def get_watchdog():
+    """Get the active watchdog, or None if diagnostics are off"""
+    return _watchdog
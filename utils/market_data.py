@@ -0,0 +1,225 @@
+"""Market data providers
+
+Everything the bot needs from upstream (quotes, history, earnings dates and
+descriptive metadata) goes through the provider returned by get_provider(),
+selected by config.MARKET_DATA_PROVIDER:
+
+- 'yfinance': Yahoo Finance through the yfinance package
+- 'fake': deterministic synthetic data with configurable latency and errors
+  (see utils/fake_market_data.py), for offline load tests and benchmarks
+
+Provider methods are blocking and are run on stock_api's executor.
+"""
+import math
+import threading
+import time
+from collections import Counter
+
+import config
+from utils import metrics
+
+
+class MarketDataProvider:
+    """Base class for market data providers
+
+    Subclasses implement the underscore-prefixed methods. The public methods
+    count and time every call so upstream usage can be measured.
+    """
+
+    name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._call_counts = Counter()
+
+    def _call(self, method, *args, **kwargs):
+        with self._lock:
+            self._call_counts[method] += 1
+
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            result = getattr(self, f'_{method}')(*args, **kwargs)
+            status = 'ok'
+            return result
+        finally:
+            metrics.observe('provider_call_seconds', time.perf_counter() - started,
+                            provider=self.name, method=method, status=status)
+
+    def get_quote(self, symbol):
+        """Get a raw quote for one symbol, or None if the symbol is unknown
+
+        A raw quote is a dict with price, previous_close, volume and, when
+        the provider has them for free, currency, long_name and short_name.
+        """
+        return self._call('get_quote', symbol)
+
+    def get_quotes(self, symbols):
+        """Get raw quotes for several symbols as a dict of symbol -> quote or None"""
+        return self._call('get_quotes', symbols)
+
+    def get_history(self, symbol, interval, period=None, start=None):
+        """Get OHLCV bars as a DataFrame indexed by exchange-local time
+
+        Covers either a period (e.g. '1mo') or everything since start.
+        """
+        return self._call('get_history', symbol, interval, period=period, start=start)
+
+    def get_earnings_dates(self, symbol):
+        """Get a symbol's earnings dates, oldest first
+
+        Each entry is a dict with date (naive UTC), eps_estimate and eps_actual.
+        """
+        return self._call('get_earnings_dates', symbol)
+
+    def get_info(self, symbol):
+        """Get a symbol's descriptive fields, keyed like yfinance's info dict"""
+        return self._call('get_info', symbol)
+
+    def call_counts(self):
+        """Get the number of calls made to each method"""
+        with self._lock:
+            return dict(self._call_counts)
+
+    def reset_call_counts(self):
+        with self._lock:
+            self._call_counts.clear()
+
+
+def _clean_number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+
+def raw_quote_from_frame(frame, chart=None):
+    """Build a raw quote from recent daily bars (and the chart metadata sent with them)"""
+    chart = chart or {}
+
+    closes = frame['Close'].dropna()
+    if closes.empty:
+        return None
+
+    price = float(chart.get('regularMarketPrice') or closes.iloc[-1])
+    volumes = frame['Volume'].dropna()
+
+    return {
+        'price': price,
+        'previous_close': float(closes.iloc[-2]) if len(closes) > 1 else price,
+        'volume': int(volumes.iloc[-1]) if not volumes.empty else None,
+        'currency': chart.get('currency'),
+        'long_name': chart.get('longName'),
+        'short_name': chart.get('shortName')
+    }
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Yahoo Finance through yfinance"""
+
+    name = 'yfinance'
+
+    def __init__(self):
+        super().__init__()
+        import yfinance
+        self._yf = yfinance
+
+    def _get_quote(self, symbol):
+        # One light chart request: the last few daily bars plus the chart
+        # metadata sent with them (live price, currency, names)
+        ticker = self._yf.Ticker(symbol)
+        hist = ticker.history(period='5d', interval='1d', auto_adjust=False)
+        if hist.empty:
+            return None
+
+        return raw_quote_from_frame(hist, ticker.history_metadata)
+
+    def _get_quotes(self, symbols):
+        data = self._yf.download(
+            symbols,
+            period='5d',
+            interval='1d',
+            group_by='ticker',
+            auto_adjust=False,
+            progress=False
+        )
+
+        results = {}
+        for symbol in symbols:
+            results[symbol] = None
+
+            if data is None or data.empty:
+                continue
+
+            try:
+                frame = data[symbol] if data.columns.nlevels > 1 else data
+            except KeyError:
+                continue
+
+            results[symbol] = raw_quote_from_frame(frame)
+
+        return results
+
+    def _get_history(self, symbol, interval, period=None, start=None):
+        ticker = self._yf.Ticker(symbol)
+        if start is not None:
+            return ticker.history(start=start, interval=interval)
+        return ticker.history(period=period, interval=interval)
+
+    def _get_earnings_dates(self, symbol):
+        earnings_dates = self._yf.Ticker(symbol).earnings_dates
+
+        if earnings_dates is None or earnings_dates.empty:
+            return []
+
+        schedule = []
+        for date, row in earnings_dates.iterrows():
+            if date.tzinfo is not None:
+                date = date.tz_convert('UTC').tz_localize(None)
+
+            schedule.append({
+                'date': date.to_pydatetime(),
+                'eps_estimate': _clean_number(row.get('EPS Estimate')),
+                'eps_actual': _clean_number(row.get('Reported EPS'))
+            })
+
+        schedule.sort(key=lambda e: e['date'])
+        return schedule
+
+    def _get_info(self, symbol):
+        return self._yf.Ticker(symbol).info or {}
+
+
+def _create_provider(name):
+    if name == 'yfinance':
+        return YFinanceProvider()
+
+    if name == 'fake':
+        from utils.fake_market_data import FakeProvider
+        return FakeProvider(
+            latency=config.FAKE_MARKET_DATA_LATENCY,
+            error_rate=config.FAKE_MARKET_DATA_ERROR_RATE,
+            seed=config.FAKE_MARKET_DATA_SEED
+        )
+
+    raise ValueError(f"Unknown market data provider: {name}")
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """Get the active market data provider"""
+    global _provider
+    # Called from executor threads, so creation must not race
+    with _provider_lock:
+        if _provider is None:
+            _provider = _create_provider(config.MARKET_DATA_PROVIDER)
+        return _provider
+
+
+def set_provider(provider):
+    """Replace the active market data provider (for benchmarks and tests)"""
+    global _provider
+    with _provider_lock:
+        _provider = provider
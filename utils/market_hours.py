@@ -0,0 +1,41 @@
+"""US equity market hours helpers"""
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+MARKET_TZ = ZoneInfo('America/New_York')
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+
+def now_in_market_tz():
+    """Get the current time in the exchange's timezone"""
+    return datetime.now(MARKET_TZ)
+
+
+def is_market_open(now=None):
+    """Check if regular trading hours are in session (holidays not included)"""
+    now = now or now_in_market_tz()
+    if now.weekday() >= 5:
+        return False
+    return MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+def next_market_open(now=None):
+    """Get the datetime of the next regular session open"""
+    now = now or now_in_market_tz()
+    candidate = now.replace(hour=MARKET_OPEN.hour, minute=MARKET_OPEN.minute,
+                            second=0, microsecond=0)
+
+    if candidate <= now:
+        candidate += timedelta(days=1)
+
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+
+    return candidate
+
+
+def seconds_until_next_open(now=None):
+    """Get the number of seconds until the next regular session open"""
+    now = now or now_in_market_tz()
+    return (next_market_open(now) - now).total_seconds()
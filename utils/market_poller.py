@@ -0,0 +1,117 @@
+"""Background market data poller
+
+Keeps quotes for every watched or held symbol warm in the quote cache, so
+!watchlist, !balance and !portfolio are served from memory. Slower
+housekeeping (portfolio snapshots, earnings refreshes, transaction
+compaction) runs on its own tasks so it can never delay a quote refresh.
+"""
+import asyncio
+import time
+
+import config
+from utils import compaction, database, earnings, leaderboard, market_hours, portfolio_snapshots, stock_api
+from utils.rate_limit import TokenBucket
+
+
+class MarketDataPoller:
+    """Periodically refreshes quotes for all tracked symbols"""
+
+    def __init__(self):
+        self._task = None
+        self._job_tasks = []
+        self._first_poll = None
+        # One token per batched upstream request, not per symbol
+        self._bucket = TokenBucket(
+            rate=config.POLLER_REQUESTS_PER_SECOND,
+            capacity=max(1.0, config.POLLER_REQUESTS_PER_SECOND)
+        )
+        self.last_poll_at = None
+        self.last_poll_duration = None
+        self.last_symbol_count = 0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start polling and the housekeeping jobs (no-op if already running)"""
+        if self.running:
+            return
+
+        self._first_poll = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        self._job_tasks = [
+            asyncio.create_task(self._run_job(name, job, interval))
+            for name, job, interval in (
+                ('portfolio snapshots', portfolio_snapshots.snapshot_all_accounts, config.SNAPSHOT_INTERVAL),
+                ('earnings refresh', earnings.refresh_due_earnings, config.EARNINGS_REFRESH_INTERVAL),
+                ('transaction compaction', compaction.compact_transactions, config.COMPACTION_INTERVAL),
+            )
+        ]
+
+    def stop(self):
+        """Stop polling and the housekeeping jobs"""
+        for task in [self._task] + self._job_tasks:
+            if task is not None and not task.done():
+                task.cancel()
+        self._task = None
+        self._job_tasks = []
+
+    def next_interval(self, now=None):
+        """Get the seconds to wait before the next poll
+
+        Polls often enough during regular hours to keep quotes fresh. While
+        the market is closed quotes cannot change, so it only wakes up
+        occasionally (and at the next open).
+        """
+        if market_hours.is_market_open(now):
+            return config.POLLER_INTERVAL_OPEN
+
+        return min(market_hours.seconds_until_next_open(now), config.POLLER_INTERVAL_CLOSED)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error polling market data: {e}")
+            finally:
+                self._first_poll.set()
+
+            await asyncio.sleep(self.next_interval())
+
+    async def _run_job(self, name, job, interval):
+        # Jobs such as snapshots value accounts from the quote cache, so
+        # let the first poll warm it before they run
+        await self._first_poll.wait()
+
+        while True:
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error running {name}: {e}")
+
+            await asyncio.sleep(interval)
+
+    async def poll_once(self):
+        """Refresh every tracked symbol's quote in rate-limited batches"""
+        started = time.monotonic()
+        symbols = await database.get_tracked_symbols()
+
+        batch_size = config.QUOTE_BATCH_SIZE
+        for i in range(0, len(symbols), batch_size):
+            await self._bucket.acquire()
+            await stock_api.refresh_stock_infos(symbols[i:i + batch_size])
+
+        self.last_poll_at = time.time()
+        self.last_poll_duration = time.monotonic() - started
+        self.last_symbol_count = len(symbols)
+
+        leaderboard.rerank_all()
+
+
+poller = MarketDataPoller()
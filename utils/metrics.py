@@ -0,0 +1,366 @@
+"""Runtime metrics
+
+Latency histograms for bot commands, market data provider calls and Mongo
+commands, cache hit ratios and event-loop lag. bot.py feeds command timings
+through its invoke hooks and passes MongoCommandTimer to the Motor client;
+providers time themselves in MarketDataProvider._call.
+
+Everything can be read back with summarize() (for !metrics) or rendered in
+the Prometheus text format by the local HTTP endpoint on
+config.METRICS_HOST:METRICS_PORT.
+"""
+import asyncio
+import bisect
+import threading
+import time
+
+from pymongo import monitoring
+
+import config
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = 'groupfolio'
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name -> (type, help, label names)
+DEFINITIONS = {
+    'command_latency_seconds': ('histogram', "Bot command latency", ('command', 'status')),
+    'command_errors_total': ('counter', "Bot command errors", ('command', 'error')),
+    'provider_call_seconds': ('histogram', "Market data provider call latency", ('provider', 'method', 'status')),
+    'mongo_command_seconds': ('histogram', "MongoDB command latency", ('command', 'collection', 'status')),
+    'event_loop_lag_seconds': ('histogram', "Event loop scheduling lag", ()),
+}
+
+_lock = threading.Lock()
+_histograms = {name: {} for name, (kind, _, _) in DEFINITIONS.items() if kind == 'histogram'}
+_counters = {name: {} for name, (kind, _, _) in DEFINITIONS.items() if kind == 'counter'}
+_caches = {}
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within its bucket"""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if seen + n >= rank and n:
+                if i == len(BUCKETS):
+                    return self.max
+                lower = BUCKETS[i - 1] if i else 0.0
+                return min(lower + (BUCKETS[i] - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+def _labels(name, labels):
+    return tuple(str(labels.get(label, '')) for label in DEFINITIONS[name][2])
+
+
+def observe(name, seconds, **labels):
+    """Record a duration in a histogram"""
+    key = _labels(name, labels)
+    with _lock:
+        histogram = _histograms[name].get(key)
+        if histogram is None:
+            histogram = _histograms[name][key] = Histogram()
+        histogram.observe(seconds)
+
+
+def increment(name, n=1, **labels):
+    """Add to a counter"""
+    key = _labels(name, labels)
+    with _lock:
+        _counters[name][key] = _counters[name].get(key, 0) + n
+
+
+def register_cache(name, cache):
+    """Report a TTLCache's hit ratio under name"""
+    _caches[name] = cache
+
+
+def reset():
+    """Clear every histogram and counter"""
+    with _lock:
+        for series in list(_histograms.values()) + list(_counters.values()):
+            series.clear()
+
+
+# -- Commands ---------------------------------------------------------------
+
+def _command_name(ctx):
+    return ctx.command.qualified_name if ctx.command else 'none'
+
+
+def command_started(ctx):
+    """Mark the start of a command (bot.before_invoke)"""
+    ctx.metrics_started_at = time.perf_counter()
+
+
+def command_finished(ctx):
+    """Record a command's latency (bot.after_invoke, also runs when it raised)"""
+    started = getattr(ctx, 'metrics_started_at', None)
+    if started is None:
+        return
+
+    status = 'error' if ctx.command_failed else 'ok'
+    observe('command_latency_seconds', time.perf_counter() - started,
+            command=_command_name(ctx), status=status)
+
+
+def command_error(ctx, error):
+    """Count a command error (on_command_error)"""
+    error = getattr(error, 'original', error)
+    increment('command_errors_total', command=_command_name(ctx), error=type(error).__name__)
+
+
+# -- MongoDB ----------------------------------------------------------------
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo listener that records every command's latency
+
+    Pass an instance in the Motor client's event_listeners.
+    """
+
+    def __init__(self):
+        self._collections = {}
+        self._collections_lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ''
+        with self._collections_lock:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, status):
+        with self._collections_lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), '')
+        observe('mongo_command_seconds', event.duration_micros / 1_000_000,
+                command=event.command_name, collection=collection, status=status)
+
+    def succeeded(self, event):
+        self._finish(event, 'ok')
+
+    def failed(self, event):
+        self._finish(event, 'error')
+
+
+# -- Event loop lag ---------------------------------------------------------
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes a sleeping task
+
+    Anything that blocks the loop (a synchronous call inside a coroutine,
+    heavy CPU work) shows up as lag.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or config.LOOP_LAG_SAMPLE_INTERVAL
+        self._task = None
+        self.last_lag = 0.0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start sampling (no-op if already running)"""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Stop sampling"""
+        if self.running:
+            self._task.cancel()
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(loop.time() - expected, 0.0)
+            observe('event_loop_lag_seconds', self.last_lag)
+
+
+lag_monitor = LoopLagMonitor()
+
+
+# -- Reporting --------------------------------------------------------------
+
+def cache_stats():
+    """Get stats for every registered cache, keyed by name"""
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def summarize(name, group_by=None):
+    """Summarize a histogram, merging series that share the group_by labels
+
+    Returns dicts with labels, count, total, p50, p95, p99 and max (in
+    seconds), sorted by total time so the biggest consumers come first.
+    """
+    label_names = DEFINITIONS[name][2]
+    group_by = label_names if group_by is None else group_by
+    indexes = [label_names.index(label) for label in group_by]
+
+    groups = {}
+    with _lock:
+        for key, histogram in _histograms[name].items():
+            group = tuple(key[i] for i in indexes)
+            if group not in groups:
+                groups[group] = Histogram()
+            groups[group].merge(histogram)
+
+    rows = [
+        {
+            'labels': dict(zip(group_by, group)),
+            'count': histogram.count,
+            'total': histogram.sum,
+            'p50': histogram.quantile(0.5),
+            'p95': histogram.quantile(0.95),
+            'p99': histogram.quantile(0.99),
+            'max': histogram.max
+        }
+        for group, histogram in groups.items()
+    ]
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows
+
+
+def counter_totals(name, group_by):
+    """Sum a counter by the group_by labels"""
+    label_names = DEFINITIONS[name][2]
+    indexes = [label_names.index(label) for label in group_by]
+
+    totals = {}
+    with _lock:
+        for key, value in _counters[name].items():
+            group = tuple(key[i] for i in indexes)
+            totals[group] = totals.get(group, 0) + value
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in pairs) + '}'
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format"""
+    lines = []
+
+    with _lock:
+        for name, (kind, help_text, label_names) in DEFINITIONS.items():
+            metric = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+
+            if kind == 'counter':
+                for key, value in sorted(_counters[name].items()):
+                    lines.append(f"{metric}{_format_labels(list(zip(label_names, key)))} {value}")
+                continue
+
+            for key, histogram in sorted(_histograms[name].items()):
+                pairs = list(zip(label_names, key))
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float('inf'),), histogram.buckets):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{metric}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{metric}_sum{_format_labels(pairs)} {histogram.sum}")
+                lines.append(f"{metric}_count{_format_labels(pairs)} {histogram.count}")
+
+    caches = cache_stats()
+    for field, kind, help_text in (
+        ('hits', 'counter', "Cache hits"),
+        ('misses', 'counter', "Cache misses"),
+        ('hit_ratio', 'gauge', "Cache hit ratio"),
+        ('size', 'gauge', "Cache entries"),
+    ):
+        metric = f"{PREFIX}_cache_{field}" + ('_total' if kind == 'counter' else '')
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for cache_name, stats in sorted(caches.items()):
+            lines.append(f"{metric}{_format_labels([('cache', cache_name)])} {stats[field]}")
+
+    metric = f"{PREFIX}_event_loop_lag_last_seconds"
+    lines.append(f"# HELP {metric} Most recent event loop lag sample")
+    lines.append(f"# TYPE {metric} gauge")
+    lines.append(f"{metric} {lag_monitor.last_lag}")
+
+    return '\n'.join(lines) + '\n'
+
+
+# -- HTTP endpoint ----------------------------------------------------------
+
+_http_runner = None
+
+
+async def start_http_server(host=None, port=None):
+    """Serve /metrics in the Prometheus text format (no-op if port is 0)"""
+    global _http_runner
+    from aiohttp import web
+
+    host = host or config.METRICS_HOST
+    port = config.METRICS_PORT if port is None else port
+    if not port or _http_runner is not None:
+        return
+
+    async def handle(request):
+        return web.Response(body=render_prometheus().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        await runner.cleanup()
+        print(f"Error starting metrics endpoint on {host}:{port}: {e}")
+        return
+
+    _http_runner = runner
+    print(f"✓ Metrics endpoint at http://{host}:{port}/metrics")
+
+
+async def stop_http_server():
+    """Stop the metrics endpoint"""
+    global _http_runner
+    if _http_runner is not None:
+        await _http_runner.cleanup()
+        _http_runner = None
@@ -1,136 +1,239 @@
 """Paper trading utility functions"""
 from datetime import datetime
-from utils.database import get_db
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from utils.database import get_db, supports_transactions
 
 STARTING_BALANCE = 100000.00
 
+_trade_listeners = []
+
+
+def add_trade_listener(callback):
+    """Register a callback run after every trade or account reset
+
+    The callback is called as callback(user_id, guild_id, action, account)
+    where action is "BUY", "SELL" or "RESET" and account is the account
+    document after the change (None after a reset).
+    """
+    _trade_listeners.append(callback)
+
+
+def _notify_trade(user_id, guild_id, action, account):
+    for callback in _trade_listeners:
+        try:
+            callback(str(user_id), str(guild_id), action, account)
+        except Exception as e:
+            print(f"Error in trade listener {callback.__name__}: {e}")
+
 
 async def get_user_account(user_id, guild_id):
-    """Get or create a user's paper trading account"""
+    """Get or create a user's paper trading account
+
+    Existing accounts are read without a write; the upsert only runs for
+    users who don't have one yet.
+    """
     db = get_db()
     if db is None:
         return None
 
-    account = await db.paper_accounts.find_one({
+    account_filter = {
         "user_id": str(user_id),
         "guild_id": str(guild_id)
-    })
+    }
+    account = await db.paper_accounts.find_one(account_filter)
+    if account is not None:
+        return account
 
-    if not account:
-        account = {
-            "user_id": str(user_id),
-            "guild_id": str(guild_id),
+    update = {
+        "$setOnInsert": {
             "cash": STARTING_BALANCE,
             "positions": [],
             "created_at": datetime.utcnow()
         }
-        await db.paper_accounts.insert_one(account)
+    }
 
-    return account
+    try:
+        return await db.paper_accounts.find_one_and_update(
+            account_filter, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another command created the account between our match and insert
+        return await db.paper_accounts.find_one(account_filter)
+
+
+def _buy_update(symbol, quantity, price):
+    """Pipeline update that debits cash and adds shares at a new average cost"""
+    total_cost = price * quantity
+    symbol_literal = {"$literal": symbol}
+    positions = {"$ifNull": ["$positions", []]}
+
+    return [{
+        "$set": {
+            "cash": {"$subtract": ["$cash", total_cost]},
+            "positions": {
+                "$cond": [
+                    {"$in": [symbol_literal, {"$ifNull": ["$positions.symbol", []]}]},
+                    {"$map": {
+                        "input": positions,
+                        "as": "p",
+                        "in": {"$cond": [
+                            {"$eq": ["$$p.symbol", symbol_literal]},
+                            {"$mergeObjects": ["$$p", {
+                                "quantity": {"$add": ["$$p.quantity", quantity]},
+                                "avg_cost": {"$divide": [
+                                    {"$add": [{"$multiply": ["$$p.quantity", "$$p.avg_cost"]}, total_cost]},
+                                    {"$add": ["$$p.quantity", quantity]}
+                                ]}
+                            }]},
+                            "$$p"
+                        ]}
+                    }},
+                    {"$concatArrays": [positions, [{
+                        "symbol": symbol_literal,
+                        "quantity": {"$literal": quantity},
+                        "avg_cost": {"$literal": price}
+                    }]]}
+                ]
+            }
+        }
+    }]
+
+
+def _sell_update(symbol, quantity, price):
+    """Pipeline update that credits cash and removes shares, dropping empty positions"""
+    symbol_literal = {"$literal": symbol}
+
+    return [{
+        "$set": {
+            "cash": {"$add": ["$cash", price * quantity]},
+            "positions": {"$filter": {
+                "input": {"$map": {
+                    "input": "$positions",
+                    "as": "p",
+                    "in": {"$cond": [
+                        {"$eq": ["$$p.symbol", symbol_literal]},
+                        {"$mergeObjects": ["$$p", {
+                            "quantity": {"$subtract": ["$$p.quantity", quantity]}
+                        }]},
+                        "$$p"
+                    ]}
+                }},
+                "as": "p",
+                "cond": {"$gt": ["$$p.quantity", 0]}
+            }}
+        }
+    }]
+
+
+async def _write_trade(db, fill):
+    """Run fill(session), in a transaction when the deployment supports them
+
+    On a standalone mongod the conditional update and the log insert run
+    as plain writes in one session.
+    """
+    async with await db.client.start_session() as session:
+        if supports_transactions():
+            return await session.with_transaction(fill)
+        return await fill(session)
 
 
 async def buy_stock(user_id, guild_id, symbol, quantity, price):
-    """Buy shares of a stock"""
+    """Buy shares of a stock
+
+    The funds check and position update happen in a single conditional
+    update, so concurrent orders can never overspend the account. The
+    update and its transaction log entry commit together in one
+    transaction where the deployment supports them.
+    """
     db = get_db()
     if db is None:
         return (False, "Database not connected")
 
-    account = await get_user_account(user_id, guild_id)
     total_cost = price * quantity
+    account_key = {"user_id": str(user_id), "guild_id": str(guild_id)}
+
+    async def fill(session):
+        account = await db.paper_accounts.find_one_and_update(
+            {**account_key, "cash": {"$gte": total_cost}},
+            _buy_update(symbol, quantity, price),
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if account is not None:
+            await record_transaction(user_id, guild_id, "BUY", symbol, quantity, price, session=session)
+        return account
 
-    if account['cash'] < total_cost:
-        return (False, f"Insufficient funds. Need ${total_cost:,.2f}, have ${account['cash']:,.2f}")
-
-    positions = account.get('positions', [])
-    existing_position = next((p for p in positions if p['symbol'] == symbol), None)
+    account = await _write_trade(db, fill)
 
-    if existing_position:
-        old_value = existing_position['quantity'] * existing_position['avg_cost']
-        new_value = old_value + total_cost
-        new_quantity = existing_position['quantity'] + quantity
-        new_avg_cost = new_value / new_quantity
+    if account is None:
+        # Either the account can't cover the order or it doesn't exist yet
+        # (get_user_account reads it, and only creates it when missing)
+        existing = await get_user_account(user_id, guild_id)
+        if existing['cash'] < total_cost:
+            return (False, f"Insufficient funds. Need ${total_cost:,.2f}, have ${existing['cash']:,.2f}")
 
-        await db.paper_accounts.update_one(
-            {
-                "user_id": str(user_id),
-                "guild_id": str(guild_id),
-                "positions.symbol": symbol
-            },
-            {
-                "$set": {
-                    "positions.$.quantity": new_quantity,
-                    "positions.$.avg_cost": new_avg_cost
-                },
-                "$inc": {"cash": -total_cost}
-            }
-        )
-    else:
-        new_position = {
-            "symbol": symbol,
-            "quantity": quantity,
-            "avg_cost": price
-        }
-        await db.paper_accounts.update_one(
-            {
-                "user_id": str(user_id),
-                "guild_id": str(guild_id)
-            },
-            {
-                "$push": {"positions": new_position},
-                "$inc": {"cash": -total_cost}
-            }
-        )
+        account = await _write_trade(db, fill)
+        if account is None:
+            return (False, "Order could not be filled, please try again")
 
-    await record_transaction(user_id, guild_id, "BUY", symbol, quantity, price)
+    _notify_trade(user_id, guild_id, "BUY", account)
 
     return (True, f"Bought {quantity} shares of {symbol} at ${price:,.2f}")
 
 
 async def sell_stock(user_id, guild_id, symbol, quantity, price):
-    """Sell shares of a stock"""
+    """Sell shares of a stock
+
+    The holdings check and position update happen in a single conditional
+    update, so concurrent orders can never sell the same shares twice. The
+    update and its transaction log entry commit together in one
+    transaction where the deployment supports them.
+    """
     db = get_db()
     if db is None:
         return (False, "Database not connected")
 
-    account = await get_user_account(user_id, guild_id)
-    positions = account.get('positions', [])
-    position = next((p for p in positions if p['symbol'] == symbol), None)
-
-    if not position:
-        return (False, f"You don't own any {symbol}")
-
-    if position['quantity'] < quantity:
-        return (False, f"You only own {position['quantity']} shares of {symbol}")
-
-    total_sale = price * quantity
-    new_quantity = position['quantity'] - quantity
-
-    if new_quantity == 0:
-        await db.paper_accounts.update_one(
-            {
-                "user_id": str(user_id),
-                "guild_id": str(guild_id)
-            },
-            {
-                "$pull": {"positions": {"symbol": symbol}},
-                "$inc": {"cash": total_sale}
-            }
-        )
-    else:
-        await db.paper_accounts.update_one(
+    async def fill(session):
+        account = await db.paper_accounts.find_one_and_update(
             {
                 "user_id": str(user_id),
                 "guild_id": str(guild_id),
-                "positions.symbol": symbol
+                "positions": {"$elemMatch": {"symbol": symbol, "quantity": {"$gte": quantity}}}
             },
-            {
-                "$set": {"positions.$.quantity": new_quantity},
-                "$inc": {"cash": total_sale}
-            }
+            _sell_update(symbol, quantity, price),
+            return_document=ReturnDocument.BEFORE,
+            session=session
         )
+        if account is not None:
+            await record_transaction(user_id, guild_id, "SELL", symbol, quantity, price, session=session)
+        return account
 
-    await record_transaction(user_id, guild_id, "SELL", symbol, quantity, price)
+    account = await _write_trade(db, fill)
+
+    if account is None:
+        existing = await db.paper_accounts.find_one({"user_id": str(user_id), "guild_id": str(guild_id)})
+        positions = existing.get('positions', []) if existing else []
+        position = next((p for p in positions if p['symbol'] == symbol), None)
+
+        if not position:
+            return (False, f"You don't own any {symbol}")
+
+        return (False, f"You only own {position['quantity']} shares of {symbol}")
+
+    position = next(p for p in account['positions'] if p['symbol'] == symbol)
+    total_sale = price * quantity
 
+    # Apply the same change the pipeline update made to the returned
+    # pre-sale document (it's needed for the sale's cost basis)
+    updated_account = dict(account)
+    updated_account['cash'] = account['cash'] + total_sale
+    updated_account['positions'] = [
+        dict(p, quantity=p['quantity'] - quantity) if p['symbol'] == symbol else p
+        for p in account['positions']
+        if p['symbol'] != symbol or p['quantity'] > quantity
+    ]
+    _notify_trade(user_id, guild_id, "SELL", updated_account)
     cost_basis = position['avg_cost'] * quantity
     profit_loss = total_sale - cost_basis
     profit_pct = (profit_loss / cost_basis) * 100
@@ -138,7 +241,7 @@ async def sell_stock(user_id, guild_id, symbol, quantity, price):
     return (True, f"Sold {quantity} shares of {symbol} at ${price:,.2f}\nProfit/Loss: ${profit_loss:,.2f} ({profit_pct:+.2f}%)")
 
 
-async def record_transaction(user_id, guild_id, action, symbol, quantity, price):
+async def record_transaction(user_id, guild_id, action, symbol, quantity, price, session=None):
     """Record a transaction in history"""
     db = get_db()
     if db is None:
@@ -155,21 +258,56 @@ async def record_transaction(user_id, guild_id, action, symbol, quantity, price)
         "timestamp": datetime.utcnow()
     }
 
-    await db.paper_transactions.insert_one(transaction)
+    await db.paper_transactions.insert_one(transaction, session=session)
+
+
+# Fields shown in transaction history views
+TRANSACTION_FIELDS = {"action": 1, "symbol": 1, "quantity": 1, "price": 1, "total": 1, "timestamp": 1}
 
 
 async def get_user_transactions(user_id, guild_id, limit=10):
     """Get recent transactions for a user"""
+    transactions, _ = await get_transactions_page(user_id, guild_id, page_size=limit)
+    return transactions
+
+
+async def get_transactions_page(user_id, guild_id, page_size=10, before=None):
+    """Get one page of a user's transactions, newest first
+
+    Pages are addressed by range rather than skip: before is the
+    (timestamp, _id) cursor returned with the previous page. Returns
+    (transactions, next_cursor), where next_cursor is None on the last page.
+    """
     db = get_db()
     if db is None:
-        return []
+        return [], None
 
-    cursor = db.paper_transactions.find({
+    query = {
         "user_id": str(user_id),
         "guild_id": str(guild_id)
-    }).sort("timestamp", -1).limit(limit)
+    }
+
+    if before is not None:
+        timestamp, last_id = before
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": last_id}}
+        ]
+
+    # One extra row tells us whether another page exists
+    cursor = db.paper_transactions.find(query, TRANSACTION_FIELDS) \
+        .sort([("timestamp", -1), ("_id", -1)]) \
+        .limit(page_size + 1) \
+        .batch_size(page_size + 1)
+
+    transactions = [transaction async for transaction in cursor]
+
+    if len(transactions) <= page_size:
+        return transactions, None
 
-    return await cursor.to_list(length=limit)
+    transactions = transactions[:page_size]
+    last = transactions[-1]
+    return transactions, (last['timestamp'], last['_id'])
 
 
 async def reset_account(user_id, guild_id):
@@ -183,10 +321,21 @@ async def reset_account(user_id, guild_id):
         "guild_id": str(guild_id)
     })
 
-    await db.paper_transactions.delete_many({
+    user_filter = {
         "user_id": str(user_id),
         "guild_id": str(guild_id)
-    })
+    }
+
+    # Recent rows plus every compacted tier (see utils/compaction.py)
+    await db.paper_transactions.delete_many(user_filter)
+    await db.paper_transaction_summaries.delete_many(user_filter)
+    await db.paper_transaction_carry.delete_one(user_filter)
+    await db.paper_transactions_archive.delete_many(user_filter)
+
+    await db.portfolio_latest.delete_one(user_filter)
+    await db.portfolio_snapshots.delete_many(user_filter)
+
+    _notify_trade(user_id, guild_id, "RESET", None)
 
     return True
 
@@ -207,9 +356,50 @@ async def get_user_transaction_count(user_id, guild_id):
     if db is None:
         return 0
 
-    count = await db.paper_transactions.count_documents({
-        "user_id": str(user_id),
-        "guild_id": str(guild_id)
-    })
+    counts = await get_transaction_counts(guild_id, user_ids=[user_id])
+    return counts.get(str(user_id), 0)
+
+
+async def get_transaction_counts(guild_id, user_ids=None):
+    """Get the number of transactions for every user in a guild
+
+    Returns a dict of user_id -> count, adding compacted monthly summaries
+    to the recent transactions. Users with no transactions are not included.
+    """
+    db = get_db()
+    if db is None:
+        return {}
+
+    match = {"guild_id": str(guild_id)}
+    if user_ids is not None:
+        match["user_id"] = {"$in": [str(user_id) for user_id in user_ids]}
+
+    recent = db.paper_transactions.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+    ])
+    compacted = db.paper_transaction_summaries.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$user_id", "count": {"$sum": "$count"}}}
+    ])
+
+    counts = {doc["_id"]: doc["count"] async for doc in compacted}
+    async for doc in recent:
+        counts[doc["_id"]] = counts.get(doc["_id"], 0) + doc["count"]
+
+    return counts
 
-    return count
+
+async def save_display_names(guild_id, names):
+    """Persist the last known display name on each user's account"""
+    db = get_db()
+    if db is None or not names:
+        return
+
+    await db.paper_accounts.bulk_write([
+        UpdateOne(
+            {"user_id": str(user_id), "guild_id": str(guild_id)},
+            {"$set": {"display_name": name}}
+        )
+        for user_id, name in names.items()
+    ], ordered=False)
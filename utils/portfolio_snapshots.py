@@ -0,0 +1,236 @@
+"""Materialized portfolio valuation snapshots
+
+Each snapshot records an account's cash, holdings value, P/L and a
+per-position breakdown at a point in time. Only the latest snapshot per
+account is kept (upserted into portfolio_latest); commands serve it
+immediately and refresh it in the background once it is stale.
+
+Portfolio history is a separate, coarse series in portfolio_snapshots:
+the periodic snapshot job appends one slim point (values only, no
+positions) per account, and a TTL index expires points older than
+config.PORTFOLIO_HISTORY_RETENTION_DAYS.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne
+
+from utils import stock_api
+from utils.constants import CacheSettings
+from utils.database import get_db
+from utils.paper_trading import STARTING_BALANCE
+
+# Fields kept for each point of the history series
+HISTORY_FIELDS = ('user_id', 'guild_id', 'timestamp', 'total_value', 'profit_loss', 'profit_pct')
+
+_refreshing = set()
+_background_tasks = set()
+
+
+def _build_snapshot(account, quotes, timestamp):
+    """Value an account's positions with the given quotes
+
+    Positions without a quote are valued at cost, like the leaderboard
+    does, and the snapshot is flagged partial.
+    """
+    positions = []
+    holdings_value = 0
+    cost_basis_total = 0
+    partial = False
+
+    for position in account.get('positions', []):
+        stock_info = quotes.get(position['symbol'])
+        cost_basis = position['avg_cost'] * position['quantity']
+        entry = {
+            'symbol': position['symbol'],
+            'quantity': position['quantity'],
+            'avg_cost': position['avg_cost'],
+            'price': None,
+            'value': None,
+            'cost_basis': cost_basis,
+            'profit_loss': None,
+            'profit_pct': None
+        }
+
+        if stock_info:
+            value = stock_info['price'] * position['quantity']
+            profit_loss = value - cost_basis
+            entry.update({
+                'price': stock_info['price'],
+                'value': value,
+                'profit_loss': profit_loss,
+                'profit_pct': (profit_loss / cost_basis) * 100 if cost_basis else 0
+            })
+            holdings_value += value
+        else:
+            holdings_value += cost_basis
+            partial = True
+
+        cost_basis_total += cost_basis
+        positions.append(entry)
+
+    total_value = account['cash'] + holdings_value
+    profit_loss = total_value - STARTING_BALANCE
+
+    return {
+        'user_id': account['user_id'],
+        'guild_id': account['guild_id'],
+        'cash': account['cash'],
+        'holdings_value': holdings_value,
+        'cost_basis': cost_basis_total,
+        'total_value': total_value,
+        'profit_loss': profit_loss,
+        'profit_pct': (profit_loss / STARTING_BALANCE) * 100,
+        'positions': positions,
+        'partial': partial,
+        'timestamp': timestamp
+    }
+
+
+async def compute_snapshots(accounts):
+    """Value several accounts with one batched quote lookup"""
+    symbols = {p['symbol'] for account in accounts for p in account.get('positions', [])}
+    quotes = await stock_api.get_stock_infos(sorted(symbols)) if symbols else {}
+    timestamp = datetime.utcnow()
+
+    return [_build_snapshot(account, quotes, timestamp) for account in accounts]
+
+
+async def save_snapshots(snapshots):
+    """Store snapshots as their accounts' latest, replacing the previous ones"""
+    db = get_db()
+    if db is None or not snapshots:
+        return
+
+    await db.portfolio_latest.bulk_write([
+        ReplaceOne({"user_id": snapshot['user_id'], "guild_id": snapshot['guild_id']}, snapshot, upsert=True)
+        for snapshot in snapshots
+    ], ordered=False)
+
+
+async def record_history(snapshots):
+    """Append one history point per snapshot to the portfolio_snapshots series
+
+    Partial snapshots are skipped, so a failed quote never records a fake
+    move in the series.
+    """
+    db = get_db()
+    points = [
+        {field: snapshot[field] for field in HISTORY_FIELDS}
+        for snapshot in snapshots if not snapshot['partial']
+    ]
+    if db is None or not points:
+        return
+
+    await db.portfolio_snapshots.insert_many(points)
+
+
+async def get_latest_snapshot(user_id, guild_id):
+    """Get an account's most recent snapshot"""
+    db = get_db()
+    if db is None:
+        return None
+
+    return await db.portfolio_latest.find_one({"user_id": str(user_id), "guild_id": str(guild_id)})
+
+
+async def get_snapshot_history(user_id, guild_id, since=None):
+    """Get an account's snapshots oldest first, for performance-over-time views"""
+    db = get_db()
+    if db is None:
+        return []
+
+    query = {"user_id": str(user_id), "guild_id": str(guild_id)}
+    if since is not None:
+        query["timestamp"] = {"$gte": since}
+
+    cursor = db.portfolio_snapshots.find(
+        query,
+        {"_id": 0, "timestamp": 1, "total_value": 1, "profit_loss": 1, "profit_pct": 1}
+    ).sort("timestamp", 1)
+
+    return await cursor.to_list(length=None)
+
+
+def _matches_account(snapshot, account):
+    """Check that a snapshot was taken of the account's current holdings"""
+    if snapshot['cash'] != account['cash']:
+        return False
+
+    held = {(p['symbol'], p['quantity']) for p in account.get('positions', [])}
+    snapshotted = {(p['symbol'], p['quantity']) for p in snapshot['positions']}
+    return held == snapshotted
+
+
+async def get_portfolio_snapshot(account):
+    """Get a snapshot of an account, serving a stored one when possible
+
+    A stored snapshot of the current holdings is returned immediately; if
+    it is older than the snapshot max age or partial, a fresh one is
+    computed in the background. After a trade, the holdings differ and a
+    new snapshot is computed before returning.
+    """
+    latest = await get_latest_snapshot(account['user_id'], account['guild_id'])
+
+    if latest is not None and _matches_account(latest, account):
+        max_age = timedelta(seconds=CacheSettings.SNAPSHOT_MAX_AGE)
+        if latest.get('partial') or datetime.utcnow() - latest['timestamp'] >= max_age:
+            _refresh_in_background(account)
+        return latest
+
+    snapshots = await compute_snapshots([account])
+    await save_snapshots(snapshots)
+    return snapshots[0]
+
+
+def _refresh_in_background(account):
+    key = (account['user_id'], account['guild_id'])
+    if key in _refreshing:
+        return
+
+    _refreshing.add(key)
+    task = asyncio.create_task(_refresh(key, account))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _refresh(key, account):
+    try:
+        await save_snapshots(await compute_snapshots([account]))
+    except Exception as e:
+        print(f"Error refreshing portfolio snapshot for {key[0]}: {e}")
+    finally:
+        _refreshing.discard(key)
+
+
+async def snapshot_all_accounts(batch_size=500):
+    """Snapshot every paper trading account, batching quote lookups
+
+    Refreshes each account's latest snapshot and appends a history point
+    for every account whose positions could all be priced.
+    Returns the number of accounts snapshotted.
+    """
+    db = get_db()
+    if db is None:
+        return 0
+
+    async def store(batch):
+        snapshots = await compute_snapshots(batch)
+        await save_snapshots(snapshots)
+        await record_history(snapshots)
+
+    count = 0
+    batch = []
+
+    async for account in db.paper_accounts.find({}, {"_id": 0}):
+        batch.append(account)
+        if len(batch) >= batch_size:
+            await store(batch)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        await store(batch)
+        count += len(batch)
+
+    return count
@@ -0,0 +1,31 @@
+"""Rate limiting utilities"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Async token bucket allowing bursts up to capacity at a steady refill rate"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens=1):
+        """Wait until tokens are available and take them"""
+        tokens = min(tokens, self.capacity)
+
+        # The lock keeps waiters first-come first-served
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
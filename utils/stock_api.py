@@ -1,51 +1,323 @@
-"""Stock API utilities using yfinance"""
-import yfinance as yf
+"""Stock API utilities (quotes, metadata and the shared upstream executor)"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from utils import market_data, market_hours, metrics, symbol_index, symbol_metadata
+from utils.cache import TTLCache
+from utils.constants import CacheSettings, Timeouts
+
+_executor = None
+
+_quote_cache = TTLCache(
+    max_size=CacheSettings.QUOTE_CACHE_MAX_SIZE,
+    default_ttl=CacheSettings.QUOTE_TTL_MARKET_OPEN
+)
+metrics.register_cache('quotes', _quote_cache)
+
+
+def get_executor():
+    """Get the shared thread pool used for blocking upstream calls"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=config.STOCK_FETCH_WORKERS,
+            thread_name_prefix='stock-fetch'
+        )
+    return _executor
+
+
+def shutdown_executor():
+    """Shut down the shared thread pool (called by bot.py on exit)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_blocking(func, *args, timeout=Timeouts.STOCK_FETCH_TIMEOUT):
+    """Run a blocking function on the shared executor with a timeout
+
+    Raises asyncio.TimeoutError if the call does not finish in time. If the
+    awaiting task is cancelled, the pending executor job is cancelled too so
+    it does not hold a worker slot.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_executor(), func, *args)
+    try:
+        return await asyncio.wait_for(future, timeout=timeout)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+
+
+def _build_quote(symbol, raw):
+    """Build a price quote from a provider's raw quote
+
+    Names and currency come from the in-memory metadata store when it has
+    the symbol; market cap needs shares outstanding and is filled in by
+    get_stock_info.
+    """
+    if raw is None:
+        return None
+
+    current_price = raw['price']
+    previous_close = raw.get('previous_close') or current_price
+    change = current_price - previous_close
+    change_percent = (change / previous_close * 100) if previous_close else 0
+
+    metadata = symbol_metadata.get_cached(symbol) or {
+        'long_name': raw.get('long_name'),
+        'short_name': raw.get('short_name'),
+        'currency': raw.get('currency')
+    }
+
+    return {
+        'symbol': symbol,
+        'name': symbol_metadata.display_name(symbol, metadata),
+        'price': round(current_price, 2),
+        'currency': metadata.get('currency') or 'USD',
+        'change': round(change, 2),
+        'change_percent': round(change_percent, 2),
+        'market_cap': None,
+        'volume': raw.get('volume')
+    }
+
+
+def _fetch_stock_price(symbol):
+    """Blocking fetch of a price quote with one light provider request"""
+    return _build_quote(symbol, market_data.get_provider().get_quote(symbol))
+
+
+def _fetch_metadata(symbol):
+    """Blocking fetch of a symbol's descriptive fields
+
+    This is the heavy request, so it only runs when the metadata store has
+    no record for a symbol or its record has expired.
+    """
+    info = market_data.get_provider().get_info(symbol)
+    # yfinance returns a non-empty info dict for unknown tickers too
+    if not info or not (info.get('longName') or info.get('shortName')):
+        return None
+
+    return symbol_metadata.extract_metadata(symbol, info)
+
+
+def quote_ttl(now=None):
+    """Get how long a quote stays fresh
+
+    Quotes are short-lived during regular trading hours. After the close
+    the price cannot change, so quotes are kept until the next open.
+    """
+    if market_hours.is_market_open(now):
+        return CacheSettings.QUOTE_TTL_MARKET_OPEN
+
+    return max(market_hours.seconds_until_next_open(now), CacheSettings.QUOTE_TTL_MIN_CLOSED)
+
+
+def get_cache_stats():
+    """Get quote cache hit/miss counters"""
+    return _quote_cache.stats()
+
+
+def _fetch_stock_infos_batch(symbols):
+    """Blocking fetch of quotes for several symbols in one provider request
+
+    Returns a dict of symbol -> price quote (None if unavailable).
+    """
+    raw_quotes = market_data.get_provider().get_quotes(symbols)
+    return {symbol: _build_quote(symbol, raw_quotes.get(symbol)) for symbol in symbols}
+
+
+async def get_stock_price(symbol):
+    """Get a price quote for one symbol
+
+    Price-only callers (trading, valuations) use this: it costs at most one
+    light upstream request. The quote has the same shape as get_stock_info
+    but without market cap.
+    """
+    symbol = symbol.upper()
+    if symbol_index.is_known_invalid(symbol):
+        return None
+
+    return await _quote_cache.get_or_fetch(
+        ('quote', symbol),
+        lambda: _fetch_stock_price_async(symbol),
+        ttl=lambda _: quote_ttl()
+    )
 
 
 async def get_stock_info(symbol):
-    """Get stock information and price data"""
+    """Get stock information and price data
+
+    Combines a price quote with the descriptive fields from the metadata
+    store. The quote is fetched first so unknown symbols cost one light
+    request; metadata the store doesn't have yet is refreshed in the
+    background and shows up on a later call.
+    """
+    symbol = symbol.upper()
+    if symbol_index.is_known_invalid(symbol):
+        return None
+
+    quote = await get_stock_price(symbol)
+    if quote is None:
+        return None
+
+    metadata = (await symbol_metadata.get_metadata_many([symbol])).get(symbol)
+
+    info = dict(quote)
+    if metadata:
+        info['name'] = symbol_metadata.display_name(symbol, metadata)
+        info['currency'] = metadata.get('currency') or quote['currency']
+        if metadata.get('shares_outstanding'):
+            info['market_cap'] = metadata['shares_outstanding'] * quote['price']
+
+    return info
+
+
+def get_cached_prices(symbols):
+    """Get prices for symbols from the quote cache without any network calls
+
+    Returns a dict of symbol -> price for the symbols with a fresh quote.
+    """
+    prices = {}
+    for symbol in symbols:
+        symbol = symbol.upper()
+        info = _quote_cache.peek(('quote', symbol))
+        if info is not None:
+            prices[symbol] = info['price']
+    return prices
+
+
+async def get_stock_infos(symbols):
+    """Get price data for several stocks using batched upstream requests
+
+    Returns a dict of symbol -> stock info (None if unavailable), with the
+    same shape as get_stock_info. Symbols are fetched in chunks of
+    config.QUOTE_BATCH_SIZE, so a full watchlist costs one or a few requests.
+    """
+    symbols = [symbol.upper() for symbol in symbols]
+    results = {}
+    to_fetch = []
+
+    for symbol in dict.fromkeys(symbols):
+        if symbol_index.is_known_invalid(symbol):
+            results[symbol] = None
+            continue
+
+        to_fetch.append(('quote', symbol))
+
+    if to_fetch:
+        fetched = await _quote_cache.get_many_or_fetch(
+            to_fetch,
+            _fetch_stock_infos_async,
+            ttl=lambda _: quote_ttl()
+        )
+        results.update((key[1], info) for key, info in fetched.items())
+
+    return results
+
+
+async def refresh_stock_infos(symbols):
+    """Fetch fresh batched quotes for symbols and store them in the cache
+
+    Used by the background poller, so it always goes upstream even if the
+    cached quotes are still fresh.
+    """
+    keys = [('quote', symbol.upper()) for symbol in symbols]
+    fetched = await _fetch_stock_infos_async(keys)
+
+    ttl = quote_ttl()
+    for key, info in fetched.items():
+        if info is not None:
+            _quote_cache.set(key, info, ttl)
+
+    return {key[1]: info for key, info in fetched.items()}
+
+
+async def _fetch_stock_price_async(symbol):
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
-
-        if not info or 'regularMarketPrice' not in info:
-            hist = ticker.history(period="1d")
-            if hist.empty:
-                return None
-
-            current_price = hist['Close'].iloc[-1]
-            return {
-                'symbol': symbol.upper(),
-                'name': info.get('longName', symbol.upper()),
-                'price': round(current_price, 2),
-                'currency': info.get('currency', 'USD'),
-                'change': 0,
-                'change_percent': 0
-            }
-
-        current_price = info.get('regularMarketPrice', 0)
-        previous_close = info.get('previousClose', current_price)
-        change = current_price - previous_close
-        change_percent = (change / previous_close * 100) if previous_close else 0
-
-        return {
-            'symbol': symbol.upper(),
-            'name': info.get('longName', info.get('shortName', symbol.upper())),
-            'price': round(current_price, 2),
-            'currency': info.get('currency', 'USD'),
-            'change': round(change, 2),
-            'change_percent': round(change_percent, 2),
-            'market_cap': info.get('marketCap'),
-            'volume': info.get('volume')
-        }
+        quote = await run_blocking(_fetch_stock_price, symbol)
+
+    except asyncio.TimeoutError:
+        print(f"Timed out fetching stock price for {symbol}")
+        return None
 
     except Exception as e:
-        print(f"Error fetching stock info for {symbol}: {e}")
+        print(f"Error fetching stock price for {symbol}: {e}")
         return None
 
+    if quote is None:
+        # No data: either the symbol doesn't exist or upstream failed
+        # quietly, so the index only demotes known-valid symbols after
+        # repeated empty answers
+        symbol_index.mark_invalid(symbol)
+        return None
+
+    symbol_index.mark_valid([symbol])
+    return quote
+
+
+async def refresh_metadata(symbols):
+    """Fetch descriptive fields for symbols and record them in the metadata store"""
+    async def fetch(symbol):
+        try:
+            return await run_blocking(_fetch_metadata, symbol)
+
+        except asyncio.TimeoutError:
+            print(f"Timed out fetching metadata for {symbol}")
+
+        except Exception as e:
+            print(f"Error fetching metadata for {symbol}: {e}")
+
+    records = await asyncio.gather(*(fetch(symbol) for symbol in symbols))
+
+    try:
+        await symbol_metadata.remember(records)
+    except Exception as e:
+        print(f"Error storing metadata for {', '.join(symbols)}: {e}")
+
+    return {record['symbol']: record for record in records if record}
+
+
+async def _fetch_stock_infos_async(keys):
+    symbols = [key[1] for key in keys]
+    batch_size = config.QUOTE_BATCH_SIZE
+    chunks = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+
+    async def fetch_chunk(chunk):
+        try:
+            return await run_blocking(_fetch_stock_infos_batch, chunk)
+
+        except asyncio.TimeoutError:
+            print(f"Timed out fetching stock info for {', '.join(chunk)}")
+            return {}
+
+        except Exception as e:
+            print(f"Error fetching stock info for {', '.join(chunk)}: {e}")
+            return {}
+
+    results = {}
+    for chunk_results in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        results.update(chunk_results)
+
+    symbol_index.mark_valid(symbol for symbol, info in results.items() if info is not None)
+
+    return {('quote', symbol): results.get(symbol) for symbol in symbols}
+
 
 async def validate_symbol(symbol):
-    """Check if a stock symbol is valid"""
+    """Check if a stock symbol is valid
+
+    Answers from the symbol index when possible, so known-good and
+    known-bad tickers never go upstream.
+    """
+    if symbol_index.is_known_valid(symbol):
+        return True
+
+    if symbol_index.is_known_invalid(symbol):
+        return False
+
     info = await get_stock_info(symbol)
     return info is not None
 
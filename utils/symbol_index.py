@@ -0,0 +1,88 @@
+"""Symbol validity index
+
+Keeps a set of tickers known to be valid (seeded from every symbol the bot
+has stored) and a TTL'd negative cache of tickers known to be invalid, so
+typos like APPL are rejected without going upstream.
+
+An empty upstream answer can also mean a transient failure (yfinance hides
+network and rate-limit errors as empty frames), so a known-valid symbol is
+only demoted after several empty answers in a row.
+"""
+import re
+
+from utils.cache import TTLCache
+from utils.constants import CacheSettings
+from utils.database import get_db
+
+# Tickers like AAPL, BRK-B, 0700.HK, ^GSPC and EURUSD=X
+_SYMBOL_PATTERN = re.compile(r'^[A-Z0-9^][A-Z0-9.\-^=]{0,14}$')
+
+_valid = set()
+# Bounded, since it is keyed by whatever users type
+_invalid = TTLCache(
+    max_size=CacheSettings.INVALID_SYMBOL_CACHE_MAX_SIZE,
+    default_ttl=CacheSettings.INVALID_SYMBOL_TTL
+)
+# Consecutive empty answers for known-valid symbols
+_strikes = {}
+
+
+def is_well_formed(symbol):
+    """Check if a symbol looks like a ticker (safe to use in file names)"""
+    return bool(_SYMBOL_PATTERN.match(symbol.upper()))
+
+
+def is_known_valid(symbol):
+    """Check if a symbol is known to be valid"""
+    return symbol.upper() in _valid
+
+
+def is_known_invalid(symbol):
+    """Check if a symbol was recently found to be invalid"""
+    return symbol.upper() in _invalid
+
+
+def mark_valid(symbols):
+    """Record symbols that returned data"""
+    for symbol in symbols:
+        symbol = symbol.upper()
+        _valid.add(symbol)
+        _invalid.invalidate(symbol)
+        _strikes.pop(symbol, None)
+
+
+def mark_invalid(symbol):
+    """Record a symbol that upstream returned no data for
+
+    Unknown symbols are negative-cached right away. Known-valid ones are
+    only demoted after CacheSettings.INVALID_SYMBOL_STRIKES empty answers
+    in a row, and then only briefly, so a flaky upstream can't block a
+    ticker users hold for hours.
+    """
+    symbol = symbol.upper()
+    ttl = CacheSettings.INVALID_SYMBOL_TTL
+
+    if symbol in _valid:
+        _strikes[symbol] = _strikes.get(symbol, 0) + 1
+        if _strikes[symbol] < CacheSettings.INVALID_SYMBOL_STRIKES:
+            return
+        _valid.discard(symbol)
+        del _strikes[symbol]
+        ttl = CacheSettings.DEMOTED_SYMBOL_TTL
+
+    _invalid.set(symbol, True, ttl)
+
+
+async def seed_from_db():
+    """Mark every symbol ever stored by the bot as valid"""
+    db = get_db()
+    if db is None:
+        return 0
+
+    watched = await db.watchlists.distinct("stocks.symbol")
+    held = await db.paper_accounts.distinct("positions.symbol")
+    traded = await db.paper_transactions.distinct("symbol")
+
+    symbols = set(watched) | set(held) | set(traded)
+    mark_valid(symbols)
+    return len(symbols)
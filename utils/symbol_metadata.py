@@ -0,0 +1,130 @@
+"""Symbol metadata store (company names, currency, exchange)
+
+Descriptive fields rarely change, so they are fetched separately from
+prices (with the heavy full quote summary) and kept in memory and in the
+symbol_metadata collection. Lookups never go to the network: symbols with
+missing or old metadata are refreshed in the background and resolved on a
+later call, unless the caller chooses to wait for them with get_metadata.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from utils.constants import CacheSettings
+from utils.database import get_db
+
+_metadata = {}
+# Symbol -> background refresh task
+_refreshing = {}
+_background_tasks = set()
+
+
+def extract_metadata(symbol, info):
+    """Build a metadata record from a yfinance info dict"""
+    return {
+        'symbol': symbol.upper(),
+        'long_name': info.get('longName'),
+        'short_name': info.get('shortName'),
+        'currency': info.get('currency'),
+        'exchange': info.get('exchange'),
+        'shares_outstanding': info.get('sharesOutstanding'),
+        'updated_at': datetime.utcnow()
+    }
+
+
+def display_name(symbol, metadata=None):
+    """Get the best display name for a symbol"""
+    metadata = metadata if metadata is not None else _metadata.get(symbol)
+    if not metadata:
+        return symbol
+    return metadata.get('long_name') or metadata.get('short_name') or symbol
+
+
+def get_cached(symbol):
+    """Get in-memory metadata for a symbol without any I/O"""
+    return _metadata.get(symbol.upper())
+
+
+async def remember(records):
+    """Store freshly fetched metadata records"""
+    records = [record for record in records if record]
+    if not records:
+        return
+
+    _metadata.update((record['symbol'], record) for record in records)
+
+    db = get_db()
+    if db is not None:
+        await db.symbol_metadata.bulk_write([
+            UpdateOne({"symbol": record['symbol']}, {"$set": record}, upsert=True)
+            for record in records
+        ], ordered=False)
+
+
+async def get_metadata_many(symbols):
+    """Get metadata for several symbols from memory and the database
+
+    Returns a dict of symbol -> metadata for the symbols that are known.
+    Missing or stale symbols are queued for a background refresh.
+    """
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    results = {symbol: _metadata[symbol] for symbol in symbols if symbol in _metadata}
+
+    missing = [symbol for symbol in symbols if symbol not in results]
+    db = get_db()
+    if missing and db is not None:
+        cursor = db.symbol_metadata.find({"symbol": {"$in": missing}}, {"_id": 0})
+        async for record in cursor:
+            _metadata[record['symbol']] = record
+            results[record['symbol']] = record
+
+    cutoff = datetime.utcnow() - timedelta(seconds=CacheSettings.METADATA_TTL)
+    # Records from before shares outstanding was stored are refreshed too
+    stale = [symbol for symbol in symbols
+             if symbol not in results or results[symbol]['updated_at'] < cutoff
+             or 'shares_outstanding' not in results[symbol]]
+    if stale:
+        _refresh_in_background(stale)
+
+    return results
+
+
+async def get_display_names(symbols):
+    """Get display names for several symbols without any network calls"""
+    metadata = await get_metadata_many(symbols)
+    return {symbol.upper(): display_name(symbol.upper(), metadata.get(symbol.upper()))
+            for symbol in symbols}
+
+
+async def get_metadata(symbol):
+    """Get metadata for one symbol, waiting for a fetch if it has never been seen"""
+    symbol = symbol.upper()
+    metadata = (await get_metadata_many([symbol])).get(symbol)
+
+    if metadata is None and symbol in _refreshing:
+        await asyncio.shield(_refreshing[symbol])
+        metadata = _metadata.get(symbol)
+
+    return metadata
+
+
+def _refresh_in_background(symbols):
+    symbols = [symbol for symbol in symbols if symbol not in _refreshing]
+    if not symbols:
+        return
+
+    task = asyncio.create_task(_refresh(symbols))
+    _refreshing.update((symbol, task) for symbol in symbols)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _refresh(symbols):
+    from utils import stock_api
+
+    try:
+        await stock_api.refresh_metadata(symbols)
+    finally:
+        for symbol in symbols:
+            _refreshing.pop(symbol, None)
@@ -0,0 +1,99 @@
+"""Discord display name resolution for leaderboard rendering
+
+Names are resolved from the cheapest source first: the guild member cache,
+a local id -> name cache, the name last stored on the account, and finally
+one batched gateway member query for whatever is left.
+"""
+import asyncio
+
+import discord
+
+from utils import metrics, paper_trading
+from utils.cache import TTLCache
+from utils.constants import CacheSettings
+
+# Discord limits a member query to 100 user ids
+_QUERY_CHUNK_SIZE = 100
+
+_names = TTLCache(max_size=CacheSettings.USER_NAME_CACHE_MAX_SIZE,
+                  default_ttl=CacheSettings.USER_NAME_TTL)
+metrics.register_cache('user_names', _names)
+
+
+async def _query_members(guild, user_ids):
+    """Look up guild members by id in as few gateway requests as possible"""
+    chunks = [user_ids[i:i + _QUERY_CHUNK_SIZE] for i in range(0, len(user_ids), _QUERY_CHUNK_SIZE)]
+    results = await asyncio.gather(
+        *(guild.query_members(user_ids=[int(user_id) for user_id in chunk], limit=len(chunk))
+          for chunk in chunks),
+        return_exceptions=True
+    )
+
+    names = {}
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Error querying members in guild {guild.id}: {result}")
+            continue
+        names.update((str(member.id), member.display_name) for member in result)
+    return names
+
+
+async def _fetch_users(bot, user_ids):
+    """Fetch users that are no longer in the guild, concurrently"""
+    async def fetch(user_id):
+        try:
+            return (await bot.fetch_user(int(user_id))).name
+        except discord.HTTPException:
+            return None
+
+    fetched = await asyncio.gather(*(fetch(user_id) for user_id in user_ids))
+    return {user_id: name for user_id, name in zip(user_ids, fetched) if name}
+
+
+async def resolve_display_names(bot, guild, user_ids, stored_names=None):
+    """Get display names for several users in a guild
+
+    stored_names maps user_id -> the name last persisted on the account.
+    Names found in the member cache or looked up upstream are persisted
+    back to the accounts so later renders don't need to look them up.
+    Returns a dict of user_id -> display name.
+    """
+    stored_names = stored_names or {}
+    names = {}
+    fresh = {}
+    missing = []
+
+    for user_id in map(str, user_ids):
+        member = guild.get_member(int(user_id))
+        if member is not None:
+            names[user_id] = fresh[user_id] = member.display_name
+            continue
+
+        cached = _names.get(user_id)
+        if cached is not None:
+            names[user_id] = cached
+        elif stored_names.get(user_id):
+            names[user_id] = stored_names[user_id]
+        else:
+            missing.append(user_id)
+
+    if missing:
+        queried = await _query_members(guild, missing)
+        still_missing = [user_id for user_id in missing if user_id not in queried]
+        if still_missing:
+            queried.update(await _fetch_users(bot, still_missing))
+
+        names.update(queried)
+        fresh.update(queried)
+
+    for user_id, name in fresh.items():
+        _names.set(user_id, name)
+
+    changed = {user_id: name for user_id, name in fresh.items() if stored_names.get(user_id) != name}
+    if changed:
+        try:
+            await paper_trading.save_display_names(guild.id, changed)
+        except Exception as e:
+            print(f"Error saving display names in guild {guild.id}: {e}")
+
+    return {user_id: names.get(user_id, "Unknown User") for user_id in map(str, user_ids)}